@@ -0,0 +1,206 @@
+"""
+Command line entry point for the pipeline stages.
+
+    python -m code1 process [options]
+    python -m code1 analyze [options]
+    python -m code1 precision [options]
+    python -m code1 plot [options]
+    python -m code1 batch [options]
+    python -m code1 serve [options]
+    python -m code1 generate FILE_PATH NUM_RECORDS [options]
+    python -m code1 benchmark [options]
+
+A stage's module, and the libraries it needs, are only imported when its subcommand runs, so that `--help` and the other subcommands start quickly.
+Options that aren't given fall back to the defaults in the stage's module.
+Each stage can also be called from other code, e.g., `processData` from "processData.py", since importing a stage's module has no side effects.
+"""
+
+import argparse
+from pathlib import Path
+from typing import List, Union
+
+
+def stageArguments(arguments: argparse.Namespace) -> dict:
+    """
+    Returns the options that were given on the command line, as keyword arguments for the stage's `main` function.
+    """
+    result = {key: value for key, value in vars(arguments).items() if key not in ["command", "function"] and value is not None}
+    return result
+
+
+def runProcess(arguments: argparse.Namespace) -> None:
+    """
+    Runs "processData.py".
+    """
+    from code1.processData import main
+    main(**stageArguments(arguments))
+
+
+def runAnalyze(arguments: argparse.Namespace) -> None:
+    """
+    Runs "analyzeData.py".
+    """
+    from code1.analyzeData import main
+    main(**stageArguments(arguments))
+
+
+def runPrecision(arguments: argparse.Namespace) -> None:
+    """
+    Runs "getMeterPrecision.py".
+    """
+    import pandas as pd
+    from code1.getMeterPrecision import main
+    kwargs = stageArguments(arguments)
+    if "sessionGapMinutes" in kwargs:
+        kwargs["sessionGap"] = pd.Timedelta(minutes=kwargs.pop("sessionGapMinutes"))
+    main(**kwargs)
+
+
+def runPlot(arguments: argparse.Namespace) -> None:
+    """
+    Runs "plotData.py".
+    """
+    from code1.plotData import main
+    main(**stageArguments(arguments))
+
+
+def runBatch(arguments: argparse.Namespace) -> None:
+    """
+    Runs "batchProcess.py".
+    """
+    from code1.batchProcess import main
+    main(**stageArguments(arguments))
+
+
+def runServe(arguments: argparse.Namespace) -> None:
+    """
+    Runs "queryService.py".
+    """
+    from code1.queryService import main
+    main(**stageArguments(arguments))
+
+
+def runGenerate(arguments: argparse.Namespace) -> None:
+    """
+    Writes a synthetic export with "syntheticExport.py".
+    """
+    from code1.syntheticExport import writeSyntheticExport
+    result = writeSyntheticExport(**stageArguments(arguments))
+    print(f"""Wrote {result["lines"]:,} lines, with {result["bloodPressureReadings"]:,} blood pressure readings, to "{arguments.filePath}".""")
+
+
+def runBenchmark(arguments: argparse.Namespace) -> None:
+    """
+    Runs "benchmarkStages.py".
+    """
+    import logging
+    from code1.benchmarkStages import runBenchmarks
+    kwargs = stageArguments(arguments)
+    logging.basicConfig(format="[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s", level=kwargs.pop("logLevel", "INFO"))
+    runBenchmarks(**kwargs)
+
+
+def buildParser() -> argparse.ArgumentParser:
+    """
+    Builds the command line parser, with one subcommand per stage.
+    """
+    parser = argparse.ArgumentParser(prog="python -m code1",
+                                     description="Process and analyze blood pressure readings exported from Apple Health.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    process = subparsers.add_parser("process", help="Label blood pressure readings from an Apple Health export.")
+    process.add_argument("--data-file-path", dest="dataFilePath", type=Path, help="Path to the \"export.xml\" file.")
+    process.add_argument("--output-format", dest="outputFormat", choices=["CSV", "parquet", "feather"])
+    process.add_argument("--no-streaming", dest="streamingIngestion", action="store_false", default=None, help="Parse the whole export into memory instead of streaming it.")
+    process.add_argument("--parse-workers", dest="parseWorkers", type=int, help="Processes that parse the export in chunks. 1 parses it in a single process.")
+    process.add_argument("--discover-time-groups", dest="discoverTimeGroups", action="store_true", default=None, help="Find the time-of-day groups from the readings.")
+    process.add_argument("--max-time-groups", dest="maxTimeGroups", type=int)
+    process.add_argument("--keep-device", dest="keepDevice", action="store_true", default=None, help="Keep the device descriptions of the records.")
+    process.add_argument("--incremental", dest="incremental", action="store_true", default=None, help="Only label and pair the records newer than the store's watermark, and the stored readings they can affect.")
+    process.add_argument("--store-dir", dest="storeDir", type=Path)
+    process.add_argument("--profiler", dest="profiler", choices=["pyinstrument", "cProfile"], help="Profile each stage and save the profiles with the run's output.")
+    process.add_argument("--no-cache", dest="useCache", action="store_false", default=None, help="Always run the stage, without reusing or saving cached outputs.")
+    process.add_argument("--cache-dir", dest="cacheDir", type=Path)
+    process.add_argument("--log-level", dest="logLevel")
+    process.set_defaults(function=runProcess)
+
+    analyze = subparsers.add_parser("analyze", help="Run the statistical tests on processed tables.")
+    analyze.add_argument("--data-directory", dest="dataDirectory", type=Path, help="Output directory of a \"process\" run. Defaults to the latest one.")
+    analyze.add_argument("--welch", dest="ttestEqualVariance", action="store_false", default=None, help="Use Welch's t-test instead of Student's.")
+    analyze.add_argument("--correction", dest="ttestCorrection", choices=["bonferroni", "holm", "fdr_bh"])
+    analyze.add_argument("--resampling-n", dest="resamplingN", type=int, help="Number of permutations and bootstrap resamples of each comparison. Defaults to 100,000.")
+    analyze.add_argument("--resampling-seed", dest="resamplingSeed", type=int)
+    analyze.add_argument("--resampling-max-workers", dest="resamplingMaxWorkers", type=int)
+    analyze.add_argument("--trend-dir", dest="trendDir", type=Path, help="Directory where trends are kept between runs. Relative paths are resolved against the project's data directory.")
+    analyze.add_argument("--profiler", dest="profiler", choices=["pyinstrument", "cProfile"], help="Profile each stage and save the profiles with the run's output.")
+    analyze.add_argument("--no-cache", dest="useCache", action="store_false", default=None, help="Always run the stage, without reusing or saving cached outputs.")
+    analyze.add_argument("--cache-dir", dest="cacheDir", type=Path)
+    analyze.add_argument("--log-level", dest="logLevel")
+    analyze.set_defaults(function=runAnalyze)
+
+    precision = subparsers.add_parser("precision", help="Estimate the precision of each blood pressure meter.")
+    precision.add_argument("--data-file-path", dest="dataFilePath", type=Path, help="Path to the \"export.xml\" file.")
+    precision.add_argument("--no-streaming", dest="streamingIngestion", action="store_false", default=None, help="Parse the whole export into memory instead of streaming it.")
+    precision.add_argument("--parse-workers", dest="parseWorkers", type=int, help="Processes that parse the export in chunks. 1 parses it in a single process.")
+    precision.add_argument("--session-gap-minutes", dest="sessionGapMinutes", type=float)
+    precision.add_argument("--log-level", dest="logLevel")
+    precision.set_defaults(function=runPrecision)
+
+    plot = subparsers.add_parser("plot", help="Plot processed tables to image files.")
+    plot.add_argument("--data-directory", dest="dataDirectory", type=Path, help="Output directory of a \"process\" run. Defaults to the latest one.")
+    plot.add_argument("--cache-dir", dest="cacheDir", type=Path)
+    plot.add_argument("--format", dest="plotFormat", choices=["png", "svg"])
+    plot.add_argument("--max-points", dest="maxPoints", type=int, help="Most points plotted for each series.")
+    plot.add_argument("--decimation", dest="decimationMethod", choices=["lttb", "minmax"])
+    plot.add_argument("--hexbin-threshold", dest="hexbinThreshold", type=int, help="Scatters with more points than this are drawn as hexagonal bins.")
+    plot.add_argument("--profiler", dest="profiler", choices=["pyinstrument", "cProfile"], help="Profile each stage and save the profiles with the run's output.")
+    plot.add_argument("--log-level", dest="logLevel")
+    plot.set_defaults(function=runPlot)
+
+    batch = subparsers.add_parser("batch", help="Process the exports of many users in parallel.")
+    batch.add_argument("--exports-dir", dest="exportsDir", type=Path, help="Directory with one export per user.")
+    batch.add_argument("--config", dest="configPath", type=Path, help="JSON file with the medication periods and time windows of each user.")
+    batch.add_argument("--max-workers", dest="maxWorkers", type=int)
+    batch.add_argument("--max-tasks-per-child", dest="maxTasksPerChild", type=int)
+    batch.add_argument("--memory-limit-mb", dest="memoryLimitMB", type=int, help="Address space limit of each worker, which must be well above the memory it uses. No limit by default.")
+    batch.add_argument("--log-level", dest="logLevel")
+    batch.set_defaults(function=runBatch)
+
+    serve = subparsers.add_parser("serve", help="Answer queries about processed tables over HTTP.")
+    serve.add_argument("--data-directory", dest="dataDirectory", type=Path, help="Output directory of a \"process\" run. Defaults to following the latest one.")
+    serve.add_argument("--cache-dir", dest="cacheDir", type=Path)
+    serve.add_argument("--host", dest="host")
+    serve.add_argument("--port", dest="port", type=int)
+    serve.add_argument("--result-cache-size", dest="resultCacheSize", type=int, help="Number of query results kept in memory.")
+    serve.add_argument("--refresh-interval", dest="refreshIntervalSeconds", type=float, help="Seconds between checks for new data.")
+    serve.add_argument("--log-level", dest="logLevel")
+    serve.set_defaults(function=runServe)
+
+    generate = subparsers.add_parser("generate", help="Write a synthetic Apple Health export.")
+    generate.add_argument("filePath", type=Path)
+    generate.add_argument("numRecords", type=int)
+    generate.add_argument("--seed", dest="seed", type=int)
+    generate.add_argument("--start-date", dest="startDate")
+    generate.add_argument("--years", dest="years", type=float)
+    generate.add_argument("--bp-fraction", dest="bpFraction", type=float, help="Share of the records that are blood pressure records.")
+    generate.set_defaults(function=runGenerate)
+
+    benchmark = subparsers.add_parser("benchmark", help="Benchmark the pipeline stages on synthetic exports.")
+    benchmark.add_argument("--sizes", dest="sizes", type=int, nargs="+", help="Numbers of records of the synthetic exports.")
+    benchmark.add_argument("--benchmark-dir", dest="benchmarkDir", type=Path)
+    benchmark.add_argument("--exports-dir", dest="exportsDir", type=Path)
+    benchmark.add_argument("--seed", dest="seed", type=int)
+    benchmark.add_argument("--log-level", dest="logLevel")
+    benchmark.set_defaults(function=runBenchmark)
+
+    return parser
+
+
+def main(argv: Union[List[str], None] = None) -> None:
+    parser = buildParser()
+    arguments = parser.parse_args(argv)
+    arguments.function(arguments)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,102 +2,110 @@
 Analysis of blood pressure exported from Apple Health, after being processed by "processData.py"
 """
 
+import inspect
 import json
 import logging
 from pathlib import Path
+from typing import Dict, List, Tuple, Union
 # Third-party packages
 import pandas as pd
-import scipy.stats as sps
-import statsmodels.api as sm
-from IPython import get_ipython
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import StandardScaler
 # Local packages
 from drapi.drapi import getTimestamp, successiveParents, make_dir_path
+from code1.functions import COLUMNAR_FORMATS, TIME_COLUMNS, loadTable, loadTableMetadata
+from code1.groupComparisons import compareAllPairs, countSharedReadings, summarizeGroups
+from code1.instrumentation import RunMetrics
+from code1.regression import fitOLSBatch
+from code1.resampling import buildResamplingTasks, runResamplingTests
+from code1.stageCache import CACHE_ENTRY_FILE_NAME, CACHE_MAX_AGE_DAYS, CACHE_MAX_BYTES, evictCache, hashDirectory, latestCacheEntry, readCacheEntry, runCached
+from code1.trends import updateTrends
 
 # Arguments
-DATA_DIRECTORY = Path("data/output/processData/2023-07-10 00-44-33")
+DATA_DIRECTORY = None  # `None` uses the latest output of "processData.py", from the stage cache or else from "data/output/processData"
 
-PROJECT_DIR_DEPTH = 2
-
-LOG_LEVEL = "INFO"
-
-# Settings: Interactive Pyplot
-get_ipython().run_line_magic("matplotlib", "")
+TTEST_EQUAL_VARIANCE = True
+TTEST_CORRECTION = "holm"  # One of "bonferroni", "holm", "fdr_bh", or `None`
 
-# Variables: Path construction: General
-runTimestamp = getTimestamp()
-thisFilePath = Path(__file__)
-thisFileStem = thisFilePath.stem
-projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
-dataDir = projectDir.joinpath("data")
-if dataDir:
-    inputDataDir = dataDir.joinpath("input")
-    outputDataDir = dataDir.joinpath("output")
-    if outputDataDir:
-        runOutputDir = outputDataDir.joinpath(thisFileStem, runTimestamp)
-logsDir = projectDir.joinpath("logs")
-if logsDir:
-    runLogsDir = logsDir.joinpath(thisFileStem)
+RESAMPLING_N = 100_000  # Each comparison of about 7,500 readings takes about 3.4 seconds per 100,000 resamples on one processor. Use `--resampling-n` for quicker, less precise runs.
+RESAMPLING_SEED = 0
+RESAMPLING_MAX_WORKERS = None  # `None` uses all processors
 
-# Variables: Path construction: Project-specific
-pass
+TREND_DIR = Path("trends")  # Trends are kept here between runs, so that only new readings are computed. Relative paths are resolved against the project's "data" directory.
 
-# Variables: Other
-pass
+PROFILER = None  # One of "pyinstrument", "cProfile", or `None`
 
-# Directory creation: General
-make_dir_path(runOutputDir)
-make_dir_path(runLogsDir)
-
-# Directory creation: Project-specific
-pass
-
-
-if __name__ == "__main__":
-    # Logging block
-    logpath = runLogsDir.joinpath(f"log {runTimestamp}.log")
-    fileHandler = logging.FileHandler(logpath)
-    fileHandler.setLevel(LOG_LEVEL)
-    streamHandler = logging.StreamHandler()
-    streamHandler.setLevel(LOG_LEVEL)
-
-    logging.basicConfig(format="[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s",
-                        handlers=[fileHandler, streamHandler],
-                        level=LOG_LEVEL)
+USE_CACHE = True
+CACHE_DIR = None  # `None` uses "data/cache" in the project directory
 
-    logging.info(f"""Begin running "{thisFilePath}".""")
-    logging.info(f"""All other paths will be reported in debugging relative to `projectDir`: "{projectDir}".""")
-    logging.info(f"""Script arguments:
-
-    # Arguments
-    `DATA_DIRECTORY`: "{DATA_DIRECTORY}"
+PROJECT_DIR_DEPTH = 2
 
-    # Arguments: General
-    `PROJECT_DIR_DEPTH`: "{PROJECT_DIR_DEPTH}"
+LOG_LEVEL = "INFO"
 
-    `LOG_LEVEL` = "{LOG_LEVEL}"
-    """)
+# Arguments of `analyzeData` that don't change its results, or that are only known at run time
+UNCACHED_ARGUMENTS = ["dataDirectory",
+                      "runOutputDir",
+                      "trendDir",
+                      "profiler",
+                      "resamplingMaxWorkers"]
 
-    # Load data directory
-    tablesDirectory = DATA_DIRECTORY.joinpath("tablesToProcess")
 
-    # Load tables
-    tablesToProcess = {}
-    for fpath in tablesDirectory.iterdir():
-        table = pd.read_csv(fpath)
-        tablesToProcess[fpath.stem] = table
+def loadProcessedTables(dataDirectory: Path) -> Tuple[Dict[str, pd.DataFrame], List[str], List[str]]:
+    """
+    Loads the tables saved by "processData.py" in `dataDirectory`, reading only the columns used by the tests.
+    Returns the tables by name, the medication labels, and the time group labels.
+    """
+    tablesDirectory = dataDirectory.joinpath("tablesToProcess")
 
     # Load group and medication lists
-    jsonDir = DATA_DIRECTORY.joinpath("jsonDir")
-
-    groupsPath = jsonDir.joinpath("allGroups.JSON")
-    with open(groupsPath, "r") as file:
-        allGroups = json.loads(file.read())
+    tablePaths = {fpath.stem: fpath for fpath in sorted(tablesDirectory.iterdir())}
+    tableMetadata = loadTableMetadata(next(iter(tablePaths.values())))
+    if tableMetadata:
+        allGroups = tableMetadata["allGroups"]
+        allMedications = tableMetadata["allMedications"]
+    else:
+        jsonDir = dataDirectory.joinpath("jsonDir")
+
+        groupsPath = jsonDir.joinpath("allGroups.JSON")
+        with open(groupsPath, "r") as file:
+            allGroups = json.loads(file.read())
+
+        medicationsPath = jsonDir.joinpath("allMedications.JSON")
+        with open(medicationsPath, "r") as file:
+            allMedications = json.loads(file.read())
+
+    # Load tables, reading only the columns used by the test groups
+    columnsToLoad = ["startDate", "value"] + allMedications + allGroups
+    tablesToProcess = {}
+    for tableName, fpath in tablePaths.items():
+        table = loadTable(fpath, columns=columnsToLoad)
+        # Columnar formats keep the time columns as UTC datetimes, but CSV files keep them as text
+        if fpath.suffix.lower() not in COLUMNAR_FORMATS:
+            for column in table.columns.intersection(TIME_COLUMNS):
+                table[column] = pd.to_datetime(table[column], utc=True)
+        tablesToProcess[tableName] = table
+    return tablesToProcess, allMedications, allGroups
+
+
+def analyzeData(dataDirectory: Path,
+                runOutputDir: Path,
+                ttestEqualVariance: bool = TTEST_EQUAL_VARIANCE,
+                ttestCorrection: Union[str, None] = TTEST_CORRECTION,
+                resamplingN: int = RESAMPLING_N,
+                resamplingSeed: Union[int, None] = RESAMPLING_SEED,
+                resamplingMaxWorkers: Union[int, None] = RESAMPLING_MAX_WORKERS,
+                trendDir: Path = TREND_DIR,
+                profiler: Union[str, None] = PROFILER) -> Path:
+    """
+    Runs the statistical tests on the tables saved by "processData.py" in `dataDirectory` and saves the results to `runOutputDir`.
+    The metrics of each stage are saved to "runMetrics.JSON" in `runOutputDir`.
+    """
+    runMetrics = RunMetrics(runName="analyzeData",
+                            profiler=profiler,
+                            profileDir=runOutputDir.joinpath("profiles"))
 
-    medicationsPath = jsonDir.joinpath("allMedications.JSON")
-    with open(medicationsPath, "r") as file:
-        allMedications = json.loads(file.read())
+    # Load data directory
+    with runMetrics.stage("Load tables") as stage:
+        tablesToProcess, allMedications, allGroups = loadProcessedTables(dataDirectory)
+        stage["rows"] = sum(len(table) for table in tablesToProcess.values())
 
     # Perform statistical tests
     logging.info("""Performing statistical tests.""")
@@ -110,88 +118,238 @@ if __name__ == "__main__":
     COLUMNS_TO_USE_DICT = {"Medications": allMedications,
                            "Time Groups": allGroups,
                            "Medications and Time Groups": allMedications + allGroups}
-    modelResults = {tableName: {testGroup: {} for testGroup in COLUMNS_TO_USE_DICT.keys()} for tableName in tablesProcessed.keys()}
-    for tableName, table in tablesProcessed.items():
-        logging.info(f"""  Working on table "{tableName}".""")
-        for testGroup, columnsToUse in COLUMNS_TO_USE_DICT.items():
-            logging.info(f"""    Working on test group "{testGroup}".""")
-            mask = table[columnsToUse].any(axis=1)
-            xx = table[columnsToUse][mask]
-            yy = table["value"][mask]
-            xtrain = xx.astype(int).to_numpy()
-            ytrain = yy.astype(int).to_numpy().reshape(-1, 1)
-            # Pre-processing
-            xscaler = StandardScaler()
-            xscaler.fit(xtrain)
-            xstd = xscaler.transform(xtrain)
-            yscaler = StandardScaler()
-            yscaler.fit(ytrain)
-            ystd = yscaler.transform(ytrain)
-            # Model training: SKLearn Linear Regression
-            model1 = LinearRegression(fit_intercept=True)
-            model1 = model1.fit(X=xstd,
-                                y=ystd)
-            # Model training: StatsModel Linear Regression
-            exog = sm.add_constant(xx.astype(float))
-            endog = yy.astype(int)
-            model2 = sm.OLS(exog=exog, endog=endog)
-            result = model2.fit()
+    with runMetrics.stage("Linear regression") as stage:
+        modelResults = {}
+        for tableName, table in tablesProcessed.items():
+            logging.info(f"""  Working on table "{tableName}".""")
+            modelResults[tableName] = fitOLSBatch(table=table,
+                                                  testGroups=COLUMNS_TO_USE_DICT,
+                                                  logger=logging.getLogger(),
+                                                  valueColumn="value")
             logging.info("""    Model training complete.""")
-            # Save model results
-            modelResults[tableName][testGroup]["sklearn"] = model1
-            modelResults[tableName][testGroup]["sm"] = model2
-
-    # Print results for SKLearn Linear Regression
-    logging.info("""StatsModel model results""")
-    for tableName, table in tablesProcessed.items():
-        logging.info(f"""  Table "{tableName}".""")
-        for testGroup, columnsToUse in COLUMNS_TO_USE_DICT.items():
-            logging.info(f"""  Test group "{testGroup}".""")
-            model = modelResults[tableName][testGroup]["sklearn"]
-            logging.info(f"""  ..  Model coefficients: {model.coef_}.""")
-
-    # Print results for StatsModel Linear Regression
-    logging.info("""StatsModel model results""")
-    for tableName, table in tablesProcessed.items():
-        logging.info(f"""  Table "{tableName}".""")
-        for testGroup, columnsToUse in COLUMNS_TO_USE_DICT.items():
-            logging.info(f"""  Test group "{testGroup}".""")
-            model = modelResults[tableName][testGroup]["sm"]
-            logging.info(f"""  ..  Results summary:{model.fit().summary().as_text()}\n\n\n""")
-
-    # TODO Test for difference in variance between groups
-    pass
+        modelResults = pd.concat(modelResults, names=["table", None]).reset_index(level=0).reset_index(drop=True)
+
+        # Print results for Linear Regression
+        logging.info("""Linear regression model results""")
+        for tableName, tableResults in modelResults.groupby("table", sort=False):
+            logging.info(f"""  Table "{tableName}".""")
+            for testGroup, results in tableResults.groupby("testGroup", sort=False):
+                logging.info(f"""  Test group "{testGroup}".""")
+                logging.info(f"""  ..  Results summary:\n{results.drop(columns=["table", "testGroup"]).to_string(index=False)}\n\n\n""")
+
+        # Save model results
+        modelResultsPath = runOutputDir.joinpath("modelResults.CSV")
+        modelResults.to_csv(modelResultsPath, index=False)
+        stage["rows"] = sum(len(table) for table in tablesProcessed.values())
 
     # t-tests for SBP and DBP
-    logging.info("Performing t-tests")
-    ttestResults = {tableName: {testGroup: {} for testGroup in COLUMNS_TO_USE_DICT.keys()} for tableName in tablesProcessed.keys()}
-    for tableName, table in tablesProcessed.items():
-        logging.info(f"""  Working on table "{tableName}".""")
-        for testGroup, columnsToUse in COLUMNS_TO_USE_DICT.items():
-            logging.info(f"""    Working on test group "{testGroup}".""")
-            group0Column = columnsToUse[0]
-            for group1Column in columnsToUse[1:]:
-                logging.info(f"""  ..  Comparing these two groups: "{group0Column}", "{group1Column}".""")
-                group0mask = table[group0Column].values
-                group1mask = table[group1Column].values
-                group0 = table[group0mask]["value"].astype(float)
-                group1 = table[group1mask]["value"].astype(float)
-                results = sps.ttest_ind(a=group0,
-                                        b=group1)
-                ttestResults[tableName][testGroup] = results
-                logging.info(f"""  ..    Results - p-value: {round(results.pvalue, 4)}""")
-                logging.info(f"""  ..    Results - t-statistics: {round(results.statistic, 4)}""")
-                group0Column = group1Column
+    with runMetrics.stage("t-tests") as stage:
+        logging.info("Performing t-tests")
+        ttestResults = []
+        for tableName, table in tablesProcessed.items():
+            logging.info(f"""  Working on table "{tableName}".""")
+            groupSummary = summarizeGroups(table=table,
+                                           labelColumns=allMedications + allGroups,
+                                           valueColumn="value")
+            sharedReadings = countSharedReadings(table=table,
+                                                 labelColumns=allMedications + allGroups)
+            for testGroup, columnsToUse in COLUMNS_TO_USE_DICT.items():
+                logging.info(f"""    Working on test group "{testGroup}".""")
+                results = compareAllPairs(summary=groupSummary.loc[columnsToUse],
+                                          equalVariance=ttestEqualVariance,
+                                          correction=ttestCorrection,
+                                          sharedReadings=sharedReadings)
+                for _, row in results.iterrows():
+                    logging.info(f"""  ..  Comparing these two groups: "{row["group0"]}", "{row["group1"]}".""")
+                    logging.info(f"""  ..    Results - p-value: {round(row["pValue"], 4)} (adjusted: {round(row["pValueAdjusted"], 4)})""")
+                    logging.info(f"""  ..    Results - t-statistics: {round(row["tValue"], 4)}""")
+                results.insert(0, "testGroup", testGroup)
+                results.insert(0, "table", tableName)
+                ttestResults.append(results)
+        ttestResults = pd.concat(ttestResults, ignore_index=True)
+        ttestResultsPath = runOutputDir.joinpath("ttestResults.CSV")
+        ttestResults.to_csv(ttestResultsPath, index=False)
+        stage["rows"] = sum(len(table) for table in tablesProcessed.values())
     # NOTE Conclusion. For both SBP and DBP morning and evening measurements are significantly different (p<0.01).
 
-    # TODO: p-tests for SBP and DBP
-    logging.info("Performing p-tests")
-
-    # TODO: Visualize the association between systolic and diastolic measurements.
-    pass
+    # Permutation tests and bootstrap confidence intervals for differences in mean and variance between groups
+    with runMetrics.stage("Resampling tests") as stage:
+        logging.info("Performing permutation tests")
+        resamplingTasks = buildResamplingTasks(tablesToProcess=tablesProcessed,
+                                               testGroups=COLUMNS_TO_USE_DICT,
+                                               valueColumn="value")
+        resamplingResults = runResamplingTests(tasks=resamplingTasks,
+                                               nResamples=resamplingN,
+                                               seed=resamplingSeed,
+                                               maxWorkers=resamplingMaxWorkers)
+        for _, row in resamplingResults.iterrows():
+            logging.info(f"""  Table "{row["table"]}", test group "{row["testGroup"]}": "{row["group0"]}" vs. "{row["group1"]}".""")
+            logging.info(f"""  ..    Results - mean difference: {round(row["meanDifference"], 4)}, p-value: {round(row["meanDifferencePValue"], 4)}""")
+            logging.info(f"""  ..    Results - variance difference: {round(row["varianceDifference"], 4)}, p-value: {round(row["varianceDifferencePValue"], 4)}""")
+        resamplingResultsPath = runOutputDir.joinpath("resamplingResults.CSV")
+        resamplingResults.to_csv(resamplingResultsPath, index=False)
+        stage["rows"] = sum(len(task["values0"]) + len(task["values1"]) for task in resamplingTasks)
+
+    # Rolling and exponentially weighted trends for each table and label group
+    with runMetrics.stage("Trends") as stage:
+        logging.info("Updating trends")
+        # The time windows of the time groups, so that trends are computed again if the windows change
+        groupTimesPath = dataDirectory.joinpath("jsonDir", "groupTimes.JSON")
+        if groupTimesPath.exists():
+            with open(groupTimesPath, "r") as file:
+                groupTimes = json.loads(file.read())
+        else:
+            groupTimes = None
+        trendTables = updateTrends(tablesToProcess=tablesProcessed,
+                                   labelColumns=allMedications + allGroups,
+                                   trendDir=trendDir,
+                                   logger=logging.getLogger(),
+                                   labelDefinitions={"groupTimes": groupTimes})
+        trendResults = pd.concat(trendTables, names=["table", None]).reset_index(level=0).reset_index(drop=True)
+        trendResultsPath = runOutputDir.joinpath("trendResults.CSV")
+        trendResults.to_csv(trendResultsPath, index=False)
+        stage["rows"] = len(trendResults)
+
+    # The association between systolic and diastolic measurements is plotted by "plotData.py".
 
     # TODO: Conclusion, interpret results
     # NOTE The medication model has the lowest AIC, suggesting that the blood pressure medications are the best predictors of BP, and not the time-of-day models or the combined medication and time models.
 
+    # Save and summarize run metrics
+    runMetrics.save(runOutputDir.joinpath("runMetrics.JSON"))
+    runMetrics.logSummary(logging.getLogger())
+
+    return runOutputDir
+
+
+def runFinishedAt(runDir: Path) -> float:
+    """
+    Returns when a run directory of "processData.py" was finished, as seconds since the epoch: when its run metrics, which are saved last, or else its tables were written.
+    """
+    runMetricsPath = runDir.joinpath("runMetrics.JSON")
+    if runMetricsPath.exists():
+        result = runMetricsPath.stat().st_mtime
+    else:
+        result = runDir.joinpath("tablesToProcess").stat().st_mtime
+    return result
+
+
+def latestProcessedData(cacheDir: Path, processDataOutputDir: Path) -> Path:
+    """
+    Returns the latest output of "processData.py": the most recently used entry of the stage cache or the most recently finished timestamped run directory, whichever is newer.
+    Incremental and uncached runs are only saved to run directories, so these must be compared with the cache.
+    """
+    candidates = []
+    cacheEntryDir = latestCacheEntry(cacheDir=cacheDir, stageName="processData")
+    if cacheEntryDir is not None:
+        candidates.append((readCacheEntry(cacheEntryDir)["lastUsedAt"], cacheEntryDir))
+    if processDataOutputDir.exists():
+        candidates.extend((runFinishedAt(path), path) for path in processDataOutputDir.iterdir() if path.joinpath("tablesToProcess").is_dir())
+    if not candidates:
+        raise Exception(f"""No output of "processData.py" was found in "{cacheDir}" or "{processDataOutputDir}". Run it first, or pass `dataDirectory`.""")
+    _, result = max(candidates)
+    return result
+
+
+def main(dataDirectory: Union[Path, None] = DATA_DIRECTORY,
+         logLevel: str = LOG_LEVEL,
+         useCache: bool = USE_CACHE,
+         cacheDir: Union[Path, None] = CACHE_DIR,
+         **kwargs) -> Path:
+    """
+    Runs `analyzeData` as a script: creates the run's output and log directories, sets up logging, and logs the run's arguments.
+    If `dataDirectory` is `None`, the latest output of "processData.py" is analyzed. If `useCache` is true, the results are saved to, or reused from, the stage cache in `cacheDir`.
+    Keyword arguments are passed to `analyzeData`.
+    """
+    # Variables: Path construction: General
+    runTimestamp = getTimestamp()
+    thisFilePath = Path(__file__)
+    thisFileStem = thisFilePath.stem
+    projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
+    dataDir = projectDir.joinpath("data")
+    if dataDir:
+        inputDataDir = dataDir.joinpath("input")
+        outputDataDir = dataDir.joinpath("output")
+        if outputDataDir:
+            runOutputDir = outputDataDir.joinpath(thisFileStem, runTimestamp)
+    logsDir = projectDir.joinpath("logs")
+    if logsDir:
+        runLogsDir = logsDir.joinpath(thisFileStem)
+
+    if cacheDir is None:
+        cacheDir = dataDir.joinpath("cache")
+    trendDir = Path(kwargs.get("trendDir") or TREND_DIR)
+    if not trendDir.is_absolute():
+        kwargs["trendDir"] = dataDir.joinpath(trendDir)
+    if dataDirectory is None:
+        dataDirectory = latestProcessedData(cacheDir=cacheDir,
+                                            processDataOutputDir=outputDataDir.joinpath("processData"))
+
+    # Directory creation: General
+    make_dir_path(runLogsDir)
+
+    # Logging block
+    logpath = runLogsDir.joinpath(f"log {runTimestamp}.log")
+    fileHandler = logging.FileHandler(logpath)
+    fileHandler.setLevel(logLevel)
+    streamHandler = logging.StreamHandler()
+    streamHandler.setLevel(logLevel)
+
+    logging.basicConfig(format="[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s",
+                        handlers=[fileHandler, streamHandler],
+                        level=logLevel,
+                        force=True)
+
+    logging.info(f"""Begin running "{thisFilePath}".""")
+    logging.info(f"""All other paths will be reported in debugging relative to `projectDir`: "{projectDir}".""")
+    stageArguments = "".join(f'\n    `{key}`: "{value}"' for key, value in kwargs.items())
+    logging.info(f"""Script arguments:
+
+    # Arguments
+    `dataDirectory`: "{dataDirectory}"{stageArguments}
+    `useCache`: "{useCache}"
+    `cacheDir`: "{cacheDir}"
+
+    # Arguments: General
+    `PROJECT_DIR_DEPTH`: "{PROJECT_DIR_DEPTH}"
+
+    `logLevel` = "{logLevel}"
+    """)
+
+    if useCache:
+        # A cached output of "processData.py" is identified by its key; any other data directory by its contents
+        if dataDirectory.joinpath(CACHE_ENTRY_FILE_NAME).exists():
+            inputHash = readCacheEntry(dataDirectory)["key"]
+        else:
+            inputHash = hashDirectory(dataDirectory.joinpath("tablesToProcess"), cacheDir=cacheDir)
+        arguments = inspect.signature(analyzeData).bind(dataDirectory=dataDirectory, runOutputDir=None, **kwargs)
+        arguments.apply_defaults()
+        parameters = {key: value for key, value in arguments.arguments.items() if key not in UNCACHED_ARGUMENTS}
+        runOutputDir = runCached(stageName=thisFileStem,
+                                 inputHashes=[inputHash],
+                                 parameters=parameters,
+                                 cacheDir=cacheDir,
+                                 run=lambda outputDir: analyzeData(dataDirectory=dataDirectory,
+                                                                   runOutputDir=outputDir,
+                                                                   **kwargs),
+                                 logger=logging.getLogger())
+        evictCache(cacheDir=cacheDir,
+                   maxBytes=CACHE_MAX_BYTES,
+                   maxAgeDays=CACHE_MAX_AGE_DAYS,
+                   logger=logging.getLogger(),
+                   keep=[runOutputDir, dataDirectory])
+    else:
+        make_dir_path(runOutputDir)
+        analyzeData(dataDirectory=dataDirectory,
+                    runOutputDir=runOutputDir,
+                    **kwargs)
+    logging.info(f"""All results saved to "{runOutputDir.absolute()}".""")
+
     # End script
     logging.info(f"""Finished running "{thisFilePath.relative_to(projectDir)}".""")
+
+    return runOutputDir
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Processes the Apple Health exports of many users in parallel, each with its own medication periods and time windows.
+
+The exports directory holds one export per user, either as "<user>.xml" or as "<user>/export.xml" (or "<user>/apple_health_export/export.xml", as unzipped from the Health app). The configuration file is a JSON object of `processData` arguments:
+
+```
+{"defaults": {"groupTimes": {...}},
+ "users": {"alice": {"medicationDatetimes": {"Losartan Potassium": {"start": "2023-06-11 02:28:00-04:00", "stop": null}}},
+           "bob": {...}}}
+```
+
+Each user's results are saved to their own directory, and incremental runs keep each user's records in their own store, under the default store directory. A user whose export fails is reported in "batchSummary.CSV" without stopping the other users.
+"""
+
+import json
+import logging
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List, Union
+# Third-party packages
+import pandas as pd
+# Local packages
+from drapi.drapi import getTimestamp, successiveParents, make_dir_path
+from code1.processData import STORE_DIR, processData
+
+# Arguments
+EXPORTS_DIR = Path("data/input/exports")
+BATCH_CONFIG_PATH = Path("data/input/batchConfig.JSON")
+
+MAX_WORKERS = None  # `None` uses all processors
+MAX_TASKS_PER_CHILD = 1  # Each export gets a fresh worker, so memory isn't carried over between users
+MEMORY_LIMIT_MB = None  # Address space limit of each worker, or `None` for no limit. The address space includes memory that is mapped but not used, e.g., memory-mapped tables and thread stacks, so a limit should be well above the memory a worker uses.
+
+PROJECT_DIR_DEPTH = 2
+
+LOG_LEVEL = "INFO"
+
+# Arguments of `processData` that are given as strings in the configuration file
+TIMEDELTA_ARGUMENTS = ["pairingTolerance",
+                       "proximityBefore",
+                       "proximityAfter"]
+PATH_ARGUMENTS = ["storeDir"]
+
+
+def discoverExports(exportsDir: Path) -> Dict[str, Path]:
+    """
+    Finds the export of each user in `exportsDir`. Returns the path of each export by user.
+    """
+    result = {}
+    for path in sorted(exportsDir.iterdir()):
+        if path.is_file() and path.suffix.lower() == ".xml":
+            result[path.stem] = path
+        elif path.is_dir():
+            for candidate in [path.joinpath("export.xml"), path.joinpath("apple_health_export", "export.xml")]:
+                if candidate.exists():
+                    result[path.name] = candidate
+                    break
+    return result
+
+
+def loadBatchConfig(configPath: Union[Path, None]) -> Dict[str, dict]:
+    """
+    Loads the batch configuration file. Returns the "defaults" and "users" sections, which are empty if the file doesn't exist.
+    """
+    if configPath is None or not configPath.exists():
+        return {"defaults": {}, "users": {}}
+    with open(configPath, "r") as file:
+        config = json.loads(file.read())
+    result = {"defaults": config.get("defaults", {}),
+              "users": config.get("users", {})}
+    return result
+
+
+def userArguments(config: Dict[str, dict], userId: str) -> dict:
+    """
+    Returns the `processData` arguments of a user: the batch defaults updated with the user's own settings.
+    Unless the user's settings give their own `storeDir`, the user's records are stored in a subdirectory named after the user, of the default store directory.
+    """
+    userConfig = config["users"].get(userId, {})
+    result = dict(config["defaults"], **userConfig)
+    # Users are already processed in parallel, so each export is parsed in its own worker
+    result.setdefault("parseWorkers", 1)
+    if "storeDir" not in userConfig:
+        result["storeDir"] = Path(config["defaults"].get("storeDir", STORE_DIR)).joinpath(userId)
+    for key in TIMEDELTA_ARGUMENTS:
+        if key in result:
+            result[key] = pd.Timedelta(result[key])
+    for key in PATH_ARGUMENTS:
+        if key in result:
+            result[key] = Path(result[key])
+    return result
+
+
+def limitWorkerMemory(memoryLimitBytes: Union[int, None]) -> None:
+    """
+    Limits the address space of a worker process, so that an export too large for the machine fails with a `MemoryError` in its worker instead of exhausting the machine's memory. Only possible on Unix.
+    The limit applies to the address space, not to the memory in use, so it's off unless `memoryLimitBytes` is given.
+    """
+    if memoryLimitBytes is None:
+        return
+    try:
+        import resource
+    except ImportError:
+        return
+    _, hardLimit = resource.getrlimit(resource.RLIMIT_AS)
+    if hardLimit != resource.RLIM_INFINITY:
+        memoryLimitBytes = min(memoryLimitBytes, hardLimit)
+    resource.setrlimit(resource.RLIMIT_AS, (memoryLimitBytes, hardLimit))
+
+
+def processUserExport(task: dict) -> dict:
+    """
+    Processes the export of one user, logging to the user's output directory.
+    Errors are caught and returned, so that one bad export doesn't stop the batch.
+    """
+    userOutputDir = task["userOutputDir"]
+    make_dir_path(userOutputDir)
+    logger = logging.getLogger(f"{__name__}.{task['userId']}")
+    logger.setLevel(task["logLevel"])
+    fileHandler = logging.FileHandler(userOutputDir.joinpath("log.log"))
+    fileHandler.setFormatter(logging.Formatter("""[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s"""))
+    logger.addHandler(fileHandler)
+
+    result = {"userId": task["userId"],
+              "dataFilePath": str(task["dataFilePath"]),
+              "runOutputDir": str(userOutputDir),
+              "status": "succeeded",
+              "error": None}
+    start = time.perf_counter()
+    try:
+        logger.info(f"""Processing "{task["dataFilePath"]}".""")
+        processData(dataFilePath=task["dataFilePath"],
+                    runOutputDir=userOutputDir,
+                    logger=logger,
+                    **task["arguments"])
+    except Exception as error:
+        logger.error(traceback.format_exc())
+        result["status"] = "failed"
+        result["error"] = f"{type(error).__name__}: {error}"
+    finally:
+        result["seconds"] = time.perf_counter() - start
+        logger.removeHandler(fileHandler)
+        fileHandler.close()
+    return result
+
+
+def runTasks(tasks: List[dict],
+             maxWorkers: Union[int, None],
+             maxTasksPerChild: Union[int, None],
+             memoryLimitBytes: Union[int, None]) -> List[dict]:
+    """
+    Runs `processUserExport` on each task across a process pool. Returns the results in the order of `tasks`.
+    If a worker dies, for example when killed by the operating system, the pool breaks and its unfinished tasks come back as `None`.
+    """
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=maxWorkers,
+                             max_tasks_per_child=maxTasksPerChild,
+                             initializer=limitWorkerMemory,
+                             initargs=(memoryLimitBytes,)) as executor:
+        futures = [executor.submit(processUserExport, task) for task in tasks]
+        for it, future in enumerate(futures):
+            try:
+                results[it] = future.result()
+            except BrokenProcessPool:
+                pass
+    return results
+
+
+def batchProcess(exportsDir: Path,
+                 batchOutputDir: Path,
+                 logger: logging.Logger,
+                 configPath: Union[Path, None] = BATCH_CONFIG_PATH,
+                 maxWorkers: Union[int, None] = MAX_WORKERS,
+                 maxTasksPerChild: Union[int, None] = MAX_TASKS_PER_CHILD,
+                 memoryLimitMB: Union[int, None] = MEMORY_LIMIT_MB,
+                 logLevel: str = LOG_LEVEL) -> pd.DataFrame:
+    """
+    Processes each user's export in `exportsDir` with `processData`, saving each user's results to "`batchOutputDir`/<user>".
+    Returns, and saves to "batchSummary.CSV", the status of each user.
+    """
+    make_dir_path(batchOutputDir)
+    exports = discoverExports(exportsDir)
+    config = loadBatchConfig(configPath)
+    logger.info(f"""Found {len(exports):,} exports in "{exportsDir}".""")
+    unconfiguredUsers = [userId for userId in exports.keys() if userId not in config["users"]]
+    if unconfiguredUsers:
+        logger.warning(f"""These users have no configuration and use the defaults: {unconfiguredUsers}.""")
+
+    tasks = [{"userId": userId,
+              "dataFilePath": dataFilePath,
+              "userOutputDir": batchOutputDir.joinpath(userId),
+              "arguments": userArguments(config, userId),
+              "logLevel": logLevel} for userId, dataFilePath in exports.items()]
+    memoryLimitBytes = None if memoryLimitMB is None else int(memoryLimitMB * 2 ** 20)
+    results = runTasks(tasks=tasks,
+                       maxWorkers=maxWorkers,
+                       maxTasksPerChild=maxTasksPerChild,
+                       memoryLimitBytes=memoryLimitBytes)
+
+    # Tasks lost to a broken pool are run again one at a time, so that only the export that killed its worker fails
+    for it, task in enumerate(tasks):
+        if results[it] is None:
+            logger.warning(f"""Running user "{task["userId"]}" again in its own worker, after a worker died.""")
+            results[it] = runTasks(tasks=[task],
+                                   maxWorkers=1,
+                                   maxTasksPerChild=maxTasksPerChild,
+                                   memoryLimitBytes=memoryLimitBytes)[0]
+        if results[it] is None:
+            results[it] = {"userId": task["userId"],
+                           "dataFilePath": str(task["dataFilePath"]),
+                           "runOutputDir": str(task["userOutputDir"]),
+                           "status": "failed",
+                           "error": "The worker process died."}
+
+    summary = pd.DataFrame(results, columns=["userId", "dataFilePath", "runOutputDir", "status", "error", "seconds"])
+    for _, row in summary.iterrows():
+        if row["status"] == "succeeded":
+            logger.info(f"""  User "{row["userId"]}" succeeded in {row["seconds"]:.1f} s.""")
+        else:
+            logger.error(f"""  User "{row["userId"]}" failed: {row["error"]}""")
+    summaryPath = batchOutputDir.joinpath("batchSummary.CSV")
+    summary.to_csv(summaryPath, index=False)
+    logger.info(f"""{(summary["status"] == "succeeded").sum():,} of {len(summary):,} users succeeded.""")
+    return summary
+
+
+def main(exportsDir: Path = EXPORTS_DIR,
+         logLevel: str = LOG_LEVEL,
+         **kwargs) -> Path:
+    """
+    Runs `batchProcess` as a script: creates the run's output and log directories, sets up logging, and logs the run's arguments.
+    Keyword arguments are passed to `batchProcess`.
+    """
+    # Variables: Path construction: General
+    runTimestamp = getTimestamp()
+    thisFilePath = Path(__file__)
+    thisFileStem = thisFilePath.stem
+    projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
+    dataDir = projectDir.joinpath("data")
+    if dataDir:
+        outputDataDir = dataDir.joinpath("output")
+        if outputDataDir:
+            runOutputDir = outputDataDir.joinpath(thisFileStem, runTimestamp)
+    logsDir = projectDir.joinpath("logs")
+    if logsDir:
+        runLogsDir = logsDir.joinpath(thisFileStem)
+
+    # Directory creation: General
+    make_dir_path(runOutputDir)
+    make_dir_path(runLogsDir)
+
+    # Logging block
+    logpath = runLogsDir.joinpath(f"log {runTimestamp}.log")
+    logFormat = logging.Formatter("""[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s""")
+
+    logger = logging.getLogger(__name__)
+
+    fileHandler = logging.FileHandler(logpath)
+    fileHandler.setLevel(9)
+    fileHandler.setFormatter(logFormat)
+
+    streamHandler = logging.StreamHandler()
+    streamHandler.setLevel(logLevel)
+    streamHandler.setFormatter(logFormat)
+
+    logger.addHandler(fileHandler)
+    logger.addHandler(streamHandler)
+
+    logger.setLevel(9)
+
+    logger.info(f"""Begin running "{thisFilePath}".""")
+    logger.info(f"""All other paths will be reported in debugging relative to `projectDir`: "{projectDir}".""")
+    stageArguments = "".join(f'\n    `{key}`: "{value}"' for key, value in kwargs.items())
+    logger.info(f"""Script arguments:
+
+    # Arguments
+    `exportsDir`: "{exportsDir}"{stageArguments}
+
+    # Arguments: General
+    `PROJECT_DIR_DEPTH`: "{PROJECT_DIR_DEPTH}"
+
+    `logLevel` = "{logLevel}"
+    """)
+
+    try:
+        batchProcess(exportsDir=exportsDir,
+                     batchOutputDir=runOutputDir,
+                     logger=logger,
+                     logLevel=logLevel,
+                     **kwargs)
+
+        logger.info(f"""All results saved to "{runOutputDir.absolute().relative_to(projectDir)}".""")
+
+        # End script
+        logger.info(f"""Finished running "{thisFilePath.absolute().relative_to(projectDir)}".""")
+    finally:
+        logger.removeHandler(fileHandler)
+        logger.removeHandler(streamHandler)
+        fileHandler.close()
+
+    return runOutputDir
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Benchmarks the pipeline stages on synthetic Apple Health exports of increasing size.
+
+Each stage is timed, then run again under `tracemalloc` to record its peak memory. Results are saved as one JSON file per run, so that runs can be compared over time with `loadBenchmarkHistory`.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import platform
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Union
+# Third-party packages
+import numpy as np
+import pandas as pd
+# Local packages
+from code1.functions import labelByDatetimeSpan, labelByTimeOfDay, parseTimes, streamRecordsByType
+from code1.parallelIngestion import parseRecordsParallel
+from code1.regression import fitOLSBatch
+from code1.syntheticExport import DBP_RECORD_TYPE, SBP_RECORD_TYPE, writeSyntheticExport
+
+BENCHMARK_SIZES = [10_000, 100_000, 1_000_000]
+BENCHMARK_DIR = Path("data/output/benchmarks")
+SYNTHETIC_EXPORTS_DIR = Path("data/input/synthetic")
+
+BENCHMARK_TIME_WINDOWS = {"Morning": {"start": "04:00:00", "stop": "11:00:00"},
+                          "Afternoon": {"start": "11:00:00", "stop": "17:00:00"},
+                          "Evening": {"start": "17:00:00", "stop": "04:00:00"}}
+BENCHMARK_NUM_MEDICATION_PERIODS = 24
+
+
+def measureStage(stage: Callable, setup: Callable = lambda: ()) -> dict:
+    """
+    Runs `stage(*setup())` twice: once to measure wall and CPU time, and once under `tracemalloc` to measure peak memory.
+    `setup` builds fresh inputs for each run and isn't measured.
+    """
+    inputs = setup()
+    wallStart = time.perf_counter()
+    cpuStart = time.process_time()
+    result = stage(*inputs)
+    wallSeconds = time.perf_counter() - wallStart
+    cpuSeconds = time.process_time() - cpuStart
+
+    inputs = setup()
+    tracemalloc.start()
+    stage(*inputs)
+    _, peakBytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    metrics = {"wallSeconds": wallSeconds,
+               "cpuSeconds": cpuSeconds,
+               "peakTracedBytes": peakBytes,
+               "result": result}
+    return metrics
+
+
+def benchmarkMedicationPeriods(table: pd.DataFrame) -> Dict[str, Dict[str, pd.Timestamp]]:
+    """
+    Splits the span of `table` into back-to-back medication periods.
+    """
+    startDates = pd.to_datetime(table["startDate"], utc=True)
+    boundaries = pd.date_range(startDates.min(), startDates.max(), periods=BENCHMARK_NUM_MEDICATION_PERIODS + 1)
+    result = {f"Medication {it + 1}": {"start": boundaries[it], "stop": boundaries[it + 1]} for it in range(BENCHMARK_NUM_MEDICATION_PERIODS)}
+    return result
+
+
+def benchmarkSize(exportPath: Path, numRecords: int, logger: logging.Logger) -> List[dict]:
+    """
+    Benchmarks each stage of the pipeline on one synthetic export.
+    """
+    results = []
+
+    def record(stageName: str, metrics: dict, rows: int) -> None:
+        metrics = {key: value for key, value in metrics.items() if key != "result"}
+        results.append({"stage": stageName, "numRecords": numRecords, "rows": rows, **metrics})
+        logger.info(f"""  {stageName:<24} {numRecords:>12,} records {rows:>10,} rows {metrics["wallSeconds"]:>10.3f} s {metrics["peakTracedBytes"] / 2 ** 20:>10.1f} MiB""")
+
+    # Ingestion
+    metrics = measureStage(lambda: streamRecordsByType(filePath=exportPath, recordTypes=[SBP_RECORD_TYPE, DBP_RECORD_TYPE]))
+    tables = metrics["result"]
+    record("streamRecordsByType", metrics, sum(len(table) for table in tables.values()))
+    metrics = measureStage(lambda: parseRecordsParallel(filePath=exportPath, recordTypes=[SBP_RECORD_TYPE, DBP_RECORD_TYPE]))
+    record("parseRecordsParallel", metrics, sum(len(table) for table in metrics["result"].values()))
+    try:
+        from appleHealthExport.code.functions import parseExportFile, getRecordsByAttributeValue, tabulateRecords
+    except ImportError:
+        logger.info("""  Skipping "parseExportFile" and "tabulateRecords" because "appleHealthExport" isn't installed.""")
+    else:
+        metrics = measureStage(lambda: parseExportFile(exportPath))
+        tree = metrics["result"]
+        record("parseExportFile", metrics, numRecords)
+        records = getRecordsByAttributeValue(tree=tree, attribute="type", value=SBP_RECORD_TYPE)
+        del tree
+        metrics = measureStage(lambda: tabulateRecords(records=records))
+        record("tabulateRecords", metrics, len(records))
+
+    # Pre-processing and labeling
+    tableSBP = tables[SBP_RECORD_TYPE]
+    metrics = measureStage(parseTimes, setup=lambda: (tableSBP.copy(),))
+    record("parseTimes", metrics, len(tableSBP))
+    tableSBP = metrics["result"]
+    medicationPeriods = benchmarkMedicationPeriods(tableSBP)
+    metrics = measureStage(lambda tablesToProcess: labelByDatetimeSpan(tablesToProcess=tablesToProcess,
+                                                                       labelDatetimes=medicationPeriods,
+                                                                       troubleshooting=False,
+                                                                       logger=logger),
+                           setup=lambda: ({"Systolic BP": tableSBP.copy()},))
+    record("labelByDatetimeSpan", metrics, len(tableSBP))
+    tableSBP = metrics["result"]["Systolic BP"]
+    metrics = measureStage(lambda tablesToProcess: labelByTimeOfDay(tablesToProcess=tablesToProcess,
+                                                                    timeWindows=BENCHMARK_TIME_WINDOWS,
+                                                                    logger=logger),
+                           setup=lambda: ({"Systolic BP": tableSBP.copy()},))
+    record("labelByTimeOfDay", metrics, len(tableSBP))
+    tableSBP = metrics["result"]["Systolic BP"]
+
+    # Model grid
+    allMedications = list(medicationPeriods.keys())
+    allGroups = list(BENCHMARK_TIME_WINDOWS.keys())
+    testGroups = {"Medications": allMedications,
+                  "Time Groups": allGroups,
+                  "Medications and Time Groups": allMedications + allGroups}
+    metrics = measureStage(lambda: fitOLSBatch(table=tableSBP, testGroups=testGroups, logger=logger, valueColumn="value"))
+    record("fitOLSBatch", metrics, len(tableSBP))
+
+    return results
+
+
+def runBenchmarks(sizes: List[int] = BENCHMARK_SIZES,
+                  benchmarkDir: Path = BENCHMARK_DIR,
+                  exportsDir: Path = SYNTHETIC_EXPORTS_DIR,
+                  seed: int = 0,
+                  logger: Union[logging.Logger, None] = None) -> Path:
+    """
+    Benchmarks the pipeline on a synthetic export of each size in `sizes`, generating the exports that don't exist yet, and saves the results.
+    Returns the path of the results file.
+    """
+    logger = logger or logging.getLogger(__name__)
+    exportsDir.mkdir(parents=True, exist_ok=True)
+    benchmarkDir.mkdir(parents=True, exist_ok=True)
+    runTimestamp = time.strftime("%Y-%m-%d %H-%M-%S")
+    results = []
+    for numRecords in sizes:
+        exportPath = exportsDir.joinpath(f"export {numRecords} seed {seed}.xml")
+        if not exportPath.exists():
+            logger.info(f"""Writing a synthetic export with {numRecords:,} records to "{exportPath}".""")
+            writeSyntheticExport(filePath=exportPath, numRecords=numRecords, seed=seed)
+        logger.info(f"""Benchmarking "{exportPath}".""")
+        results.extend(benchmarkSize(exportPath=exportPath, numRecords=numRecords, logger=logger))
+
+    run = {"timestamp": runTimestamp,
+           "python": platform.python_version(),
+           "platform": platform.platform(),
+           "cpuCount": os.cpu_count(),
+           "numpy": np.__version__,
+           "pandas": pd.__version__,
+           "seed": seed,
+           "results": results}
+    savepath = benchmarkDir.joinpath(f"benchmark {runTimestamp}.JSON")
+    with open(savepath, "w") as file:
+        file.write(json.dumps(run, indent=4))
+    logger.info(f"""Benchmark results saved to "{savepath}".""")
+    return savepath
+
+
+def loadBenchmarkHistory(benchmarkDir: Path = BENCHMARK_DIR) -> pd.DataFrame:
+    """
+    Loads all saved benchmark runs into one table, with a row per run, stage, and size.
+    """
+    runs = []
+    for fpath in sorted(benchmarkDir.glob("benchmark *.JSON")):
+        with open(fpath, "r") as file:
+            run = json.loads(file.read())
+        runResults = pd.DataFrame(run["results"])
+        runResults.insert(0, "timestamp", run["timestamp"])
+        runs.append(runResults)
+    if runs:
+        result = pd.concat(runs, ignore_index=True)
+    else:
+        result = pd.DataFrame()
+    return result
@@ -0,0 +1,6 @@
+"""
+Test configuration for pytest.
+"""
+
+# "test_typing.py" is an example for type checkers, not a test module
+collect_ignore = ["test_typing.py"]
@@ -5,9 +5,13 @@ Functions for this module
 from __future__ import annotations
 
 import datetime as dt
+import json
 import logging
-from typing import Dict, Union, cast
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, Iterable, List, Union, cast
 # Third-party packages
+import numpy as np
 import pandas as pd
 
 
@@ -24,27 +28,206 @@ import pandas as pd
 # logger = cast(Logger, logging.getLogger(__name__))
 
 
+def collectRecords(events: Iterable[tuple],
+                   recordTypes: Iterable[str],
+                   attributes: Union[Dict[str, Iterable[str]], None] = None) -> Dict[str, list]:
+    """
+    Collects the attributes of the direct children of the root element from a stream of ("start", element) and ("end", element) events, e.g., from `ET.iterparse`, whose first event is the start of the root element.
+    Each child is freed after it is read. See `streamRecordsByType` for `recordTypes` and `attributes`.
+    Returns a dictionary of rows keyed by record type.
+    """
+    recordTypes = set(recordTypes)
+    attributes = {recordType: list(keep) for recordType, keep in (attributes or {}).items()}
+    rows = {recordType: [] for recordType in recordTypes}
+    events = iter(events)
+    _, root = next(events)
+    depth = 1
+    for event, element in events:
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            if element.tag == "Record":
+                recordType = element.get("type")
+            else:
+                recordType = element.tag
+            if recordType in recordTypes:
+                if recordType in attributes:
+                    rows[recordType].append({attribute: element.get(attribute) for attribute in attributes[recordType]})
+                else:
+                    rows[recordType].append(dict(element.attrib))
+            root.clear()
+    return rows
+
+
+def streamRecordsByType(filePath: Union[str, Path],
+                        recordTypes: Iterable[str],
+                        attributes: Union[Dict[str, Iterable[str]], None] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Reads an Apple Health export in a single incremental pass and tabulates the records of the requested types.
+    Only direct children of the root element are considered, and each one is freed after it is read, so memory use is bounded by the size of the requested records rather than the size of the export.
+    Besides `Record` types, `recordTypes` may contain other element tags, e.g., "Workout", to tabulate all the elements with that tag.
+    `attributes` optionally maps a record type to the only attributes to keep for it, e.g., the start and end dates of a large reference stream.
+    Returns a dictionary of tables keyed by record type, equivalent to calling `tabulateRecords` on each type.
+    """
+    rows = collectRecords(events=ET.iterparse(filePath, events=("start", "end")),
+                          recordTypes=recordTypes,
+                          attributes=attributes)
+    tables = {recordType: pd.DataFrame.from_records(records) for recordType, records in rows.items()}
+    return tables
+
+
+NAT_NANOSECONDS = np.iinfo(np.int64).min
+
+APPLE_TIMESTAMP_LENGTH = 25  # "YYYY-MM-DD HH:MM:SS ±HHMM"
+APPLE_TIMESTAMP_SEPARATORS = {4: b"-", 7: b"-", 10: b" ", 13: b":", 16: b":", 19: b" "}
+DAYS_PER_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])  # Indexed by month, in a year that isn't a leap year
+
+
+def parseAppleTimestamps(values) -> Dict[str, np.ndarray]:
+    """
+    Parses Apple Health timestamps, "YYYY-MM-DD HH:MM:SS ±HHMM", in one vectorized pass over their bytes.
+    Returns the UTC time in nanoseconds since the epoch, the local offset in minutes, and the local minute of the day of each timestamp.
+    Values in any other format, or with an impossible date or time, are parsed individually by pandas, which raises an error for values it can't parse. Missing values become `NAT_NANOSECONDS`, with an offset of 0 and a minute of the day of -1.
+    """
+    values = np.asarray(values, dtype=object)
+    numValues = len(values)
+    try:
+        # One byte more than the format, so that longer strings don't pass as valid
+        characters = values.astype(f"S{APPLE_TIMESTAMP_LENGTH + 1}").view(np.uint8).reshape(numValues, APPLE_TIMESTAMP_LENGTH + 1)
+    except UnicodeEncodeError:
+        characters = np.zeros((numValues, APPLE_TIMESTAMP_LENGTH + 1), dtype=np.uint8)
+    # Characters other than digits wrap around to values above 9
+    digits = characters - np.uint8(ord("0"))
+    separatorPositions = list(APPLE_TIMESTAMP_SEPARATORS.keys()) + [20, APPLE_TIMESTAMP_LENGTH]
+    digitPositions = [position for position in range(APPLE_TIMESTAMP_LENGTH) if position not in separatorPositions]
+    valid = (digits[:, digitPositions] <= 9).all(axis=1)
+    for position, separator in APPLE_TIMESTAMP_SEPARATORS.items():
+        valid &= characters[:, position] == ord(separator)
+    valid &= (characters[:, 20] == ord("+")) | (characters[:, 20] == ord("-"))
+    valid &= characters[:, APPLE_TIMESTAMP_LENGTH] == 0
+
+    def number(first: int, last: int) -> np.ndarray:
+        result = digits[:, first].astype(np.int64)
+        for position in range(first + 1, last):
+            result = result * 10 + digits[:, position]
+        return result
+
+    year = number(0, 4)
+    month = number(5, 7)
+    day = number(8, 10)
+    hour = number(11, 13)
+    minute = number(14, 16)
+    second = number(17, 19)
+    offsetMinutes = np.where(characters[:, 20] == ord("-"), -1, 1) * (number(21, 23) * 60 + number(23, 25))
+    valid &= (month >= 1) & (month <= 12) & (hour <= 23) & (minute <= 59) & (second <= 59)
+    # Impossible dates, e.g., February 30, are left to pandas, which rejects them
+    isLeapYear = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    daysInMonth = DAYS_PER_MONTH[np.clip(month, 1, 12)] + (isLeapYear & (month == 2))
+    valid &= (day >= 1) & (day <= daysInMonth)
+
+    # Days since the epoch of a proleptic Gregorian date, after Howard Hinnant's `days_from_civil`
+    shiftedYear = year - (month <= 2)
+    era = shiftedYear // 400
+    yearOfEra = shiftedYear - era * 400
+    dayOfYear = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    dayOfEra = yearOfEra * 365 + yearOfEra // 4 - yearOfEra // 100 + dayOfYear
+    days = era * 146097 + dayOfEra - 719468
+
+    localMinute = hour * 60 + minute
+    utcNanoseconds = ((days * 86400 + localMinute * 60 + second - offsetMinutes * 60) * 1_000_000_000)
+
+    # Anything else is parsed individually
+    for it in np.flatnonzero(~valid):
+        timestamp = pd.Timestamp(values[it]) if not pd.isna(values[it]) else pd.NaT
+        if timestamp is pd.NaT:
+            utcNanoseconds[it] = NAT_NANOSECONDS
+            offsetMinutes[it] = 0
+            localMinute[it] = -1
+        else:
+            utcOffset = timestamp.utcoffset()
+            offsetMinutes[it] = 0 if utcOffset is None else int(utcOffset.total_seconds() // 60)
+            localMinute[it] = timestamp.hour * 60 + timestamp.minute
+            utcNanoseconds[it] = timestamp.as_unit("ns").value
+    result = {"utcNanoseconds": utcNanoseconds,
+              "offsetMinutes": offsetMinutes.astype(np.int16),
+              "localMinute": localMinute.astype(np.int16)}
+    return result
+
+
 def parseTimes(pdObject: Union[pd.Series, pd.DataFrame]):
     """
-    Converts table columns to pandas datetime objects.
+    Converts the time columns of a table to UTC datetimes with `parseAppleTimestamps`, adding to each time column a column of its local offset in minutes, e.g., "startDateOffset", and of its local minute of the day, e.g., "startDateLocalMinute".
+    A series is converted to UTC datetimes.
     """
     timeColumns = ["creationDate",
                    "startDate",
                    "endDate"]
     if isinstance(pdObject, pd.Series):
-        result = pd.to_datetime(pdObject)
+        parsed = parseAppleTimestamps(pdObject)
+        result = pd.Series(pd.to_datetime(parsed["utcNanoseconds"], utc=True), index=pdObject.index, name=pdObject.name)
     elif isinstance(pdObject, pd.DataFrame):
         for column in pdObject.columns:
-            if column in timeColumns:
-                pdObject[column] = pd.to_datetime(pdObject[column])
+            if column in timeColumns and not pd.api.types.is_datetime64_any_dtype(pdObject[column]):
+                parsed = parseAppleTimestamps(pdObject[column])
+                pdObject[column] = pd.to_datetime(parsed["utcNanoseconds"], utc=True)
+                pdObject[f"{column}Offset"] = parsed["offsetMinutes"]
+                pdObject[f"{column}LocalMinute"] = parsed["localMinute"]
         result = pdObject
     else:
         raise Exception(f"""Unexpected object of type "{type(pdObject)}"". Expected objects of type pd.Series or pd.DataFrame.""")
     return result
 
 
+def datetimesToNanoseconds(values) -> np.ndarray:
+    """
+    Converts datetime-like values to an array of int64 nanoseconds since the epoch, in UTC.
+    Timezone-naive values are assumed to be in UTC. Missing values become `NAT_NANOSECONDS`.
+    """
+    if not isinstance(values, (pd.Series, pd.Index, np.ndarray)):
+        values = np.asarray(values, dtype=object)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        datetimes = pd.DatetimeIndex(pd.to_datetime(values, utc=True))
+        result = datetimes.as_unit("ns").asi8
+    else:
+        result = parseAppleTimestamps(values)["utcNanoseconds"]
+    return result
+
+
+def labelIntervals(startNanoseconds: np.ndarray,
+                   endNanoseconds: np.ndarray,
+                   intervalStarts: np.ndarray,
+                   intervalStops: np.ndarray) -> np.ndarray:
+    """
+    Assigns observations spanning `startNanoseconds` to `endNanoseconds` to any number of, possibly overlapping, half-open intervals.
+    The interval boundaries are sorted into elementary segments and each observation is located by binary search, so the cost is O(n log k) rather than O(n * k).
+    Returns a boolean array of shape (number of observations, number of intervals).
+    """
+    intervalStarts = np.asarray(intervalStarts, dtype=np.int64)
+    intervalStops = np.asarray(intervalStops, dtype=np.int64)
+    boundaries = np.unique(np.concatenate([intervalStarts, intervalStops]))
+    # Segment `i` is the span from `boundaries[i]` to `boundaries[i + 1]`.
+    segmentStarts = boundaries[:-1]
+    segmentStops = boundaries[1:]
+    membership = (intervalStarts[None, :] <= segmentStarts[:, None]) & (segmentStops[:, None] <= intervalStops[None, :])
+    # Observations outside all boundaries fall in an extra segment that belongs to no interval.
+    membership = np.vstack([membership, np.zeros((1, len(intervalStarts)), dtype=bool)])
+    outside = len(membership) - 1
+
+    def locate(nanoseconds):
+        segments = np.searchsorted(boundaries, nanoseconds, side="right") - 1
+        segments[(segments < 0) | (segments >= len(segmentStarts))] = outside
+        return segments
+
+    result = membership.take(locate(startNanoseconds), axis=0)
+    if not np.array_equal(startNanoseconds, endNanoseconds):
+        result &= membership.take(locate(endNanoseconds), axis=0)
+    return result
+
+
 def labelByDatetimeSpan(tablesToProcess: Dict[str, pd.DataFrame],
-                        labelDatetimes: Dict[str, dt.datetime],
+                        labelDatetimes: Dict[str, Dict[str, Union[str, dt.datetime, None]]],
                         troubleshooting: bool,
                         logger: logging.Logger):
     """
@@ -53,23 +236,407 @@ def labelByDatetimeSpan(tablesToProcess: Dict[str, pd.DataFrame],
     I.e., if an object to be labeled is between both a stop and start time, it should
     be assigned to the start time's group.
     """
+    allLabels = [labelName for labelName in labelDatetimes.keys()]
+    intervalStarts = datetimesToNanoseconds([datetimeDict["start"] for datetimeDict in labelDatetimes.values()])
+    intervalStops = datetimesToNanoseconds([datetimeDict["stop"] for datetimeDict in labelDatetimes.values()])
+    # A missing stop time means the period is ongoing.
+    intervalStops[intervalStops == NAT_NANOSECONDS] = np.iinfo(np.int64).max
     for tableName, table in tablesToProcess.items():
-        for labelName, datetimeDict in labelDatetimes.items():
-            startDatetime = datetimeDict["start"]
-            stopDatetime = datetimeDict["stop"]
-            t0ordinal = startDatetime.toordinal()
-            t1ordinal = stopDatetime.toordinal()
-            startDateOrdinal = table["startDate"].apply(lambda ts: ts.toordinal())
-            endDateOrdinal = table["endDate"].apply(lambda ts: ts.toordinal())
-            labelStartDatetime = (t0ordinal <= startDateOrdinal) & (startDateOrdinal <= t1ordinal)
-            labelEndDatetime = (t0ordinal < endDateOrdinal) & (endDateOrdinal < t1ordinal)
-            label = labelStartDatetime & labelEndDatetime
-            table[labelName] = label
-        allLabels = [group for group in labelDatetimes.keys()]
-        table["QA: Unassigned Labels"] = ~table[allLabels].any()
+        startNanoseconds = datetimesToNanoseconds(table["startDate"])
+        endNanoseconds = datetimesToNanoseconds(table["endDate"])
+        labels = labelIntervals(startNanoseconds=startNanoseconds,
+                                endNanoseconds=endNanoseconds,
+                                intervalStarts=intervalStarts,
+                                intervalStops=intervalStops)
+        for it, labelName in enumerate(allLabels):
+            table[labelName] = labels[:, it]
+        table["QA: Unassigned Labels"] = ~labels.any(axis=1)
         logger.info(f"""All observations should be assigned to a group. The current table has {table["QA: Unassigned Labels"].sum()} unassigned observations.""")
 
     if troubleshooting:
         return tablesToProcess, allLabels
     else:
         return tablesToProcess
+
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def timeToMinuteOfDay(value: Union[str, dt.time, dt.datetime]) -> int:
+    """
+    Converts a wall-clock time, e.g., "03:00:00-04:00" or a `datetime.time` object, to its minute of the day.
+    The time is read in its own offset, so that it can be compared with each record's local time.
+    """
+    if isinstance(value, str):
+        value = pd.to_datetime(value)
+    result = value.hour * 60 + value.minute
+    return result
+
+
+def localMinuteOfDay(pdObject: pd.Series) -> np.ndarray:
+    """
+    Returns the minute of the day of each timestamp in `pdObject`, in each record's local offset.
+    Accepts unparsed Apple Health timestamp strings, datetime columns, or object columns of `Timestamp`s with mixed offsets.
+    """
+    if pd.api.types.is_datetime64_any_dtype(pdObject):
+        result = (pdObject.dt.hour * 60 + pdObject.dt.minute).to_numpy(dtype=np.int16)
+    elif len(pdObject) == 0:
+        result = np.zeros(0, dtype=np.int16)
+    elif isinstance(pdObject.iloc[0], str):
+        # Apple Health format: "YYYY-MM-DD HH:MM:SS ±HHMM"
+        hours = pdObject.str.slice(11, 13).astype(np.int16).to_numpy()
+        minutes = pdObject.str.slice(14, 16).astype(np.int16).to_numpy()
+        result = hours * 60 + minutes
+    else:
+        # Mixed offsets leave an object column, where each `Timestamp` carries its own offset.
+        result = np.fromiter((ts.hour * 60 + ts.minute for ts in pdObject), dtype=np.int16, count=len(pdObject))
+    return result
+
+
+def timeOfDayLookupTable(timeWindows: Dict[str, Dict[str, Union[str, dt.time, dt.datetime]]]) -> np.ndarray:
+    """
+    Builds a boolean table of shape (minutes per day, number of windows) whose rows mark the windows that contain each minute of the day.
+    Windows whose start is later than their stop wrap past midnight. Start times are inclusive. Stop times are not inclusive.
+    """
+    minutes = np.arange(MINUTES_PER_DAY)
+    lookupTable = np.zeros((MINUTES_PER_DAY, len(timeWindows)), dtype=bool)
+    for it, timeDict in enumerate(timeWindows.values()):
+        t0 = timeToMinuteOfDay(timeDict["start"])
+        t1 = timeToMinuteOfDay(timeDict["stop"])
+        if t0 < t1:
+            lookupTable[:, it] = (t0 <= minutes) & (minutes < t1)
+        elif t0 > t1:
+            lookupTable[:, it] = (t0 <= minutes) | (minutes < t1)
+        else:
+            lookupTable[:, it] = True
+    return lookupTable
+
+
+def labelByTimeOfDay(tablesToProcess: Dict[str, pd.DataFrame],
+                     timeWindows: Dict[str, Dict[str, Union[str, dt.time, dt.datetime]]],
+                     logger: logging.Logger) -> Dict[str, pd.DataFrame]:
+    """
+    Creates labels for medical records based on the time of day, in each record's local offset, at which they started and ended.
+    Any number of windows is supported, including windows that wrap past midnight. Records are labeled with a single lookup into a minute-of-day table.
+    """
+    allGroups = [group for group in timeWindows.keys()]
+    lookupTable = timeOfDayLookupTable(timeWindows=timeWindows)
+    for tableName, table in tablesToProcess.items():
+        # Use the local minutes of the day from `parseTimes`, if available
+        if "startDateLocalMinute" in table.columns and "endDateLocalMinute" in table.columns:
+            startMinutes = table["startDateLocalMinute"].to_numpy(dtype=np.int16)
+            endMinutes = table["endDateLocalMinute"].to_numpy(dtype=np.int16)
+        else:
+            startMinutes = localMinuteOfDay(table["startDate"])
+            endMinutes = localMinuteOfDay(table["endDate"])
+        missing = (startMinutes < 0) | (endMinutes < 0)
+        labels = lookupTable.take(np.maximum(startMinutes, 0), axis=0)
+        if not np.array_equal(startMinutes, endMinutes):
+            labels &= lookupTable.take(np.maximum(endMinutes, 0), axis=0)
+        labels[missing] = False
+        for it, group in enumerate(allGroups):
+            table[group] = labels[:, it]
+        table["QA: Unassigned (Groups)"] = ~labels.any(axis=1)
+        logger.info(f"""All observations should be assigned to a group. The current table has {table["QA: Unassigned (Groups)"].sum()} unassigned observations.""")
+
+    return tablesToProcess
+
+
+TIME_COLUMNS = ["creationDate",
+                "startDate",
+                "endDate"]
+CATEGORICAL_COLUMNS = ["type",
+                       "sourceName",
+                       "sourceVersion",
+                       "unit",
+                       "device"]
+BULKY_COLUMNS = ["device"]
+
+
+def compactNumeric(series: pd.Series) -> pd.Series:
+    """
+    Converts a column of numbers, possibly stored as strings, to the smallest integer type of at least 16 bits that holds it, or to 32-bit floats if it has fractions or missing values.
+    """
+    values = pd.to_numeric(series, errors="coerce")
+    if len(values) and values.notna().all() and (values % 1 == 0).all():
+        values = pd.to_numeric(values.astype(np.int64), downcast="integer")
+        result = values.astype(np.promote_types(values.dtype, np.int16))
+    else:
+        result = values.astype(np.float32)
+    return result
+
+
+def compactTable(table: pd.DataFrame,
+                 keepDevice: bool = False,
+                 convertTimes: bool = True) -> pd.DataFrame:
+    """
+    Converts a tabulated record table, whose attributes are all strings, to compact types: small numeric types for "value", categoricals for the repetitive string columns, and UTC datetimes for the time columns if `convertTimes` is true.
+    The long "device" description is dropped unless `keepDevice` is true.
+    """
+    if not keepDevice:
+        table = table.drop(columns=[column for column in BULKY_COLUMNS if column in table.columns])
+    else:
+        table = table.copy()
+    for column in table.columns:
+        if column == "value":
+            table[column] = compactNumeric(table[column])
+        elif column in CATEGORICAL_COLUMNS:
+            table[column] = table[column].astype("category")
+        elif column in TIME_COLUMNS and convertTimes and not isinstance(table[column].dtype, pd.DatetimeTZDtype):
+            table[column] = pd.to_datetime(datetimesToNanoseconds(table[column]), utc=True)
+    return table
+
+
+COLUMNAR_FORMATS = {".parquet": "parquet",
+                    ".feather": "feather"}
+TABLE_METADATA_KEY = b"anblopres"
+
+
+def prepareColumnarTable(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts a table to the types used for columnar storage: UTC datetimes for the time columns and categoricals for the repetitive string columns.
+    Boolean label columns are kept as booleans, which the columnar formats store bit-packed.
+    """
+    table = table.copy()
+    for column in table.columns:
+        if column in TIME_COLUMNS and not isinstance(table[column].dtype, pd.DatetimeTZDtype):
+            # Mixed offsets can't be stored in a single typed column, so times are stored in UTC.
+            table[column] = pd.to_datetime(datetimesToNanoseconds(table[column]), utc=True)
+        elif column in CATEGORICAL_COLUMNS:
+            table[column] = table[column].astype("category")
+    return table
+
+
+def saveTable(table: pd.DataFrame,
+              savepath: Union[str, Path],
+              metadata: Union[dict, None] = None) -> None:
+    """
+    Saves a table as Parquet or Feather, according to the file suffix, with `metadata` embedded in the file schema.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    savepath = Path(savepath)
+    fileFormat = COLUMNAR_FORMATS[savepath.suffix.lower()]
+    arrowTable = pa.Table.from_pandas(prepareColumnarTable(table), preserve_index=False)
+    if metadata:
+        schemaMetadata = dict(arrowTable.schema.metadata or {})
+        schemaMetadata[TABLE_METADATA_KEY] = json.dumps(metadata).encode()
+        arrowTable = arrowTable.replace_schema_metadata(schemaMetadata)
+    if fileFormat == "parquet":
+        pq.write_table(arrowTable, savepath)
+    elif fileFormat == "feather":
+        # Uncompressed Feather files can be memory-mapped without copying.
+        feather.write_feather(arrowTable, savepath, compression="uncompressed")
+
+
+def readArrowTable(fpath: Union[str, Path],
+                   columns: Union[List[str], None] = None):
+    """
+    Reads a Parquet or Feather file saved by `saveTable` as a `pyarrow.Table`, with memory mapping.
+    """
+    fpath = Path(fpath)
+    fileFormat = COLUMNAR_FORMATS[fpath.suffix.lower()]
+    if fileFormat == "parquet":
+        import pyarrow.parquet as pq
+        result = pq.read_table(fpath, columns=columns, memory_map=True)
+    elif fileFormat == "feather":
+        import pyarrow.feather as feather
+        result = feather.read_table(fpath, columns=columns, memory_map=True)
+    return result
+
+
+def listTableParts(fpath: Union[str, Path]) -> List[Path]:
+    """
+    Returns the files of a table saved in parts, i.e., a directory named like a table file that holds files of the same format, in order.
+    """
+    fpath = Path(fpath)
+    result = sorted(fpath.glob(f"*{fpath.suffix}"))
+    return result
+
+
+def loadTable(fpath: Union[str, Path],
+              columns: Union[Iterable[str], None] = None) -> pd.DataFrame:
+    """
+    Loads a table saved by `saveTable` with memory mapping, reading only `columns` if they are given. CSV files are read with `pd.read_csv`.
+    A directory named like a Parquet or Feather file is loaded as a table saved in parts, e.g., by incremental runs of "processData.py".
+    """
+    fpath = Path(fpath)
+    columns = list(columns) if columns is not None else None
+    fileFormat = COLUMNAR_FORMATS.get(fpath.suffix.lower())
+    if fileFormat and fpath.is_dir():
+        import pyarrow as pa
+        arrowTables = [readArrowTable(partPath, columns=columns) for partPath in listTableParts(fpath)]
+        nonEmptyTables = [arrowTable for arrowTable in arrowTables if arrowTable.num_rows > 0] or arrowTables[:1]
+        # Parts may have been compacted to different numeric types
+        table = pa.concat_tables(nonEmptyTables, promote_options="permissive").to_pandas()
+    elif fileFormat:
+        table = readArrowTable(fpath, columns=columns).to_pandas()
+    else:
+        table = pd.read_csv(fpath, usecols=columns)
+    return table
+
+
+def loadTableMetadata(fpath: Union[str, Path]) -> dict:
+    """
+    Returns the metadata embedded in a table saved by `saveTable`, or an empty dictionary if there is none.
+    The metadata of a table saved in parts is read from its first part.
+    """
+    fpath = Path(fpath)
+    fileFormat = COLUMNAR_FORMATS.get(fpath.suffix.lower())
+    if fileFormat and fpath.is_dir():
+        partPaths = listTableParts(fpath)
+        return loadTableMetadata(partPaths[0]) if partPaths else {}
+    elif fileFormat == "parquet":
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(fpath, memory_map=True)
+    elif fileFormat == "feather":
+        import pyarrow as pa
+        with pa.memory_map(str(fpath)) as source:
+            schema = pa.ipc.open_file(source).schema
+    else:
+        return {}
+    schemaMetadata = schema.metadata or {}
+    if TABLE_METADATA_KEY in schemaMetadata:
+        result = json.loads(schemaMetadata[TABLE_METADATA_KEY])
+    else:
+        result = {}
+    return result
+
+
+def pairBloodPressure(tableSBP: pd.DataFrame,
+                      tableDBP: pd.DataFrame,
+                      tolerance: pd.Timedelta,
+                      logger: logging.Logger) -> pd.DataFrame:
+    """
+    Matches each systolic reading to the diastolic reading from the same source with the nearest `startDate`, within `tolerance`.
+    Uses a sorted as-of join, and each diastolic reading is paired at most once, to the closest systolic reading.
+    Returns one row per pair, with the columns of the systolic table, including its labels, and the "systolic" and "diastolic" values.
+    Readings that aren't paired are flagged in a "QA: Unpaired" column added to each input table.
+    """
+    left = pd.DataFrame({"sourceName": tableSBP["sourceName"].astype(str).to_numpy(),
+                         "startNanoseconds": datetimesToNanoseconds(tableSBP["startDate"]),
+                         "indexSBP": np.arange(len(tableSBP))})
+    right = pd.DataFrame({"sourceName": tableDBP["sourceName"].astype(str).to_numpy(),
+                          "startNanoseconds": datetimesToNanoseconds(tableDBP["startDate"]),
+                          "indexDBP": np.arange(len(tableDBP))})
+    right["startNanosecondsDBP"] = right["startNanoseconds"]
+    matches = pd.merge_asof(left.sort_values("startNanoseconds"),
+                            right.sort_values("startNanoseconds"),
+                            on="startNanoseconds",
+                            by="sourceName",
+                            direction="nearest",
+                            tolerance=int(pd.Timedelta(tolerance).value))
+    matches = matches.dropna(subset=["indexDBP"])
+    matches["gap"] = (matches["startNanosecondsDBP"] - matches["startNanoseconds"]).abs()
+    matches = matches.sort_values("gap", kind="stable").drop_duplicates(subset="indexDBP", keep="first")
+    matches = matches.sort_values("indexSBP")
+    indexSBP = matches["indexSBP"].to_numpy(dtype=np.int64)
+    indexDBP = matches["indexDBP"].to_numpy(dtype=np.int64)
+
+    pairedTable = tableSBP.iloc[indexSBP].drop(columns=["type", "value"]).reset_index(drop=True)
+    pairedTable["systolic"] = tableSBP["value"].to_numpy()[indexSBP]
+    pairedTable["diastolic"] = tableDBP["value"].to_numpy()[indexDBP]
+
+    for tableName, table, pairedIndex in [("Systolic BP", tableSBP, indexSBP),
+                                          ("Diastolic BP", tableDBP, indexDBP)]:
+        unpaired = np.ones(len(table), dtype=bool)
+        unpaired[pairedIndex] = False
+        table["QA: Unpaired"] = unpaired
+        logger.info(f"""All observations should be paired. Table "{tableName}" has {unpaired.sum()} unpaired observations.""")
+
+    return pairedTable
+
+
+def labelByEventProximity(tablesToProcess: Dict[str, pd.DataFrame],
+                          eventTables: Dict[str, pd.DataFrame],
+                          before: pd.Timedelta,
+                          after: pd.Timedelta,
+                          logger: logging.Logger) -> Dict[str, pd.DataFrame]:
+    """
+    Creates labels for medical records that occurred close to another event, e.g., a workout or a mindful session.
+    `eventTables` maps each label name to a table of events with "startDate" and "endDate" columns. A record is labeled if an event overlaps the span from `before` its start to `after` its end.
+    Events are sorted once, with a running maximum of their end times, so each record is labeled with a single binary search instead of a scan of the events.
+    """
+    beforeNanoseconds = int(pd.Timedelta(before).value)
+    afterNanoseconds = int(pd.Timedelta(after).value)
+    eventIndices = {}
+    for labelName, eventTable in eventTables.items():
+        eventStarts = datetimesToNanoseconds(eventTable["startDate"]) if len(eventTable) > 0 else np.zeros(0, dtype=np.int64)
+        eventEnds = datetimesToNanoseconds(eventTable["endDate"]) if len(eventTable) > 0 else np.zeros(0, dtype=np.int64)
+        order = np.argsort(eventStarts, kind="stable")
+        eventIndices[labelName] = (eventStarts[order], np.maximum.accumulate(eventEnds[order]))
+        logger.info(f"""Indexed {len(order):,} events for label "{labelName}".""")
+
+    for tableName, table in tablesToProcess.items():
+        startNanoseconds = datetimesToNanoseconds(table["startDate"])
+        endNanoseconds = datetimesToNanoseconds(table["endDate"])
+        for labelName, (eventStarts, runningEventEnds) in eventIndices.items():
+            if len(eventStarts) == 0:
+                table[labelName] = False
+                continue
+            # The last event that starts before the window closes is the candidate with the latest end.
+            lastEvent = np.searchsorted(eventStarts, endNanoseconds + afterNanoseconds, side="right") - 1
+            label = (lastEvent >= 0) & (runningEventEnds[np.maximum(lastEvent, 0)] >= startNanoseconds - beforeNanoseconds)
+            table[labelName] = label
+            logger.info(f"""Table "{tableName}" has {label.sum()} observations labeled "{labelName}".""")
+
+    return tablesToProcess
+
+
+def clusterMeasurementSessions(table: pd.DataFrame,
+                               gap: pd.Timedelta,
+                               by: Iterable[str] = ("sourceName",)) -> np.ndarray:
+    """
+    Clusters readings into measurement sessions: back-to-back readings from the same source, each no more than `gap` after the previous one.
+    Uses one sort followed by a difference and cumulative sum. Returns a session number for each row of `table`.
+    """
+    by = list(by)
+    startNanoseconds = datetimesToNanoseconds(table["startDate"])
+    groupCodes = [pd.factorize(table[column].astype(str))[0] for column in by]
+    order = np.lexsort([startNanoseconds] + groupCodes[::-1])
+    sortedStarts = startNanoseconds[order]
+    isNewSession = np.ones(len(table), dtype=bool)
+    isNewSession[1:] = np.diff(sortedStarts) > int(pd.Timedelta(gap).value)
+    for codes in groupCodes:
+        sortedCodes = codes[order]
+        isNewSession[1:] |= sortedCodes[1:] != sortedCodes[:-1]
+    sessions = np.empty(len(table), dtype=np.int64)
+    sessions[order] = np.cumsum(isNewSession) - 1
+    return sessions
+
+
+def computeMeterPrecision(table: pd.DataFrame,
+                          sessionColumn: str = "session",
+                          by: Iterable[str] = ("sourceName",),
+                          valueColumn: str = "value",
+                          confidenceLevel: float = 0.95) -> pd.DataFrame:
+    """
+    Estimates the precision of each meter from the variation of readings within measurement sessions with at least two readings.
+    Returns, for each group in `by`, the pooled within-session variance and standard deviation, the repeatability coefficient (1.96 * √2 times the within-session standard deviation), and their confidence intervals from the chi-squared distribution.
+    """
+    import scipy.stats as sps
+
+    by = list(by)
+    values = table[valueColumn].astype(float)
+    sessionStats = values.groupby([table[column] for column in by] + [table[sessionColumn]], observed=True).agg(["count", "var"])
+    sessionStats = sessionStats[sessionStats["count"] >= 2]
+    sessionStats["sumOfSquares"] = sessionStats["var"] * (sessionStats["count"] - 1)
+    sessionStats["df"] = sessionStats["count"] - 1
+    result = sessionStats.groupby(level=list(range(len(by))), observed=True).agg(nSessions=("count", "size"),
+                                                                                nReadings=("count", "sum"),
+                                                                                sumOfSquares=("sumOfSquares", "sum"),
+                                                                                df=("df", "sum"))
+    result.index.names = by
+    repeatabilityFactor = 1.96 * np.sqrt(2)
+    alpha = 1 - confidenceLevel
+    result["withinSessionVariance"] = result["sumOfSquares"] / result["df"]
+    result["withinSessionSD"] = np.sqrt(result["withinSessionVariance"])
+    result["withinSessionSDLower"] = np.sqrt(result["sumOfSquares"] / sps.chi2.ppf(1 - alpha / 2, result["df"]))
+    result["withinSessionSDUpper"] = np.sqrt(result["sumOfSquares"] / sps.chi2.ppf(alpha / 2, result["df"]))
+    result["repeatabilityCoefficient"] = repeatabilityFactor * result["withinSessionSD"]
+    result["repeatabilityCoefficientLower"] = repeatabilityFactor * result["withinSessionSDLower"]
+    result["repeatabilityCoefficientUpper"] = repeatabilityFactor * result["withinSessionSDUpper"]
+    result = result.drop(columns=["sumOfSquares"]).reset_index()
+    return result
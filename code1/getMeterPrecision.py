@@ -4,101 +4,157 @@ Calculate the precision of the Beur blood pressure meter
 
 import logging
 from pathlib import Path
+from typing import List, Union
 # Third-party packages
-from IPython import get_ipython
 import pandas as pd
 # Local packages
 from drapi.drapi import getTimestamp, successiveParents, make_dir_path
-from appleHealthExport.code.functions import parseExportFile, getRecordTypes, getRecordsByAttributeValue, tabulateRecords
+from code1.functions import clusterMeasurementSessions, computeMeterPrecision, parseTimes
+from code1.parallelIngestion import parseRecordsParallel
 
 # Arguments
 DATA_FILE_PATH = Path("data/input/apple_health_export/export.xml")
 
-PROJECT_DIR_DEPTH = 2
-
-LOG_LEVEL = "INFO"
+STREAMING_INGESTION = True
+PARSE_WORKERS = None  # Processes that parse a streamed export, in chunks. `None` uses all processors, and 1 parses it in this process.
 
-# Settings: Interactive Pyplot
-get_ipython().run_line_magic("matplotlib", "")
+SESSION_GAP = pd.Timedelta(minutes=10)
+SESSION_BY = ["sourceName"]
 
-# Variables: Path construction: General
-runTimestamp = getTimestamp()
-thisFilePath = Path(__file__)
-thisFileStem = thisFilePath.stem
-projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
-dataDir = projectDir.joinpath("data")
-if dataDir:
-    inputDataDir = dataDir.joinpath("input")
-    outputDataDir = dataDir.joinpath("output")
-    if outputDataDir:
-        runOutputDir = outputDataDir.joinpath(thisFileStem, runTimestamp)
-logsDir = projectDir.joinpath("logs")
-if logsDir:
-    runLogsDir = logsDir.joinpath(thisFileStem)
+PROJECT_DIR_DEPTH = 2
 
-# Variables: Path construction: Project-specific
-pass
+LOG_LEVEL = "INFO"
 
-# Variables: Other
-pass
 
-# Directory creation: General
-make_dir_path(runOutputDir)
-make_dir_path(runLogsDir)
+def getMeterPrecision(dataFilePath: Path,
+                      runOutputDir: Path,
+                      streamingIngestion: bool = STREAMING_INGESTION,
+                      parseWorkers: Union[int, None] = PARSE_WORKERS,
+                      sessionGap: pd.Timedelta = SESSION_GAP,
+                      sessionBy: List[str] = SESSION_BY) -> Path:
+    """
+    Estimates the precision of each blood pressure meter in an Apple Health export and saves the results to `runOutputDir`.
+    """
+    # Parse and tabulate blood pressure
+    SBP_RECORD_TYPE = "HKQuantityTypeIdentifierBloodPressureSystolic"
+    DBP_RECORD_TYPE = "HKQuantityTypeIdentifierBloodPressureDiastolic"
+    if streamingIngestion:
+        recordTables = parseRecordsParallel(filePath=dataFilePath,
+                                            recordTypes=[SBP_RECORD_TYPE, DBP_RECORD_TYPE],
+                                            maxWorkers=parseWorkers)
+        dfSBP = recordTables[SBP_RECORD_TYPE]
+        dfDBP = recordTables[DBP_RECORD_TYPE]
+    else:
+        from appleHealthExport.code.functions import parseExportFile, getRecordsByAttributeValue, tabulateRecords
+
+        # Parse data
+        tree = parseExportFile(dataFilePath)
+
+        # Get systolic and diastolic blood pressure records
+        recordsSBP = getRecordsByAttributeValue(tree=tree,
+                                                attribute="type",
+                                                value=SBP_RECORD_TYPE)
+        recordsDBP = getRecordsByAttributeValue(tree=tree,
+                                                attribute="type",
+                                                value=DBP_RECORD_TYPE)
+
+        # Tabulate blood pressure
+        dfSBP = tabulateRecords(records=recordsSBP)
+        dfDBP = tabulateRecords(records=recordsDBP)
 
-# Directory creation: Project-specific
-pass
+    # Analysis pre-processing
+    TABLES_TO_PROCESS = {"Systolic BP": dfSBP,
+                         "Diastolic BP": dfDBP}
+    for tableName, table in TABLES_TO_PROCESS.items():
+        table = parseTimes(pdObject=table)
 
+    # Cluster readings into measurement sessions and estimate the precision of each meter
+    precisionResults = []
+    for tableName, table in TABLES_TO_PROCESS.items():
+        logging.info(f"""  Working on table "{tableName}".""")
+        table["session"] = clusterMeasurementSessions(table=table,
+                                                      gap=sessionGap,
+                                                      by=sessionBy)
+        results = computeMeterPrecision(table=table,
+                                        sessionColumn="session",
+                                        by=sessionBy,
+                                        valueColumn="value")
+        logging.info(f"""  ..  Found {table["session"].nunique():,} measurement sessions in {len(table):,} readings.""")
+        logging.info(f"""  ..  Results summary:\n{results.to_string(index=False)}""")
+        results.insert(0, "table", tableName)
+        precisionResults.append(results)
+    precisionResults = pd.concat(precisionResults, ignore_index=True)
+
+    # Save results
+    precisionResultsPath = runOutputDir.joinpath("precisionResults.CSV")
+    precisionResults.to_csv(precisionResultsPath, index=False)
+
+    return runOutputDir
+
+
+def main(dataFilePath: Path = DATA_FILE_PATH,
+         logLevel: str = LOG_LEVEL,
+         **kwargs) -> Path:
+    """
+    Runs `getMeterPrecision` as a script: creates the run's output and log directories, sets up logging, and logs the run's arguments.
+    Keyword arguments are passed to `getMeterPrecision`.
+    """
+    # Variables: Path construction: General
+    runTimestamp = getTimestamp()
+    thisFilePath = Path(__file__)
+    thisFileStem = thisFilePath.stem
+    projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
+    dataDir = projectDir.joinpath("data")
+    if dataDir:
+        inputDataDir = dataDir.joinpath("input")
+        outputDataDir = dataDir.joinpath("output")
+        if outputDataDir:
+            runOutputDir = outputDataDir.joinpath(thisFileStem, runTimestamp)
+    logsDir = projectDir.joinpath("logs")
+    if logsDir:
+        runLogsDir = logsDir.joinpath(thisFileStem)
+
+    # Directory creation: General
+    make_dir_path(runOutputDir)
+    make_dir_path(runLogsDir)
 
-if __name__ == "__main__":
     # Logging block
     logpath = runLogsDir.joinpath(f"log {runTimestamp}.log")
     fileHandler = logging.FileHandler(logpath)
-    fileHandler.setLevel(LOG_LEVEL)
+    fileHandler.setLevel(logLevel)
     streamHandler = logging.StreamHandler()
-    streamHandler.setLevel(LOG_LEVEL)
+    streamHandler.setLevel(logLevel)
 
     logging.basicConfig(format="[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s",
                         handlers=[fileHandler, streamHandler],
-                        level=LOG_LEVEL)
+                        level=logLevel,
+                        force=True)
 
     logging.info(f"""Begin running "{thisFilePath}".""")
     logging.info(f"""All other paths will be reported in debugging relative to `projectDir`: "{projectDir}".""")
+    stageArguments = "".join(f'\n    `{key}`: "{value}"' for key, value in kwargs.items())
     logging.info(f"""Script arguments:
 
     # Arguments
-    `DATA_FILE_PATH`: "{DATA_FILE_PATH}"
+    `dataFilePath`: "{dataFilePath}"{stageArguments}
 
     # Arguments: General
     `PROJECT_DIR_DEPTH`: "{PROJECT_DIR_DEPTH}"
 
-    `LOG_LEVEL` = "{LOG_LEVEL}"
+    `logLevel` = "{logLevel}"
     """)
 
-    # Parse data
-    tree = parseExportFile(DATA_FILE_PATH)
+    getMeterPrecision(dataFilePath=dataFilePath,
+                      runOutputDir=runOutputDir,
+                      **kwargs)
 
-    # Get record types
-    recordTypes = getRecordTypes(tree=tree)
+    logging.info(f"""All results saved to "{runOutputDir.absolute().relative_to(projectDir)}".""")
 
-    # Get systolic and diastolic blood pressure records
-    recordsSBP = getRecordsByAttributeValue(tree=tree,
-                                            attribute="type",
-                                            value="HKQuantityTypeIdentifierBloodPressureSystolic")
-    recordsDBP = getRecordsByAttributeValue(tree=tree,
-                                            attribute="type",
-                                            value="HKQuantityTypeIdentifierBloodPressureDiastolic")
+    # End script
+    logging.info(f"""Finished running "{thisFilePath.absolute().relative_to(projectDir)}".""")
 
-    # Tabulate blood pressure
-    dfSBP = tabulateRecords(records=recordsSBP)
-    dfDBP = tabulateRecords(records=recordsDBP)
+    return runOutputDir
 
-    # Analysis pre-processing
-    timeColumns = ["creationDate",
-                   "startDate",
-                   "endDate"]
-    TABLES_TO_PROCESS = {"Systolic BP": dfSBP,
-                         "Diastolic BP": dfDBP}
-    for tableName, table in TABLES_TO_PROCESS.items():
-        for column in timeColumns:
-            table[column] = pd.to_datetime(table[column])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+All-pairs comparisons of the outcome between labeled groups, from per-group sufficient statistics.
+"""
+
+from __future__ import annotations
+
+from typing import List, Union
+# Third-party packages
+import numpy as np
+import pandas as pd
+import scipy.stats as sps
+
+CORRECTION_METHODS = ["bonferroni",
+                      "holm",
+                      "fdr_bh"]
+
+
+def summarizeGroups(table: pd.DataFrame,
+                    labelColumns: List[str],
+                    valueColumn: str = "value") -> pd.DataFrame:
+    """
+    Computes the count, sum, and sum of squares of `valueColumn` for each label in a single pass over the table.
+    Returns one row per label, with the mean and sample variance derived from those statistics.
+    """
+    labels = table[labelColumns].to_numpy(dtype=float)
+    values = table[valueColumn].to_numpy(dtype=float)
+    result = pd.DataFrame({"count": labels.sum(axis=0),
+                           "sum": values @ labels,
+                           "sumOfSquares": (values ** 2) @ labels},
+                          index=pd.Index(labelColumns, name="group"))
+    count = result["count"]
+    result["mean"] = result["sum"] / count
+    result["variance"] = (result["sumOfSquares"] - result["sum"] ** 2 / count) / (count - 1)
+    return result
+
+
+def countSharedReadings(table: pd.DataFrame, labelColumns: List[str]) -> pd.DataFrame:
+    """
+    Counts the readings that each pair of labels has in common, e.g., readings taken on a medication in the morning.
+    Returns a square table indexed by label on both axes.
+    """
+    labels = table[labelColumns].to_numpy(dtype=float)
+    result = pd.DataFrame(labels.T @ labels, index=labelColumns, columns=labelColumns).astype(int)
+    return result
+
+
+def adjustPValues(pValues: np.ndarray, method: Union[str, None]) -> np.ndarray:
+    """
+    Adjusts p-values for multiple comparisons with the Bonferroni, Holm, or Benjamini-Hochberg ("fdr_bh") method. Missing p-values are ignored.
+    """
+    pValues = np.asarray(pValues, dtype=float)
+    result = pValues.copy()
+    if method is None:
+        return result
+    if method not in CORRECTION_METHODS:
+        raise Exception(f"""Unexpected correction method "{method}". Expected one of {CORRECTION_METHODS}.""")
+    valid = ~np.isnan(pValues)
+    p = pValues[valid]
+    m = len(p)
+    order = np.argsort(p)
+    if method == "bonferroni":
+        adjusted = p * m
+    elif method == "holm":
+        adjustedSorted = np.maximum.accumulate(p[order] * (m - np.arange(m)))
+        adjusted = np.empty(m)
+        adjusted[order] = adjustedSorted
+    elif method == "fdr_bh":
+        adjustedSorted = np.minimum.accumulate((p[order] * m / np.arange(1, m + 1))[::-1])[::-1]
+        adjusted = np.empty(m)
+        adjusted[order] = adjustedSorted
+    result[valid] = np.minimum(adjusted, 1.0)
+    return result
+
+
+def compareAllPairs(summary: pd.DataFrame,
+                    equalVariance: bool = False,
+                    correction: Union[str, None] = "holm",
+                    alpha: float = 0.05,
+                    sharedReadings: Union[pd.DataFrame, None] = None) -> pd.DataFrame:
+    """
+    Performs t-tests for every pair of groups in `summary`, as returned by `summarizeGroups`.
+    Uses Welch's t-test by default, or Student's t-test if `equalVariance` is true, and adjusts the p-values with `correction`.
+    Pairs of groups that share readings according to `sharedReadings`, as returned by `countSharedReadings`, aren't independent samples, so they are only described: they get no test statistics and are left out of the correction.
+    Returns one row per pair of groups. The t-statistic has the same sign as `scipy.stats.ttest_ind(a=group0, b=group1)`.
+    """
+    i0, i1 = np.triu_indices(len(summary), k=1)
+    if sharedReadings is None:
+        nShared = np.zeros(len(i0), dtype=int)
+    else:
+        nShared = sharedReadings.loc[summary.index, summary.index].to_numpy()[i0, i1]
+    n0 = summary["count"].to_numpy()[i0]
+    n1 = summary["count"].to_numpy()[i1]
+    mean0 = summary["mean"].to_numpy()[i0]
+    mean1 = summary["mean"].to_numpy()[i1]
+    var0 = summary["variance"].to_numpy()[i0]
+    var1 = summary["variance"].to_numpy()[i1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if equalVariance:
+            df = n0 + n1 - 2
+            pooledVariance = ((n0 - 1) * var0 + (n1 - 1) * var1) / df
+            standardError = np.sqrt(pooledVariance * (1 / n0 + 1 / n1))
+        else:
+            a0 = var0 / n0
+            a1 = var1 / n1
+            df = (a0 + a1) ** 2 / (a0 ** 2 / (n0 - 1) + a1 ** 2 / (n1 - 1))
+            standardError = np.sqrt(a0 + a1)
+        tValues = (mean0 - mean1) / standardError
+    tValues = np.where(nShared > 0, np.nan, tValues)
+    df = np.where(nShared > 0, np.nan, df)
+    pValues = 2 * sps.t.sf(np.abs(tValues), df)
+    pValuesAdjusted = adjustPValues(pValues, method=correction)
+    result = pd.DataFrame({"group0": summary.index.to_numpy()[i0],
+                           "group1": summary.index.to_numpy()[i1],
+                           "n0": n0.astype(int),
+                           "n1": n1.astype(int),
+                           "mean0": mean0,
+                           "mean1": mean1,
+                           "meanDifference": mean0 - mean1,
+                           "nShared": nShared,
+                           "tValue": tValues,
+                           "df": df,
+                           "pValue": pValues,
+                           "pValueAdjusted": pValuesAdjusted,
+                           "reject": pValuesAdjusted < alpha})
+    return result
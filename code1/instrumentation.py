@@ -0,0 +1,183 @@
+"""
+Per-stage timing and memory instrumentation for the pipeline scripts.
+
+Each stage records its wall time, CPU time, peak resident set size, and row count. A run's metrics are saved as a JSON file and summarized in the log, so a slow run shows which stage was to blame.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Union
+# Third-party packages
+import pandas as pd
+
+PROFILERS = ["pyinstrument",
+             "cProfile"]
+
+
+def resetPeakRSS() -> bool:
+    """
+    Resets the peak resident set size of this process, so that the next reading is the peak of the next stage. This is only possible on Linux.
+    Returns whether the peak was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peakRSS() -> Union[int, None]:
+    """
+    Returns the peak resident set size of this process, in bytes, since it started or since the last `resetPeakRSS`.
+    """
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # `ru_maxrss` is in bytes on macOS and in kibibytes elsewhere
+    result = peak if sys.platform == "darwin" else peak * 1024
+    return result
+
+
+def cpuTime() -> float:
+    """
+    Returns the CPU time used by this process and by its finished child processes, such as the workers of a process pool.
+    """
+    times = os.times()
+    result = times.user + times.system + times.children_user + times.children_system
+    return result
+
+
+class RunMetrics:
+    """
+    Collects the metrics of each stage of a run.
+
+    ```
+    runMetrics = RunMetrics(runName="processData")
+    with runMetrics.stage("Parse") as stage:
+        table = parse()
+        stage["rows"] = len(table)
+    runMetrics.save(runOutputDir.joinpath("runMetrics.JSON"))
+    runMetrics.logSummary(logger)
+    ```
+
+    If `profiler` is "pyinstrument" (a sampling profiler, which must be installed) or "cProfile", each stage is also profiled and its profile saved to `profileDir`.
+    """
+    def __init__(self,
+                 runName: str,
+                 profiler: Union[str, None] = None,
+                 profileDir: Union[Path, None] = None) -> None:
+        if profiler is not None and profiler not in PROFILERS:
+            raise Exception(f"""Unexpected profiler "{profiler}". Expected one of {PROFILERS}.""")
+        if profiler is not None and profileDir is None:
+            raise Exception("""A `profileDir` is needed to save the profiles.""")
+        self.runName = runName
+        self.profiler = profiler
+        self.profileDir = profileDir
+        self.startTimestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.stages: List[dict] = []
+
+    @contextmanager
+    def stage(self, stageName: str) -> Iterator[dict]:
+        """
+        Measures the code run inside the `with` block. The block can set the stage's row count with `stage["rows"] = ...`.
+        """
+        stageMetrics = {"stage": stageName, "rows": None}
+        peakIsPerStage = resetPeakRSS()
+        profiler = self.startProfiler()
+        wallStart = time.perf_counter()
+        cpuStart = cpuTime()
+        try:
+            yield stageMetrics
+        finally:
+            stageMetrics["wallSeconds"] = time.perf_counter() - wallStart
+            stageMetrics["cpuSeconds"] = cpuTime() - cpuStart
+            stageMetrics["peakRSSBytes"] = peakRSS()
+            stageMetrics["peakRSSIsPerStage"] = peakIsPerStage
+            self.stopProfiler(profiler, stageName)
+            self.stages.append(stageMetrics)
+
+    def startProfiler(self):
+        """
+        Starts the profiler of a stage, if any.
+        """
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+        elif self.profiler == "cProfile":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = None
+        return profiler
+
+    def stopProfiler(self, profiler, stageName: str) -> None:
+        """
+        Stops the profiler of a stage, if any, and saves its profile.
+        """
+        if profiler is None:
+            return
+        self.profileDir.mkdir(parents=True, exist_ok=True)
+        if self.profiler == "pyinstrument":
+            profiler.stop()
+            with open(self.profileDir.joinpath(f"{stageName}.txt"), "w") as file:
+                file.write(profiler.output_text())
+        elif self.profiler == "cProfile":
+            profiler.disable()
+            profiler.dump_stats(self.profileDir.joinpath(f"{stageName}.prof"))
+
+    def summaryTable(self) -> pd.DataFrame:
+        """
+        Returns the metrics as a table, with one row per stage and a total row.
+        """
+        result = pd.DataFrame(self.stages, columns=["stage", "rows", "wallSeconds", "cpuSeconds", "peakRSSBytes"])
+        total = {"stage": "Total",
+                 "rows": None,
+                 "wallSeconds": result["wallSeconds"].sum(),
+                 "cpuSeconds": result["cpuSeconds"].sum(),
+                 "peakRSSBytes": result["peakRSSBytes"].max()}
+        result = pd.concat([result, pd.DataFrame([total])], ignore_index=True)
+        return result
+
+    def save(self, savepath: Path) -> Path:
+        """
+        Saves the metrics as a JSON file.
+        """
+        run = {"runName": self.runName,
+               "startTimestamp": self.startTimestamp,
+               "python": sys.version.split()[0],
+               "pid": os.getpid(),
+               "profiler": self.profiler,
+               "stages": self.stages}
+        with open(savepath, "w") as file:
+            file.write(json.dumps(run, indent=4))
+        return savepath
+
+    def logSummary(self, logger: logging.Logger) -> None:
+        """
+        Logs the metrics as a table.
+        """
+        summary = self.summaryTable()
+        summary["rows"] = summary["rows"].map(lambda rows: "" if pd.isna(rows) else f"{int(rows):,}")
+        summary["wallSeconds"] = summary["wallSeconds"].map("{:.3f}".format)
+        summary["cpuSeconds"] = summary["cpuSeconds"].map("{:.3f}".format)
+        summary["peakRSS (MiB)"] = summary.pop("peakRSSBytes").map(lambda peak: "" if pd.isna(peak) else f"{peak / 2 ** 20:,.1f}")
+        logger.info(f"""Run metrics for "{self.runName}":\n{summary.to_string(index=False)}""")
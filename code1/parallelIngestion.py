@@ -0,0 +1,155 @@
+"""
+Parallel parsing of an Apple Health export.
+
+The export is split into byte ranges that start at top-level `<Record` elements, and each range is parsed by `collectRecords` in its own worker process, so parsing a multi-gigabyte export uses every processor instead of one. The tables of the ranges are concatenated in file order, so the result is the same as that of `streamRecordsByType`.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Union
+# Third-party packages
+import pandas as pd
+# Local packages
+from code1.functions import collectRecords, streamRecordsByType
+
+CHUNK_SIZE_BYTES = 64 * 2 ** 20  # Largest byte range parsed by one task. More, smaller ranges balance the load across workers.
+READ_BLOCK_SIZE = 2 ** 20
+# Top-level records are indented by one space in Apple Health exports, and nested records by more, so this only matches records that are direct children of the root element
+RECORD_BOUNDARY = b"\n <Record "
+ROOT_START_TAG = b"<HealthData>"
+ROOT_END_TAG = b"</HealthData>"
+
+
+def availableProcessors() -> int:
+    """
+    Returns the number of processors this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        result = len(os.sched_getaffinity(0))
+    else:
+        result = os.cpu_count() or 1
+    return result
+
+
+def findRecordBoundary(file, offset: int) -> Union[int, None]:
+    """
+    Returns the position of the first `RECORD_BOUNDARY` at or after `offset` in an open binary file, or `None` if there is none.
+    """
+    position = offset
+    while True:
+        file.seek(position)
+        block = file.read(READ_BLOCK_SIZE)
+        if not block:
+            return None
+        index = block.find(RECORD_BOUNDARY)
+        if index >= 0:
+            return position + index
+        if len(block) < READ_BLOCK_SIZE:
+            return None
+        # Overlap the blocks, so that a boundary split between two blocks is found
+        position += len(block) - len(RECORD_BOUNDARY) + 1
+
+
+def splitExport(filePath: Union[str, Path], numChunks: int) -> List[tuple]:
+    """
+    Splits an export into at most `numChunks` byte ranges of about the same size, each of which, except the first, starts at a top-level `<Record` element.
+    Returns the (start, stop) positions of the ranges, in file order.
+    """
+    fileSize = Path(filePath).stat().st_size
+    boundaries = [0]
+    with open(filePath, "rb") as file:
+        for it in range(1, numChunks):
+            boundary = findRecordBoundary(file, max(it * fileSize // numChunks, boundaries[-1] + 1))
+            if boundary is None:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(fileSize)
+    result = list(zip(boundaries[:-1], boundaries[1:]))
+    return result
+
+
+def chunkEvents(filePath: Union[str, Path],
+                start: int,
+                stop: int,
+                isFirst: bool,
+                isLast: bool) -> Iterator[tuple]:
+    """
+    Parses the byte range [`start`, `stop`) of an export incrementally, and yields its ("start", element) and ("end", element) events.
+    Ranges after the first lack the root start tag and ranges before the last lack the root end tag, so these are added to make each range a document of its own.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    if not isFirst:
+        parser.feed(ROOT_START_TAG)
+    with open(filePath, "rb") as file:
+        file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            block = file.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            parser.feed(block)
+            yield from parser.read_events()
+    if not isLast:
+        parser.feed(ROOT_END_TAG)
+    parser.close()
+    yield from parser.read_events()
+
+
+def parseChunk(task: dict) -> Dict[str, pd.DataFrame]:
+    """
+    Tabulates the records of the requested types in one byte range of an export.
+    """
+    events = chunkEvents(filePath=task["filePath"],
+                         start=task["start"],
+                         stop=task["stop"],
+                         isFirst=task["isFirst"],
+                         isLast=task["isLast"])
+    rows = collectRecords(events=events,
+                          recordTypes=task["recordTypes"],
+                          attributes=task["attributes"])
+    tables = {recordType: pd.DataFrame.from_records(records) for recordType, records in rows.items()}
+    return tables
+
+
+def parseRecordsParallel(filePath: Union[str, Path],
+                         recordTypes: Iterable[str],
+                         attributes: Union[Dict[str, Iterable[str]], None] = None,
+                         maxWorkers: Union[int, None] = None,
+                         chunkSizeBytes: int = CHUNK_SIZE_BYTES) -> Dict[str, pd.DataFrame]:
+    """
+    Tabulates the records of the requested types of an export across a process pool of `maxWorkers` processes, or of all the processors if `maxWorkers` is `None`.
+    Takes the same arguments and returns the same tables as `streamRecordsByType`, which is used instead if there is only one worker or the export is smaller than one chunk.
+    """
+    recordTypes = list(recordTypes)
+    attributes = {recordType: list(keep) for recordType, keep in (attributes or {}).items()}
+    numWorkers = maxWorkers or availableProcessors()
+    fileSize = Path(filePath).stat().st_size
+    # Starting the workers costs more than parsing an export smaller than a chunk
+    numChunks = max(numWorkers, math.ceil(fileSize / chunkSizeBytes)) if numWorkers > 1 and fileSize > chunkSizeBytes else 1
+    chunks = splitExport(filePath, numChunks) if numChunks > 1 else [(0, fileSize)]
+    if len(chunks) == 1:
+        return streamRecordsByType(filePath=filePath, recordTypes=recordTypes, attributes=attributes)
+
+    tasks = [{"filePath": filePath,
+              "start": start,
+              "stop": stop,
+              "isFirst": it == 0,
+              "isLast": it == len(chunks) - 1,
+              "recordTypes": recordTypes,
+              "attributes": attributes} for it, (start, stop) in enumerate(chunks)]
+    with ProcessPoolExecutor(max_workers=min(numWorkers, len(tasks))) as executor:
+        chunkTables = list(executor.map(parseChunk, tasks))
+
+    tables = {}
+    for recordType in recordTypes:
+        parts = [chunk[recordType] for chunk in chunkTables if len(chunk[recordType]) > 0]
+        # A type that isn't in the export gets the empty table of the first range, as `streamRecordsByType` returns
+        tables[recordType] = pd.concat(parts, ignore_index=True) if parts else chunkTables[0][recordType]
+    return tables
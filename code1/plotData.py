@@ -0,0 +1,332 @@
+"""
+Plots of the blood pressure readings saved by "processData.py": time series by medication and by time-of-day group, and systolic against diastolic pressure.
+
+Plots are rendered to PNG or SVG files without a display. Each plotted series is downsampled to at most `MAX_POINTS_PER_SERIES` points, keeping its shape, and dense scatters are drawn as hexagonal bins, so plot time and file size stay flat as the history grows.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Dict, List, Union
+# Third-party packages
+import numpy as np
+import pandas as pd
+# Local packages
+from drapi.drapi import getTimestamp, successiveParents, make_dir_path
+from code1.analyzeData import latestProcessedData, loadProcessedTables
+from code1.functions import datetimesToNanoseconds, loadTable
+from code1.instrumentation import RunMetrics
+
+# Arguments
+DATA_DIRECTORY = None  # `None` uses the latest output of "processData.py", from the stage cache or else from "data/output/processData"
+CACHE_DIR = None  # `None` uses "data/cache" in the project directory
+
+PLOT_FORMAT = "png"  # One of "png" or "svg"
+MAX_POINTS_PER_SERIES = 2000
+DECIMATION_METHOD = "lttb"  # One of "lttb" (largest triangle three buckets) or "minmax"
+HEXBIN_THRESHOLD = 5000  # Scatters with more points than this are drawn as hexagonal bins
+HEXBIN_GRID_SIZE = 60
+FIGURE_DPI = 120
+
+PROFILER = None  # One of "pyinstrument", "cProfile", or `None`
+
+PROJECT_DIR_DEPTH = 2
+
+LOG_LEVEL = "INFO"
+
+PLOT_FORMATS = ["png",
+                "svg"]
+DECIMATION_METHODS = ["lttb",
+                      "minmax"]
+
+
+def minMaxIndices(x: np.ndarray, y: np.ndarray, maxPoints: int) -> np.ndarray:
+    """
+    Downsamples a series sorted by `x` to its first and last points and the lowest and highest point of each of `maxPoints / 2 - 1` equally wide bins of `x`, so that peaks and troughs are kept.
+    Returns the indices of the kept points, in order, which are at most `maxPoints` if it's at least 4.
+    """
+    n = len(x)
+    if n <= maxPoints:
+        return np.arange(n)
+    # Two points per bin, plus the first and last points
+    nBins = max(maxPoints // 2 - 1, 1)
+    x = np.asarray(x, dtype=float)
+    span = x[-1] - x[0]
+    bins = np.zeros(n, dtype=np.int64) if span == 0 else np.minimum(((x - x[0]) / span * nBins).astype(np.int64), nBins - 1)
+    # Within each bin, the first point sorted by value is the lowest and the last is the highest
+    order = np.lexsort((y, bins))
+    sortedBins = bins[order]
+    isFirst = np.r_[True, sortedBins[1:] != sortedBins[:-1]]
+    isLast = np.r_[sortedBins[1:] != sortedBins[:-1], True]
+    result = np.unique(np.concatenate([order[isFirst], order[isLast], [0, n - 1]]))
+    return result
+
+
+def lttbIndices(x: np.ndarray, y: np.ndarray, maxPoints: int) -> np.ndarray:
+    """
+    Downsamples a series sorted by `x` with the largest triangle three buckets (LTTB) algorithm: the first and last points are kept, and from each of `maxPoints - 2` buckets of equal counts, the point that makes the largest triangle with the point kept from the previous bucket and the mean of the next bucket.
+    Returns the indices of the kept points, in order.
+    """
+    n = len(x)
+    if n <= maxPoints or maxPoints < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, maxPoints - 1).astype(np.int64)
+    result = np.empty(maxPoints, dtype=np.int64)
+    result[0] = 0
+    result[-1] = n - 1
+    previous = 0
+    for it in range(maxPoints - 2):
+        start, stop = edges[it], edges[it + 1]
+        nextStart, nextStop = stop, edges[it + 2] if it + 2 < len(edges) else n
+        nextX = x[nextStart:nextStop].mean()
+        nextY = y[nextStart:nextStop].mean()
+        # Twice the area of the triangle made by the previous point, each point of the bucket, and the next bucket's mean
+        areas = np.abs((x[previous] - nextX) * (y[start:stop] - y[previous]) - (x[previous] - x[start:stop]) * (nextY - y[previous]))
+        previous = start + int(np.argmax(areas))
+        result[it + 1] = previous
+    return result
+
+
+def decimate(x: np.ndarray, y: np.ndarray, maxPoints: int, method: str = DECIMATION_METHOD) -> np.ndarray:
+    """
+    Downsamples a series sorted by `x` to at most `maxPoints` points with `method`, one of `DECIMATION_METHODS`. Returns the indices of the kept points.
+    """
+    if method == "lttb":
+        result = lttbIndices(x, y, maxPoints)
+    elif method == "minmax":
+        result = minMaxIndices(x, y, maxPoints)
+    else:
+        raise Exception(f"""Unexpected decimation method "{method}". Expected one of {DECIMATION_METHODS}.""")
+    return result
+
+
+def plotTimeSeries(table: pd.DataFrame,
+                   tableName: str,
+                   labelGroups: Dict[str, List[str]],
+                   savepath: Path,
+                   maxPoints: int = MAX_POINTS_PER_SERIES,
+                   method: str = DECIMATION_METHOD,
+                   dpi: int = FIGURE_DPI) -> int:
+    """
+    Plots the readings of a table over time, with one panel for each group of labels in `labelGroups`, e.g., {"Medications": [...], "Time Groups": [...]}, and one downsampled series for each label.
+    Returns the number of plotted points.
+    """
+    from matplotlib.figure import Figure
+
+    nanoseconds = datetimesToNanoseconds(table["startDate"])
+    order = np.argsort(nanoseconds, kind="stable")
+    nanoseconds = nanoseconds[order]
+    values = table["value"].to_numpy(dtype=float)[order]
+
+    figure = Figure(figsize=(12, 3.5 * len(labelGroups)), layout="constrained")
+    axes = figure.subplots(nrows=len(labelGroups), ncols=1, sharex=True, squeeze=False)[:, 0]
+    plottedPoints = 0
+    for axis, (panelName, labels) in zip(axes, labelGroups.items()):
+        for label in labels:
+            inGroup = table[label].to_numpy(dtype=bool)[order]
+            if not inGroup.any():
+                continue
+            kept = decimate(nanoseconds[inGroup], values[inGroup], maxPoints=maxPoints, method=method)
+            axis.plot(nanoseconds[inGroup][kept].astype("datetime64[ns]"),
+                      values[inGroup][kept],
+                      marker=".",
+                      markersize=2,
+                      linewidth=0.6,
+                      label=f"{label} (n = {inGroup.sum():,})")
+            plottedPoints += len(kept)
+        axis.set_title(panelName)
+        axis.set_ylabel(f"{tableName} (mmHg)")
+        axis.grid(alpha=0.3)
+        if axis.has_data():
+            axis.legend(loc="upper left", fontsize="small")
+    axes[-1].set_xlabel("Date (UTC)")
+    figure.suptitle(f"{tableName} over time")
+    figure.savefig(savepath, dpi=dpi)
+    return plottedPoints
+
+
+def plotSystolicDiastolic(pairedTable: pd.DataFrame,
+                          savepath: Path,
+                          hexbinThreshold: int = HEXBIN_THRESHOLD,
+                          gridSize: int = HEXBIN_GRID_SIZE,
+                          dpi: int = FIGURE_DPI) -> str:
+    """
+    Plots systolic against diastolic pressure of paired readings: as a scatter, or as hexagonal bins on a logarithmic color scale if there are more than `hexbinThreshold` pairs.
+    Returns the kind of plot, "scatter" or "hexbin".
+    """
+    from matplotlib.figure import Figure
+
+    systolic = pairedTable["systolic"].to_numpy(dtype=float)
+    diastolic = pairedTable["diastolic"].to_numpy(dtype=float)
+    figure = Figure(figsize=(7, 6), layout="constrained")
+    axis = figure.subplots()
+    if len(systolic) > hexbinThreshold:
+        kind = "hexbin"
+        bins = axis.hexbin(diastolic, systolic, gridsize=gridSize, bins="log", mincnt=1, cmap="viridis")
+        figure.colorbar(bins, ax=axis, label="Readings")
+    else:
+        kind = "scatter"
+        axis.scatter(diastolic, systolic, s=6, alpha=0.5, linewidths=0)
+    correlation = np.corrcoef(diastolic, systolic)[0, 1] if len(systolic) > 1 else np.nan
+    axis.set_title(f"Systolic vs. diastolic pressure (n = {len(systolic):,}, r = {correlation:.2f})")
+    axis.set_xlabel("Diastolic BP (mmHg)")
+    axis.set_ylabel("Systolic BP (mmHg)")
+    axis.grid(alpha=0.3)
+    figure.savefig(savepath, dpi=dpi)
+    return kind
+
+
+def plotData(dataDirectory: Path,
+             runOutputDir: Path,
+             logger: logging.Logger,
+             plotFormat: str = PLOT_FORMAT,
+             maxPoints: int = MAX_POINTS_PER_SERIES,
+             decimationMethod: str = DECIMATION_METHOD,
+             hexbinThreshold: int = HEXBIN_THRESHOLD,
+             hexbinGridSize: int = HEXBIN_GRID_SIZE,
+             dpi: int = FIGURE_DPI,
+             profiler: Union[str, None] = PROFILER) -> Path:
+    """
+    Plots the tables saved by "processData.py" in `dataDirectory` and saves the plots to "`runOutputDir`/plots".
+    The metrics of each stage are saved to "runMetrics.JSON" in `runOutputDir`.
+    """
+    if plotFormat not in PLOT_FORMATS:
+        raise Exception(f"""Unexpected plot format "{plotFormat}". Expected one of {PLOT_FORMATS}.""")
+    runMetrics = RunMetrics(runName="plotData",
+                            profiler=profiler,
+                            profileDir=runOutputDir.joinpath("profiles"))
+    plotsDir = runOutputDir.joinpath("plots")
+    make_dir_path(plotsDir)
+
+    with runMetrics.stage("Load tables") as stage:
+        tablesToProcess, allMedications, allGroups = loadProcessedTables(dataDirectory)
+        pairedPaths = sorted(dataDirectory.joinpath("pairedTables").glob("Paired BP.*"))
+        pairedTable = loadTable(pairedPaths[0], columns=["systolic", "diastolic"]) if pairedPaths else None
+        stage["rows"] = sum(len(table) for table in tablesToProcess.values())
+
+    labelGroups = {"Medications": allMedications,
+                   "Time Groups": allGroups}
+    with runMetrics.stage("Time series plots") as stage:
+        plottedPoints = 0
+        for tableName, table in tablesToProcess.items():
+            savepath = plotsDir.joinpath(f"{tableName} over time.{plotFormat}")
+            points = plotTimeSeries(table=table,
+                                    tableName=tableName,
+                                    labelGroups=labelGroups,
+                                    savepath=savepath,
+                                    maxPoints=maxPoints,
+                                    method=decimationMethod,
+                                    dpi=dpi)
+            plottedPoints += points
+            logger.info(f"""  Plotted {points:,} points for {len(table):,} readings of "{tableName}" to "{savepath.name}".""")
+        stage["rows"] = sum(len(table) for table in tablesToProcess.values())
+
+    with runMetrics.stage("Scatter plot") as stage:
+        if pairedTable is None:
+            logger.warning(f"""No paired readings found in "{dataDirectory}". The systolic vs. diastolic plot is skipped.""")
+        else:
+            savepath = plotsDir.joinpath(f"Systolic vs diastolic.{plotFormat}")
+            kind = plotSystolicDiastolic(pairedTable=pairedTable,
+                                         savepath=savepath,
+                                         hexbinThreshold=hexbinThreshold,
+                                         gridSize=hexbinGridSize,
+                                         dpi=dpi)
+            logger.info(f"""  Plotted {len(pairedTable):,} paired readings as a {kind} to "{savepath.name}".""")
+            stage["rows"] = len(pairedTable)
+
+    # Save and summarize run metrics
+    runMetrics.save(runOutputDir.joinpath("runMetrics.JSON"))
+    runMetrics.logSummary(logger)
+
+    return plotsDir
+
+
+def main(dataDirectory: Union[Path, None] = DATA_DIRECTORY,
+         cacheDir: Union[Path, None] = CACHE_DIR,
+         logLevel: str = LOG_LEVEL,
+         **kwargs) -> Path:
+    """
+    Runs `plotData` as a script: creates the run's output and log directories, sets up logging, and logs the run's arguments.
+    If `dataDirectory` is `None`, the latest output of "processData.py" is plotted.
+    Keyword arguments are passed to `plotData`.
+    """
+    # Variables: Path construction: General
+    runTimestamp = getTimestamp()
+    thisFilePath = Path(__file__)
+    thisFileStem = thisFilePath.stem
+    projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
+    dataDir = projectDir.joinpath("data")
+    if dataDir:
+        outputDataDir = dataDir.joinpath("output")
+        if outputDataDir:
+            runOutputDir = outputDataDir.joinpath(thisFileStem, runTimestamp)
+    logsDir = projectDir.joinpath("logs")
+    if logsDir:
+        runLogsDir = logsDir.joinpath(thisFileStem)
+
+    if cacheDir is None:
+        cacheDir = dataDir.joinpath("cache")
+    if dataDirectory is None:
+        dataDirectory = latestProcessedData(cacheDir=cacheDir,
+                                            processDataOutputDir=outputDataDir.joinpath("processData"))
+
+    # Directory creation: General
+    make_dir_path(runOutputDir)
+    make_dir_path(runLogsDir)
+
+    # Logging block
+    logpath = runLogsDir.joinpath(f"log {runTimestamp}.log")
+    logFormat = logging.Formatter("""[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s""")
+
+    logger = logging.getLogger(__name__)
+
+    fileHandler = logging.FileHandler(logpath)
+    fileHandler.setLevel(9)
+    fileHandler.setFormatter(logFormat)
+
+    streamHandler = logging.StreamHandler()
+    streamHandler.setLevel(logLevel)
+    streamHandler.setFormatter(logFormat)
+
+    logger.addHandler(fileHandler)
+    logger.addHandler(streamHandler)
+
+    logger.setLevel(9)
+
+    logger.info(f"""Begin running "{thisFilePath}".""")
+    logger.info(f"""All other paths will be reported in debugging relative to `projectDir`: "{projectDir}".""")
+    stageArguments = "".join(f'\n    `{key}`: "{value}"' for key, value in kwargs.items())
+    logger.info(f"""Script arguments:
+
+    # Arguments
+    `dataDirectory`: "{dataDirectory}"{stageArguments}
+
+    # Arguments: General
+    `PROJECT_DIR_DEPTH`: "{PROJECT_DIR_DEPTH}"
+
+    `logLevel` = "{logLevel}"
+    """)
+
+    try:
+        plotData(dataDirectory=dataDirectory,
+                 runOutputDir=runOutputDir,
+                 logger=logger,
+                 **kwargs)
+
+        logger.info(f"""All results saved to "{runOutputDir.absolute().relative_to(projectDir)}".""")
+
+        # End script
+        logger.info(f"""Finished running "{thisFilePath.absolute().relative_to(projectDir)}".""")
+    finally:
+        logger.removeHandler(fileHandler)
+        logger.removeHandler(streamHandler)
+        fileHandler.close()
+
+    return runOutputDir
+
+
+if __name__ == "__main__":
+    main()
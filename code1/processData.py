@@ -1,191 +1,453 @@
 """
-Loads and processes data, adding flags, and saves it to a CSV file.
+Loads and processes data, adding flags, and saves it to a CSV, Parquet, or Feather file.
 """
 
-import datetime
+import inspect
+import json
 import logging
-from datetime import datetime as dt
 from pathlib import Path
+from typing import Dict, Union
 # Third-party packages
-from IPython import get_ipython
-import json
+import numpy as np
 import pandas as pd
 # Local packages
 from drapi.drapi import getTimestamp, successiveParents, make_dir_path
-from appleHealthExport.code.functions import parseExportFile, getRecordTypes, getRecordsByAttributeValue, tabulateRecords, time2ordinal
-from code1.functions import parseTimes, labelByDatetimeSpan
+from code1.functions import compactTable, datetimesToNanoseconds, loadTable, parseTimes, labelByDatetimeSpan, labelByEventProximity, labelByTimeOfDay, pairBloodPressure, saveTable
+from code1.instrumentation import RunMetrics
+from code1.parallelIngestion import parseRecordsParallel
+from code1.recordStore import (appendToStore,
+                               earliestChangedEvent,
+                               findLabeledTail,
+                               labeledTablePath,
+                               labelSettingsHash,
+                               linkLabeledTable,
+                               loadLabeledManifest,
+                               loadLabeledParts,
+                               loadLocalMinutes,
+                               loadUnlabeledRecords,
+                               loadWatermarks,
+                               saveWatermarks,
+                               selectNewRecords,
+                               updateLabeledStore)
+from code1.stageCache import CACHE_MAX_AGE_DAYS, CACHE_MAX_BYTES, codeVersion, evictCache, hashFile, runCached
+from code1.timeOfDayClusters import discoverTimeWindows
 
 # Arguments
 DATA_FILE_PATH = Path("data/input/apple_health_export/export.xml")
 
-PROJECT_DIR_DEPTH = 2
-
-LOG_LEVEL = "INFO"
-
-# Settings: Interactive Pyplot
-get_ipython().run_line_magic("matplotlib", "")
-
-# Variables: Path construction: General
-runTimestamp = getTimestamp()
-thisFilePath = Path(__file__)
-thisFileStem = thisFilePath.stem
-projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
-dataDir = projectDir.joinpath("data")
-if dataDir:
-    inputDataDir = dataDir.joinpath("input")
-    outputDataDir = dataDir.joinpath("output")
-    if outputDataDir:
-        runOutputDir = outputDataDir.joinpath(thisFileStem, runTimestamp)
-logsDir = projectDir.joinpath("logs")
-if logsDir:
-    runLogsDir = logsDir.joinpath(thisFileStem)
-
-# Variables: Path construction: Project-specific
-pass
-
-# Variables: Other
-pass
-
-# Directory creation: General
-make_dir_path(runOutputDir)
-make_dir_path(runLogsDir)
+STREAMING_INGESTION = True
+PARSE_WORKERS = None  # Processes that parse a streamed export, in chunks. `None` uses all processors, and 1 parses it in this process.
 
-# Directory creation: Project-specific
-pass
+OUTPUT_FORMAT = "parquet"  # One of "CSV", "parquet", or "feather"
 
-# Logging block
-logpath = runLogsDir.joinpath(f"log {runTimestamp}.log")
-# logFormat = logging.Formatter(f"""[%(asctime)s]\n[%(levelname)s](%(funcName)s)\n{"-"*24}> %(message)s""")
-logFormat = logging.Formatter("""[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s""")
+KEEP_DEVICE = False  # Keep the long device descriptions of the blood pressure records
 
-logger = logging.getLogger(__name__)
+# Only label and pair the records created since the last incremental run, and the stored readings they can affect. The outputs hold the whole history in the store.
+INCREMENTAL = False
+STORE_DIR = Path("data/store")
 
-fileHandler = logging.FileHandler(logpath)
-fileHandler.setLevel(9)
-fileHandler.setFormatter(logFormat)
+# Medication periods. A stop of `None` means the medication is ongoing.
+MEDICATION_DATETIMES = {"Amlodapine Potassium": {"start": "2023-04-26 15:04:00-04:00",
+                                                 "stop": "2023-06-11 02:28:00-04:00"},
+                        "Losartan Potassium": {"start": "2023-06-11 02:28:00-04:00",
+                                               "stop": None}}
 
-streamHandler = logging.StreamHandler()
-streamHandler.setLevel(LOG_LEVEL)
-streamHandler.setFormatter(logFormat)
+# Time-of-day groups. Windows whose start is later than their stop wrap past midnight.
+GROUP_TIMES = {"Group 1 (Morning)": {"start": "03:00:00-04:00",
+                                     "stop": "12:00:00-04:00"},
+               "Group 2 (Evening)": {"start": "12:00:00-04:00",
+                                     "stop": "03:00:00-04:00"}}
 
-logger.addHandler(fileHandler)
-logger.addHandler(streamHandler)
+# Find the time-of-day groups from the readings instead of using `GROUP_TIMES`. Incremental runs find them from the whole history in the store.
+DISCOVER_TIME_GROUPS = False
+MAX_TIME_GROUPS = 4
 
-logger.setLevel(9)
+PAIRING_TOLERANCE = pd.Timedelta(seconds=60)
 
-if __name__ == "__main__":
-    logger.info(f"""Begin running "{thisFilePath}".""")
-    logger.info(f"""All other paths will be reported in debugging relative to `projectDir`: "{projectDir}".""")
-    logger.info(f"""Script arguments:
-
-    # Arguments
-    `DATA_FILE_PATH`: "{DATA_FILE_PATH}"
-
-    # Arguments: General
-    `PROJECT_DIR_DEPTH`: "{PROJECT_DIR_DEPTH}"
+# Label names and the record type or element tag of the events they refer to
+PROXIMITY_EVENTS = {"Near Workout": "Workout",
+                    "Near Mindful Session": "HKCategoryTypeIdentifierMindfulSession"}
+PROXIMITY_BEFORE = pd.Timedelta(minutes=30)
+PROXIMITY_AFTER = pd.Timedelta(minutes=30)
 
-    `LOG_LEVEL` = "{LOG_LEVEL}"
-    """)
+PROFILER = None  # One of "pyinstrument", "cProfile", or `None`
 
-    # Parse data
-    tree = parseExportFile(DATA_FILE_PATH)
+USE_CACHE = True
+CACHE_DIR = None  # `None` uses "data/cache" in the project directory
 
-    # Get record types
-    recordTypes = getRecordTypes(tree=tree)
+PROJECT_DIR_DEPTH = 2
 
-    # Get systolic and diastolic blood pressure records
-    recordsSBP = getRecordsByAttributeValue(tree=tree,
-                                            attribute="type",
-                                            value="HKQuantityTypeIdentifierBloodPressureSystolic")
-    recordsDBP = getRecordsByAttributeValue(tree=tree,
-                                            attribute="type",
-                                            value="HKQuantityTypeIdentifierBloodPressureDiastolic")
+LOG_LEVEL = "INFO"
 
-    # Tabulate blood pressure
-    dfSBP = tabulateRecords(records=recordsSBP)
-    dfDBP = tabulateRecords(records=recordsDBP)
+# Arguments of `processData` that don't change its output, or that are only known at run time
+UNCACHED_ARGUMENTS = ["dataFilePath",
+                      "runOutputDir",
+                      "logger",
+                      "parseWorkers",
+                      "profiler"]
+
+
+def processData(dataFilePath: Path,
+                runOutputDir: Path,
+                logger: logging.Logger,
+                medicationDatetimes: Dict[str, Dict[str, Union[str, None]]] = MEDICATION_DATETIMES,
+                groupTimes: Dict[str, Dict[str, str]] = GROUP_TIMES,
+                discoverTimeGroups: bool = DISCOVER_TIME_GROUPS,
+                maxTimeGroups: int = MAX_TIME_GROUPS,
+                streamingIngestion: bool = STREAMING_INGESTION,
+                parseWorkers: Union[int, None] = PARSE_WORKERS,
+                outputFormat: str = OUTPUT_FORMAT,
+                incremental: bool = INCREMENTAL,
+                storeDir: Path = STORE_DIR,
+                pairingTolerance: pd.Timedelta = PAIRING_TOLERANCE,
+                proximityEvents: Dict[str, str] = PROXIMITY_EVENTS,
+                proximityBefore: pd.Timedelta = PROXIMITY_BEFORE,
+                proximityAfter: pd.Timedelta = PROXIMITY_AFTER,
+                keepDevice: bool = KEEP_DEVICE,
+                profiler: Union[str, None] = PROFILER) -> Path:
+    """
+    Processes the blood pressure records of an Apple Health export and saves the labeled tables to `runOutputDir`.
+    The metrics of each stage are saved to "runMetrics.JSON" in `runOutputDir`.
+    """
+    runMetrics = RunMetrics(runName="processData",
+                            profiler=profiler,
+                            profileDir=runOutputDir.joinpath("profiles"))
+
+    # Parse and tabulate blood pressure
+    SBP_RECORD_TYPE = "HKQuantityTypeIdentifierBloodPressureSystolic"
+    DBP_RECORD_TYPE = "HKQuantityTypeIdentifierBloodPressureDiastolic"
+    with runMetrics.stage("Parse") as stage:
+        if streamingIngestion:
+            eventAttributes = {eventType: ["startDate", "endDate"] for eventType in proximityEvents.values()}
+            recordTables = parseRecordsParallel(filePath=dataFilePath,
+                                                recordTypes=[SBP_RECORD_TYPE, DBP_RECORD_TYPE] + list(eventAttributes.keys()),
+                                                attributes=eventAttributes,
+                                                maxWorkers=parseWorkers)
+            dfSBP = recordTables[SBP_RECORD_TYPE]
+            dfDBP = recordTables[DBP_RECORD_TYPE]
+            eventTables = {labelName: recordTables[eventType] for labelName, eventType in proximityEvents.items()}
+        else:
+            from appleHealthExport.code.functions import parseExportFile, getRecordsByAttributeValue, tabulateRecords
+
+            # Parse data
+            tree = parseExportFile(dataFilePath)
+
+            # Get systolic and diastolic blood pressure records
+            recordsSBP = getRecordsByAttributeValue(tree=tree,
+                                                    attribute="type",
+                                                    value=SBP_RECORD_TYPE)
+            recordsDBP = getRecordsByAttributeValue(tree=tree,
+                                                    attribute="type",
+                                                    value=DBP_RECORD_TYPE)
+
+            # Tabulate blood pressure
+            dfSBP = tabulateRecords(records=recordsSBP)
+            dfDBP = tabulateRecords(records=recordsDBP)
+
+            # Get and tabulate reference events
+            eventTables = {}
+            for labelName, eventType in proximityEvents.items():
+                if eventType.startswith("HK"):
+                    eventRecords = getRecordsByAttributeValue(tree=tree,
+                                                              attribute="type",
+                                                              value=eventType)
+                else:
+                    eventRecords = tree.getroot().findall(eventType)
+                eventTables[labelName] = tabulateRecords(records=eventRecords)
+        stage["rows"] = len(dfSBP) + len(dfDBP) + sum(len(table) for table in eventTables.values())
 
     # Analysis pre-processing
     TABLES_TO_PROCESS = {"Systolic BP": dfSBP,
                          "Diastolic BP": dfDBP}
-    for tableName, table in TABLES_TO_PROCESS.items():
-        table = parseTimes(pdObject=table)
-
-    # Identify groups by medication start and end times.
-    AMLODAPINE_START_DATETIME = pd.to_datetime("2023-04-26 15:04:00-04:00")
-    AMLODAPINE_STOP_DATETIME = pd.to_datetime("2023-06-11 02:28:00-04:00")
-    LOSARTAN_START_DATETIME = pd.to_datetime("2023-06-11 02:28:00-04:00")
-    LOSARTAN_STOP_DATETIME = pd.to_datetime(dt.now())
-    MEDICATION_DATETIMES = {"Amlodapine Potassium": {"start": AMLODAPINE_START_DATETIME,
-                                                     "stop": AMLODAPINE_STOP_DATETIME},
-                            "Losartan Potassium": {"start": LOSARTAN_START_DATETIME,
-                                                   "stop": LOSARTAN_STOP_DATETIME}}
-
-    TABLES_TO_PROCESS, qaTables = labelByDatetimeSpan(tablesToProcess=TABLES_TO_PROCESS,
-                                                      labelDatetimes=MEDICATION_DATETIMES,
-                                                      troubleshooting=True,
-                                                      logger=logger)
+    with runMetrics.stage("Compact dtypes") as stage:
+        # Times are parsed by `parseTimes`, which also keeps each record's local offset and minute of the day
+        TABLES_TO_PROCESS = {tableName: compactTable(table=table, keepDevice=keepDevice, convertTimes=False) for tableName, table in TABLES_TO_PROCESS.items()}
+        stage["rows"] = sum(len(table) for table in TABLES_TO_PROCESS.values())
+    if incremental:
+        # Only records created after the store's watermarks are processed
+        with runMetrics.stage("Select new records") as stage:
+            watermarks = loadWatermarks(storeDir=storeDir)
+            TABLES_TO_PROCESS = {tableName: selectNewRecords(table=table, watermarks=watermarks) for tableName, table in TABLES_TO_PROCESS.items()}
+            for tableName, table in TABLES_TO_PROCESS.items():
+                logger.info(f"""Table "{tableName}" has {len(table):,} records newer than the store's watermark.""")
+            stage["rows"] = sum(len(table) for table in TABLES_TO_PROCESS.values())
+    with runMetrics.stage("Parse times") as stage:
+        for tableName, table in TABLES_TO_PROCESS.items():
+            table = parseTimes(pdObject=table)
+        stage["rows"] = sum(len(table) for table in TABLES_TO_PROCESS.values())
+
+    # Append the new, unlabeled records to the store
+    if incremental:
+        with runMetrics.stage("Update store") as stage:
+            for tableName, table in TABLES_TO_PROCESS.items():
+                watermarks = appendToStore(storeDir=storeDir,
+                                           tableName=tableName,
+                                           table=table,
+                                           watermarks=watermarks,
+                                           logger=logger)
+            saveWatermarks(storeDir=storeDir, watermarks=watermarks)
+            # Records that an interrupted run appended but didn't label are labeled now
+            manifest = loadLabeledManifest(storeDir=storeDir)
+            newTables = {tableName: compactTable(table=loadUnlabeledRecords(storeDir=storeDir, tableName=tableName, manifest=manifest, schema=table),
+                                                 keepDevice=keepDevice,
+                                                 convertTimes=False) for tableName, table in TABLES_TO_PROCESS.items()}
+            stage["rows"] = sum(len(table) for table in newTables.values())
 
     # Identify subgroups by time of day
-    GROUP_1_START_TIME = pd.to_datetime("03:00:00-04:00")
-    GROUP_1_STOP_TIME = pd.to_datetime("12:00:00-04:00")
-    GROUP_2_START_TIME = pd.to_datetime("12:00:00-04:00")
-    GROUP_2_STOP_TIME = pd.to_datetime("03:00:00-04:00")
-    GROUP_TIMES = {"Group 1 (Morning)": {"start": GROUP_1_START_TIME,
-                                         "stop": GROUP_1_STOP_TIME},
-                   "Group 2 (Evening)": {"start": GROUP_2_START_TIME,
-                                         "stop": GROUP_2_STOP_TIME}}
-
-    midnight1 = datetime.datetime(2023, 7, 9, 23, 59, 59, (10**6) - 1).time()
-    midnight2 = datetime.datetime(2023, 7, 9, 0, 0, 0, 0).time()
-    m1 = time2ordinal(midnight1)
-    m2 = time2ordinal(midnight2)
-    for tableName, table in TABLES_TO_PROCESS.items():
-        for group, timeDict in GROUP_TIMES.items():
-            startTime = timeDict["start"]
-            stopTime = timeDict["stop"]
-            t0 = time2ordinal(startTime)
-            t1 = time2ordinal(stopTime)
-            startDateOrdinal = table["startDate"].apply(lambda ts: time2ordinal(ts))
-            endDateOrdinal = table["endDate"].apply(lambda ts: time2ordinal(ts))
-            if t0 > t1:
-                pass  # TODO
-                flagStartTime1 = (t0 <= startDateOrdinal) & (startDateOrdinal <= m1)
-                flagStartTime2 = (m2 <= startDateOrdinal) & (startDateOrdinal <= t1)
-                flagEndTime1 = (t0 < endDateOrdinal) & (endDateOrdinal <= m1)
-                flagEndTime2 = (m2 <= endDateOrdinal) & (endDateOrdinal < t1)
-                flagGroup = (flagStartTime1 | flagStartTime2) & (flagEndTime1 | flagEndTime2)
+    if discoverTimeGroups:
+        with runMetrics.stage("Discover time groups") as stage:
+            # Incremental runs find the windows from the whole history, from the store's count of readings at each minute of the day, so they aren't fit to the few new readings
+            if incremental:
+                localMinutes = np.concatenate([loadLocalMinutes(storeDir=storeDir, tableName=tableName) for tableName in TABLES_TO_PROCESS.keys()])
             else:
-                flagStartTime = (t0 <= startDateOrdinal) & (startDateOrdinal <= t1)
-                flagEndTime = (t0 < endDateOrdinal) & (endDateOrdinal < t1)
-                flagGroup = flagStartTime & flagEndTime
-            table[group] = flagGroup
+                localMinutes = np.concatenate([table["startDateLocalMinute"].to_numpy() for table in TABLES_TO_PROCESS.values()])
+            groupTimes = discoverTimeWindows(localMinutes=localMinutes,
+                                             maxWindows=maxTimeGroups)
+            logger.info(f"""Found {len(groupTimes)} time-of-day groups from {len(localMinutes):,} readings: {groupTimes}.""")
+            stage["rows"] = len(localMinutes)
+
+    # Incremental runs label the new records and the labeled parts whose labels or pairs they can change, unless the labeling settings changed
+    if incremental:
+        with runMetrics.stage("Select labeled parts") as stage:
+            settingsHash = labelSettingsHash({"medicationDatetimes": medicationDatetimes,
+                                              "groupTimes": groupTimes,
+                                              "proximityEvents": proximityEvents,
+                                              "proximityBefore": proximityBefore,
+                                              "proximityAfter": proximityAfter,
+                                              "pairingTolerance": pairingTolerance,
+                                              "keepDevice": keepDevice,
+                                              "codeVersion": codeVersion()})
+            if manifest is None or manifest["settingsHash"] != settingsHash:
+                logger.info("""The labeling settings changed since the last incremental run, or there are no labeled records yet. Labeling the whole history in the store.""")
+                firstPart = 0
+                TABLES_TO_PROCESS = {tableName: compactTable(table=loadUnlabeledRecords(storeDir=storeDir, tableName=tableName, manifest=None, schema=table),
+                                                             keepDevice=keepDevice,
+                                                             convertTimes=False) for tableName, table in TABLES_TO_PROCESS.items()}
+            else:
+                newStarts = np.concatenate([datetimesToNanoseconds(table["startDate"]) for table in newTables.values()])
+                firstPart = findLabeledTail(manifest=manifest,
+                                            firstNewStart=int(newStarts.min()) if len(newStarts) > 0 else None,
+                                            firstChangedEvent=earliestChangedEvent(storeDir=storeDir, eventTables=eventTables),
+                                            pairingTolerance=pairingTolerance,
+                                            proximityAfter=proximityAfter)
+                logger.info(f"""Labeling the new records and {len(manifest["parts"]) - firstPart:,} of {len(manifest["parts"]):,} labeled parts.""")
+                tailTables = loadLabeledParts(storeDir=storeDir,
+                                              manifest=manifest,
+                                              firstPart=firstPart,
+                                              tableNames=newTables.keys(),
+                                              schemas=newTables)
+                TABLES_TO_PROCESS = {}
+                for tableName, newTable in newTables.items():
+                    table = pd.concat([table for table in [tailTables[tableName], newTable] if len(table) > 0] or [newTable], ignore_index=True)
+                    TABLES_TO_PROCESS[tableName] = compactTable(table=table, keepDevice=keepDevice, convertTimes=False)
+            stage["rows"] = sum(len(table) for table in TABLES_TO_PROCESS.values())
 
-        # Perform QA
-        allGroups = [group for group in GROUP_TIMES.keys()]
-        table["QA: Unassigned (Groups)"] = ~table[allGroups].any()
-        logger.info(f"""All observations should be assigned to a group. The current table has {table["QA: Unassigned (Groups)"].sum()} unassigned observations.""")
+    # Identify groups by medication start and end times.
+    with runMetrics.stage("Label medications") as stage:
+        TABLES_TO_PROCESS, qaTables = labelByDatetimeSpan(tablesToProcess=TABLES_TO_PROCESS,
+                                                          labelDatetimes=medicationDatetimes,
+                                                          troubleshooting=True,
+                                                          logger=logger)
+        stage["rows"] = sum(len(table) for table in TABLES_TO_PROCESS.values())
+
+    with runMetrics.stage("Label time of day") as stage:
+        TABLES_TO_PROCESS = labelByTimeOfDay(tablesToProcess=TABLES_TO_PROCESS,
+                                             timeWindows=groupTimes,
+                                             logger=logger)
+        stage["rows"] = sum(len(table) for table in TABLES_TO_PROCESS.values())
+    allGroups = [group for group in groupTimes.keys()]
+
+    # Identify observations close to other events
+    with runMetrics.stage("Label event proximity") as stage:
+        TABLES_TO_PROCESS = labelByEventProximity(tablesToProcess=TABLES_TO_PROCESS,
+                                                  eventTables=eventTables,
+                                                  before=proximityBefore,
+                                                  after=proximityAfter,
+                                                  logger=logger)
+        stage["rows"] = sum(len(table) for table in TABLES_TO_PROCESS.values())
+    allProximityLabels = [labelName for labelName in proximityEvents.keys()]
+
+    # Pair systolic and diastolic readings
+    with runMetrics.stage("Pair readings") as stage:
+        pairedTable = pairBloodPressure(tableSBP=TABLES_TO_PROCESS["Systolic BP"],
+                                        tableDBP=TABLES_TO_PROCESS["Diastolic BP"],
+                                        tolerance=pairingTolerance,
+                                        logger=logger)
+        stage["rows"] = len(pairedTable)
 
     # Save tables
-    tablesDir = runOutputDir.joinpath("tablesToProcess")
-    make_dir_path(tablesDir)
-    for tableName, table in TABLES_TO_PROCESS.items():
-        savepath = tablesDir.joinpath(f"{tableName}.CSV")
-        table.to_csv(savepath, index=False)
+    with runMetrics.stage("Save") as stage:
+        tablesDir = runOutputDir.joinpath("tablesToProcess")
+        make_dir_path(tablesDir)
+        tableMetadata = {"allGroups": allGroups,
+                         "groupTimes": groupTimes,
+                         "allMedications": qaTables,
+                         "allProximityLabels": allProximityLabels}
+        if incremental:
+            # The labeled store holds the whole history. Its parts are linked into Parquet outputs, and outputs in other formats are written from it.
+            manifest = updateLabeledStore(storeDir=storeDir,
+                                          manifest=manifest,
+                                          firstPart=firstPart,
+                                          tables={**TABLES_TO_PROCESS, "Paired BP": pairedTable},
+                                          settingsHash=settingsHash,
+                                          eventTables=eventTables,
+                                          pairingTolerance=pairingTolerance,
+                                          metadata=tableMetadata,
+                                          logger=logger)
+        pairedTablesDir = runOutputDir.joinpath("pairedTables")
+        make_dir_path(pairedTablesDir)
+        outputDirs = {tableName: tablesDir for tableName in TABLES_TO_PROCESS.keys()}
+        outputDirs["Paired BP"] = pairedTablesDir
+        outputTables = {**TABLES_TO_PROCESS, "Paired BP": pairedTable}
+        for tableName, table in outputTables.items():
+            if outputFormat.lower() == "csv":
+                savepath = outputDirs[tableName].joinpath(f"{tableName}.CSV")
+            else:
+                savepath = outputDirs[tableName].joinpath(f"{tableName}.{outputFormat.lower()}")
+            if incremental and outputFormat.lower() == "parquet":
+                linkLabeledTable(storeDir=storeDir, manifest=manifest, tableName=tableName, savepath=savepath)
+            else:
+                if incremental:
+                    table = loadTable(labeledTablePath(storeDir=storeDir, tableName=tableName))
+                if outputFormat.lower() == "csv":
+                    table.to_csv(savepath, index=False)
+                else:
+                    saveTable(table=table,
+                              savepath=savepath,
+                              metadata=tableMetadata)
+
+        # Save group and medication objects
+        jsonDir = runOutputDir.joinpath("jsonDir")
+        make_dir_path(jsonDir)
+
+        groupsPath = jsonDir.joinpath("allGroups.JSON")
+        with open(groupsPath, "w") as file:
+            file.write(json.dumps(allGroups))
+
+        groupTimesPath = jsonDir.joinpath("groupTimes.JSON")
+        with open(groupTimesPath, "w") as file:
+            file.write(json.dumps(groupTimes))
+
+        qaTablesPath = jsonDir.joinpath("qaTables.JSON")
+        with open(qaTablesPath, "w") as file:
+            file.write(json.dumps(qaTables))
+
+        medicationsPath = jsonDir.joinpath("allMedications.JSON")
+        with open(medicationsPath, "w") as file:
+            file.write(json.dumps(qaTables))
+        stage["rows"] = sum(len(table) for table in TABLES_TO_PROCESS.values()) + len(pairedTable)
+
+    # Save and summarize run metrics
+    runMetrics.save(runOutputDir.joinpath("runMetrics.JSON"))
+    runMetrics.logSummary(logger)
+
+    return runOutputDir
+
+
+def main(dataFilePath: Path = DATA_FILE_PATH,
+         logLevel: str = LOG_LEVEL,
+         useCache: bool = USE_CACHE,
+         cacheDir: Union[Path, None] = CACHE_DIR,
+         **kwargs) -> Path:
+    """
+    Runs `processData` as a script: creates the run's output and log directories, sets up logging, and logs the run's arguments.
+    If `useCache` is true, the output is saved to, or reused from, the stage cache in `cacheDir`, unless the run is incremental.
+    Keyword arguments are passed to `processData`.
+    """
+    # Variables: Path construction: General
+    runTimestamp = getTimestamp()
+    thisFilePath = Path(__file__)
+    thisFileStem = thisFilePath.stem
+    projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
+    dataDir = projectDir.joinpath("data")
+    if dataDir:
+        inputDataDir = dataDir.joinpath("input")
+        outputDataDir = dataDir.joinpath("output")
+        if outputDataDir:
+            runOutputDir = outputDataDir.joinpath(thisFileStem, runTimestamp)
+    logsDir = projectDir.joinpath("logs")
+    if logsDir:
+        runLogsDir = logsDir.joinpath(thisFileStem)
+
+    if cacheDir is None:
+        cacheDir = dataDir.joinpath("cache")
+
+    # Directory creation: General
+    make_dir_path(runLogsDir)
+
+    # Logging block
+    logpath = runLogsDir.joinpath(f"log {runTimestamp}.log")
+    logFormat = logging.Formatter("""[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s""")
+
+    logger = logging.getLogger(__name__)
+
+    fileHandler = logging.FileHandler(logpath)
+    fileHandler.setLevel(9)
+    fileHandler.setFormatter(logFormat)
+
+    streamHandler = logging.StreamHandler()
+    streamHandler.setLevel(logLevel)
+    streamHandler.setFormatter(logFormat)
+
+    logger.addHandler(fileHandler)
+    logger.addHandler(streamHandler)
+
+    logger.setLevel(9)
 
-    # Save group and medication objects
-    jsonDir = runOutputDir.joinpath("jsonDir")
-    make_dir_path(jsonDir)
+    logger.info(f"""Begin running "{thisFilePath}".""")
+    logger.info(f"""All other paths will be reported in debugging relative to `projectDir`: "{projectDir}".""")
+    stageArguments = "".join(f'\n    `{key}`: "{value}"' for key, value in kwargs.items())
+    logger.info(f"""Script arguments:
 
-    groupsPath = jsonDir.joinpath("allGroups.JSON")
-    with open(groupsPath, "w") as file:
-        file.write(json.dumps(allGroups))
+    # Arguments
+    `dataFilePath`: "{dataFilePath}"{stageArguments}
+    `useCache`: "{useCache}"
+    `cacheDir`: "{cacheDir}"
 
-    qaTablesPath = jsonDir.joinpath("qaTables.JSON")
-    with open(qaTablesPath, "w") as file:
-        file.write(json.dumps(qaTables))
+    # Arguments: General
+    `PROJECT_DIR_DEPTH`: "{PROJECT_DIR_DEPTH}"
 
-    logger.info(f"""All results saved to "{runOutputDir.absolute().relative_to(projectDir)}".""")
+    `logLevel` = "{logLevel}"
+    """)
+
+    try:
+        if useCache and not kwargs.get("incremental", INCREMENTAL):
+            # The output only depends on the export, the arguments, and the code, so unchanged reruns reuse it
+            arguments = inspect.signature(processData).bind(dataFilePath=dataFilePath, runOutputDir=None, logger=None, **kwargs)
+            arguments.apply_defaults()
+            parameters = {key: value for key, value in arguments.arguments.items() if key not in UNCACHED_ARGUMENTS}
+            runOutputDir = runCached(stageName=thisFileStem,
+                                     inputHashes=[hashFile(dataFilePath, cacheDir=cacheDir)],
+                                     parameters=parameters,
+                                     cacheDir=cacheDir,
+                                     run=lambda outputDir: processData(dataFilePath=dataFilePath,
+                                                                       runOutputDir=outputDir,
+                                                                       logger=logger,
+                                                                       **kwargs),
+                                     logger=logger)
+            evictCache(cacheDir=cacheDir,
+                       maxBytes=CACHE_MAX_BYTES,
+                       maxAgeDays=CACHE_MAX_AGE_DAYS,
+                       logger=logger,
+                       keep=[runOutputDir])
+        else:
+            make_dir_path(runOutputDir)
+            processData(dataFilePath=dataFilePath,
+                        runOutputDir=runOutputDir,
+                        logger=logger,
+                        **kwargs)
+
+        logger.info(f"""All results saved to "{runOutputDir.absolute()}".""")
+
+        # End script
+        logger.info(f"""Finished running "{thisFilePath.absolute().relative_to(projectDir)}".""")
+    finally:
+        logger.removeHandler(fileHandler)
+        logger.removeHandler(streamHandler)
+        fileHandler.close()
+
+    return runOutputDir
 
-    # End script
-    logger.info(f"""Finished running "{thisFilePath.absolute().relative_to(projectDir)}".""")
+
+if __name__ == "__main__":
+    main()
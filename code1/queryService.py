@@ -0,0 +1,561 @@
+"""
+Local HTTP service that answers questions about processed blood pressure data without rerunning "analyzeData.py".
+
+The tables saved by "processData.py" are loaded once and kept in memory. Results are kept in a least-recently-used cache, which is emptied whenever new data is loaded. Requests are answered concurrently, each by its own thread.
+
+    GET  /groups                                              Tables, medications, and time groups
+    GET  /summary?table=Systolic BP&label=Losartan Potassium&label=Group 1 (Morning)&start=2023-01-01
+                                                              Statistics of the readings with all the given labels
+    GET  /compare?table=Systolic BP&testGroup=Time Groups&welch=true&correction=holm
+                                                              t-tests between every pair of groups
+    GET  /status                                              Data directory, data version, and cache statistics
+    POST /ingest                                              Loads new data: the JSON body's "dataDirectory", or else the latest output of "processData.py"
+
+If the service follows the latest output of "processData.py", new outputs are also picked up automatically.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List, Union
+from urllib.parse import parse_qs, urlsplit
+# Third-party packages
+import numpy as np
+import pandas as pd
+# Local packages
+from drapi.drapi import getTimestamp, successiveParents, make_dir_path
+from code1.analyzeData import latestProcessedData, loadProcessedTables
+from code1.groupComparisons import CORRECTION_METHODS, compareAllPairs, countSharedReadings, summarizeGroups
+
+# Arguments
+DATA_DIRECTORY = None  # `None` follows the latest output of "processData.py"
+CACHE_DIR = None  # `None` uses "data/cache" in the project directory
+
+HOST = "127.0.0.1"
+PORT = 8765
+RESULT_CACHE_SIZE = 256  # Number of query results kept in memory
+REFRESH_INTERVAL_SECONDS = 5.0  # How often to look for a newer output of "processData.py", when following the latest one
+
+PROJECT_DIR_DEPTH = 2
+
+LOG_LEVEL = "INFO"
+
+TEST_GROUP_NAMES = ["Medications",
+                    "Time Groups",
+                    "Medications and Time Groups"]
+
+
+class QueryError(Exception):
+    """
+    A query that can't be answered because of its parameters, e.g., an unknown table or label.
+    """
+
+
+class ResultCache:
+    """
+    A thread-safe least-recently-used cache of query results.
+    """
+    def __init__(self, maxSize: int) -> None:
+        self.maxSize = maxSize
+        self.results: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute: Callable[[], object]):
+        """
+        Returns the cached result of `key`, or computes, caches, and returns it.
+        The result is computed outside the lock, so that a slow query doesn't block the others.
+        """
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.hits += 1
+                return self.results[key]
+            self.misses += 1
+        result = compute()
+        with self.lock:
+            self.results[key] = result
+            self.results.move_to_end(key)
+            while len(self.results) > self.maxSize:
+                self.results.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        """
+        Removes all the cached results.
+        """
+        with self.lock:
+            self.results.clear()
+
+    def statistics(self) -> dict:
+        """
+        Returns the size, hits, and misses of the cache.
+        """
+        with self.lock:
+            result = {"size": len(self.results),
+                      "maxSize": self.maxSize,
+                      "hits": self.hits,
+                      "misses": self.misses}
+        return result
+
+
+def dataFingerprint(dataDirectory: Path) -> tuple:
+    """
+    Returns the names, sizes, and modification times of the table files in a data directory, including the parts of tables saved in parts, which change when its data changes.
+    """
+    tablesDirectory = dataDirectory.joinpath("tablesToProcess")
+    result = tuple((str(fpath.relative_to(tablesDirectory)), fpath.stat().st_size, fpath.stat().st_mtime_ns) for fpath in sorted(tablesDirectory.rglob("*")) if fpath.is_file())
+    return result
+
+
+def jsonValue(value):
+    """
+    Converts NumPy and pandas values to values that `json` can serialize. Missing values become `None`.
+    """
+    if isinstance(value, dict):
+        return {key: jsonValue(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonValue(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+class QueryService:
+    """
+    The processed tables of one data directory, and the queries answered from them.
+
+    Loaded data is never modified: new data replaces the whole snapshot under a lock, so each query sees the data of a single version.
+    """
+    def __init__(self,
+                 dataDirectory: Union[Path, None],
+                 cacheDir: Path,
+                 processDataOutputDir: Path,
+                 logger: logging.Logger,
+                 resultCacheSize: int = RESULT_CACHE_SIZE,
+                 refreshIntervalSeconds: float = REFRESH_INTERVAL_SECONDS) -> None:
+        self.followLatest = True
+        self.cacheDir = cacheDir
+        self.processDataOutputDir = processDataOutputDir
+        self.logger = logger
+        self.refreshIntervalSeconds = refreshIntervalSeconds
+        self.resultCache = ResultCache(maxSize=resultCacheSize)
+        self.lock = threading.Lock()
+        self.version = 0
+        self.snapshot = None
+        self.lastRefresh = 0.0
+        self.ingest(dataDirectory)
+
+    def resolveDataDirectory(self, dataDirectory: Union[Path, None]) -> Path:
+        """
+        Returns `dataDirectory`, or the latest output of "processData.py" if it's `None`.
+        """
+        if dataDirectory is not None:
+            return Path(dataDirectory)
+        result = latestProcessedData(cacheDir=self.cacheDir, processDataOutputDir=self.processDataOutputDir)
+        return result
+
+    def ingest(self, dataDirectory: Union[Path, None] = None) -> dict:
+        """
+        Loads the tables of `dataDirectory`, or of the latest output of "processData.py", and empties the result cache.
+        """
+        # The tables are loaded outside the lock, so that queries are answered from the old data in the meantime
+        followLatest = dataDirectory is None
+        dataDirectory = self.resolveDataDirectory(dataDirectory)
+        fingerprint = dataFingerprint(dataDirectory)
+        tablesToProcess, allMedications, allGroups = loadProcessedTables(dataDirectory)
+        with self.lock:
+            self.followLatest = followLatest
+            self.version += 1
+            self.snapshot = {"version": self.version,
+                             "dataDirectory": dataDirectory,
+                             "fingerprint": fingerprint,
+                             "tables": tablesToProcess,
+                             "allMedications": allMedications,
+                             "allGroups": allGroups}
+            self.lastRefresh = time.monotonic()
+            self.resultCache.clear()
+            self.logger.info(f"""Loaded version {self.version} of the data from "{dataDirectory}": {sum(len(table) for table in tablesToProcess.values()):,} readings.""")
+        return self.status()
+
+    def refreshIfChanged(self) -> None:
+        """
+        Loads the data again if its tables changed or, when following the latest output of "processData.py", if there is a newer one. Checks at most once every `refreshIntervalSeconds`.
+        """
+        with self.lock:
+            if time.monotonic() - self.lastRefresh < self.refreshIntervalSeconds:
+                return
+            self.lastRefresh = time.monotonic()
+            snapshot = self.snapshot
+            followLatest = self.followLatest
+        dataDirectory = self.resolveDataDirectory(None) if followLatest else snapshot["dataDirectory"]
+        if dataDirectory != snapshot["dataDirectory"] or dataFingerprint(dataDirectory) != snapshot["fingerprint"]:
+            self.ingest(None if followLatest else dataDirectory)
+
+    def current(self) -> dict:
+        """
+        Returns the current snapshot of the data.
+        """
+        self.refreshIfChanged()
+        with self.lock:
+            result = self.snapshot
+        return result
+
+    def status(self) -> dict:
+        """
+        Returns the data directory, the data version, and the result cache's statistics.
+        """
+        with self.lock:
+            snapshot = self.snapshot
+        result = {"dataDirectory": str(snapshot["dataDirectory"]),
+                  "version": snapshot["version"],
+                  "followLatest": self.followLatest,
+                  "readings": {tableName: len(table) for tableName, table in snapshot["tables"].items()},
+                  "resultCache": self.resultCache.statistics()}
+        return result
+
+    def table(self, snapshot: dict, tableName: Union[str, None]) -> pd.DataFrame:
+        """
+        Returns a table of a snapshot by name.
+        """
+        if tableName not in snapshot["tables"]:
+            raise QueryError(f"""Unknown table "{tableName}". Expected one of {list(snapshot["tables"].keys())}.""")
+        result = snapshot["tables"][tableName]
+        return result
+
+    def checkLabels(self, snapshot: dict, labels: List[str]) -> None:
+        """
+        Checks that each label is a medication or time group of a snapshot.
+        """
+        knownLabels = snapshot["allMedications"] + snapshot["allGroups"]
+        unknownLabels = [label for label in labels if label not in knownLabels]
+        if unknownLabels:
+            raise QueryError(f"""Unknown labels {unknownLabels}. Expected some of {knownLabels}.""")
+
+    def groups(self) -> dict:
+        """
+        Returns the tables, medications, and time groups that can be queried.
+        """
+        snapshot = self.current()
+        result = {"version": snapshot["version"],
+                  "tables": list(snapshot["tables"].keys()),
+                  "medications": snapshot["allMedications"],
+                  "timeGroups": snapshot["allGroups"],
+                  "testGroups": TEST_GROUP_NAMES}
+        return result
+
+    def summary(self,
+                tableName: str,
+                labels: List[str],
+                start: Union[str, None] = None,
+                stop: Union[str, None] = None) -> dict:
+        """
+        Returns the count, mean, standard deviation, and quantiles of the readings of a table that have all of `labels`, e.g., SBP readings on a medication in the morning, optionally between `start` and `stop`.
+        """
+        snapshot = self.current()
+        key = ("summary", snapshot["version"], tableName, tuple(sorted(labels)), start, stop)
+        return self.resultCache.get(key, lambda: self.computeSummary(snapshot, tableName, labels, start, stop))
+
+    def computeSummary(self,
+                       snapshot: dict,
+                       tableName: str,
+                       labels: List[str],
+                       start: Union[str, None],
+                       stop: Union[str, None]) -> dict:
+        """
+        Computes `summary` on a snapshot.
+        """
+        table = self.table(snapshot, tableName)
+        self.checkLabels(snapshot, labels)
+        mask = np.ones(len(table), dtype=bool)
+        for label in labels:
+            mask &= table[label].to_numpy(dtype=bool)
+        if start is not None:
+            mask &= (table["startDate"] >= utcTimestamp(start)).to_numpy()
+        if stop is not None:
+            mask &= (table["startDate"] < utcTimestamp(stop)).to_numpy()
+        values = table["value"].to_numpy(dtype=float)[mask]
+        result = {"version": snapshot["version"],
+                  "table": tableName,
+                  "labels": labels,
+                  "start": start,
+                  "stop": stop,
+                  "count": len(values)}
+        if len(values) > 0:
+            quantiles = np.quantile(values, [0.25, 0.5, 0.75])
+            result.update({"mean": values.mean(),
+                           "std": values.std(ddof=1) if len(values) > 1 else None,
+                           "min": values.min(),
+                           "q25": quantiles[0],
+                           "median": quantiles[1],
+                           "q75": quantiles[2],
+                           "max": values.max()})
+        return jsonValue(result)
+
+    def compare(self,
+                tableName: str,
+                labels: List[str],
+                testGroup: Union[str, None] = None,
+                equalVariance: bool = False,
+                correction: Union[str, None] = "holm") -> dict:
+        """
+        Performs t-tests between every pair of groups of a table, given as `labels` or as a `testGroup` of "analyzeData.py", e.g., "Time Groups".
+        """
+        snapshot = self.current()
+        key = ("compare", snapshot["version"], tableName, tuple(labels), testGroup, equalVariance, correction)
+        return self.resultCache.get(key, lambda: self.computeComparison(snapshot, tableName, labels, testGroup, equalVariance, correction))
+
+    def computeComparison(self,
+                          snapshot: dict,
+                          tableName: str,
+                          labels: List[str],
+                          testGroup: Union[str, None],
+                          equalVariance: bool,
+                          correction: Union[str, None]) -> dict:
+        """
+        Computes `compare` on a snapshot.
+        """
+        table = self.table(snapshot, tableName)
+        testGroups = {"Medications": snapshot["allMedications"],
+                      "Time Groups": snapshot["allGroups"],
+                      "Medications and Time Groups": snapshot["allMedications"] + snapshot["allGroups"]}
+        if testGroup is not None:
+            if testGroup not in testGroups:
+                raise QueryError(f"""Unknown test group "{testGroup}". Expected one of {TEST_GROUP_NAMES}.""")
+            labels = labels + [label for label in testGroups[testGroup] if label not in labels]
+        self.checkLabels(snapshot, labels)
+        if len(labels) < 2:
+            raise QueryError("""At least two groups are needed to compare them.""")
+        if correction is not None and correction not in CORRECTION_METHODS:
+            raise QueryError(f"""Unexpected correction method "{correction}". Expected one of {CORRECTION_METHODS}.""")
+        groupSummary = summarizeGroups(table=table,
+                                       labelColumns=labels,
+                                       valueColumn="value")
+        sharedReadings = countSharedReadings(table=table,
+                                             labelColumns=labels)
+        comparisons = compareAllPairs(summary=groupSummary,
+                                      equalVariance=equalVariance,
+                                      correction=correction,
+                                      sharedReadings=sharedReadings)
+        result = {"version": snapshot["version"],
+                  "table": tableName,
+                  "groups": labels,
+                  "equalVariance": equalVariance,
+                  "correction": correction,
+                  "comparisons": comparisons.to_dict(orient="records")}
+        return jsonValue(result)
+
+
+def utcTimestamp(value: str) -> pd.Timestamp:
+    """
+    Parses a date query parameter, e.g., "2023-01-01" or "2023-01-01 08:00:00-04:00". Dates without a time zone are taken as UTC.
+    """
+    try:
+        result = pd.Timestamp(value)
+    except ValueError as error:
+        raise QueryError(f"""Unexpected date "{value}": {error}""")
+    result = result.tz_localize("UTC") if result.tz is None else result.tz_convert("UTC")
+    return result
+
+
+def booleanParameter(value: Union[str, None], default: bool) -> bool:
+    """
+    Parses a boolean query parameter, e.g., "true" or "0".
+    """
+    if value is None:
+        return default
+    if value.lower() in ["1", "true", "yes"]:
+        return True
+    if value.lower() in ["0", "false", "no"]:
+        return False
+    raise QueryError(f"""Unexpected boolean "{value}".""")
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers the HTTP requests of a `QueryService`, which is set as the `service` attribute of the server.
+    """
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        parameters = parse_qs(url.query)
+
+        def one(name: str) -> Union[str, None]:
+            values = parameters.get(name)
+            return values[-1] if values else None
+
+        service: QueryService = self.server.service
+        routes = {"/groups": lambda: service.groups(),
+                  "/status": lambda: service.status(),
+                  "/summary": lambda: service.summary(tableName=one("table"),
+                                                      labels=parameters.get("label", []),
+                                                      start=one("start"),
+                                                      stop=one("stop")),
+                  "/compare": lambda: service.compare(tableName=one("table"),
+                                                      labels=parameters.get("label", []),
+                                                      testGroup=one("testGroup"),
+                                                      equalVariance=not booleanParameter(one("welch"), default=True),
+                                                      correction=None if one("correction") == "none" else one("correction") or "holm")}
+        self.respond(routes.get(url.path))
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        service: QueryService = self.server.service
+
+        def ingest() -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length > 0 else {}
+            dataDirectory = body.get("dataDirectory")
+            return service.ingest(None if dataDirectory is None else Path(dataDirectory))
+
+        routes = {"/ingest": ingest}
+        self.respond(routes.get(url.path))
+
+    def respond(self, route: Union[Callable[[], dict], None]) -> None:
+        """
+        Sends the result of a route as JSON, or an error.
+        """
+        if route is None:
+            status, result = HTTPStatus.NOT_FOUND, {"error": f"""Unknown path "{self.path}"."""}
+        else:
+            try:
+                status, result = HTTPStatus.OK, route()
+            except QueryError as error:
+                status, result = HTTPStatus.BAD_REQUEST, {"error": str(error)}
+            except Exception as error:
+                self.server.service.logger.exception(f"""Error answering "{self.path}".""")
+                status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(error).__name__}: {error}"}
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        self.server.service.logger.debug(f"""{self.address_string()} {format % args}""")
+
+
+def createServer(service: QueryService, host: str = HOST, port: int = PORT) -> ThreadingHTTPServer:
+    """
+    Creates the HTTP server of a `QueryService`. Call `serve_forever` on it to answer requests, and `shutdown` from another thread to stop it.
+    """
+    result = ThreadingHTTPServer((host, port), QueryRequestHandler)
+    result.daemon_threads = True
+    result.service = service
+    return result
+
+
+def serve(dataDirectory: Union[Path, None],
+          cacheDir: Path,
+          processDataOutputDir: Path,
+          logger: logging.Logger,
+          host: str = HOST,
+          port: int = PORT,
+          resultCacheSize: int = RESULT_CACHE_SIZE,
+          refreshIntervalSeconds: float = REFRESH_INTERVAL_SECONDS) -> None:
+    """
+    Loads the processed tables and answers queries about them until interrupted.
+    """
+    service = QueryService(dataDirectory=dataDirectory,
+                           cacheDir=cacheDir,
+                           processDataOutputDir=processDataOutputDir,
+                           logger=logger,
+                           resultCacheSize=resultCacheSize,
+                           refreshIntervalSeconds=refreshIntervalSeconds)
+    server = createServer(service=service, host=host, port=port)
+    logger.info(f"""Answering queries at "http://{host}:{server.server_port}".""")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("""Stopped by the user.""")
+    finally:
+        server.server_close()
+
+
+def main(dataDirectory: Union[Path, None] = DATA_DIRECTORY,
+         cacheDir: Union[Path, None] = CACHE_DIR,
+         logLevel: str = LOG_LEVEL,
+         **kwargs) -> None:
+    """
+    Runs `serve` as a script: creates the log directory, sets up logging, and logs the run's arguments.
+    Keyword arguments are passed to `serve`.
+    """
+    # Variables: Path construction: General
+    runTimestamp = getTimestamp()
+    thisFilePath = Path(__file__)
+    thisFileStem = thisFilePath.stem
+    projectDir, _ = successiveParents(thisFilePath.absolute(), PROJECT_DIR_DEPTH)
+    dataDir = projectDir.joinpath("data")
+    if dataDir:
+        outputDataDir = dataDir.joinpath("output")
+    logsDir = projectDir.joinpath("logs")
+    if logsDir:
+        runLogsDir = logsDir.joinpath(thisFileStem)
+    if cacheDir is None:
+        cacheDir = dataDir.joinpath("cache")
+
+    # Directory creation: General
+    make_dir_path(runLogsDir)
+
+    # Logging block
+    logpath = runLogsDir.joinpath(f"log {runTimestamp}.log")
+    logFormat = logging.Formatter("""[%(asctime)s][%(levelname)s](%(funcName)s): %(message)s""")
+
+    logger = logging.getLogger(__name__)
+
+    fileHandler = logging.FileHandler(logpath)
+    fileHandler.setLevel(9)
+    fileHandler.setFormatter(logFormat)
+
+    streamHandler = logging.StreamHandler()
+    streamHandler.setLevel(logLevel)
+    streamHandler.setFormatter(logFormat)
+
+    logger.addHandler(fileHandler)
+    logger.addHandler(streamHandler)
+
+    logger.setLevel(9)
+
+    logger.info(f"""Begin running "{thisFilePath}".""")
+    stageArguments = "".join(f'\n    `{key}`: "{value}"' for key, value in kwargs.items())
+    logger.info(f"""Script arguments:
+
+    # Arguments
+    `dataDirectory`: "{dataDirectory}"
+    `cacheDir`: "{cacheDir}"{stageArguments}
+
+    # Arguments: General
+    `PROJECT_DIR_DEPTH`: "{PROJECT_DIR_DEPTH}"
+
+    `logLevel` = "{logLevel}"
+    """)
+
+    try:
+        serve(dataDirectory=dataDirectory,
+              cacheDir=cacheDir,
+              processDataOutputDir=outputDataDir.joinpath("processData"),
+              logger=logger,
+              **kwargs)
+
+        # End script
+        logger.info(f"""Finished running "{thisFilePath.absolute().relative_to(projectDir)}".""")
+    finally:
+        logger.removeHandler(fileHandler)
+        logger.removeHandler(streamHandler)
+        fileHandler.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""
+A persistent store of processed records, for incremental re-processing of Apple Health exports.
+
+Each table is kept as a sequence of Parquet parts, one per run that added records, and the store keeps a watermark of the last `creationDate` seen for each record type.
+Records are stored parsed but unlabeled, so that the whole history can be labeled again when the labeling settings change. New records are deduplicated against an index of the hashed keys of the stored records, and the store counts the readings at each local minute of the day, so that neither needs the stored parts to be read.
+
+The labeled tables are kept separately, as time-ordered parts that only start after a gap longer than the pairing tolerance, so that readings in different parts are never paired. An incremental run only labels and pairs the new records and the parts from the earliest one they can affect onward, and replaces those parts.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Union
+# Third-party packages
+import numpy as np
+import pandas as pd
+# Local packages
+from code1.functions import MINUTES_PER_DAY, datetimesToNanoseconds, loadTable, saveTable
+
+STORE_KEY_COLUMNS = ["type",
+                     "startDate",
+                     "sourceName"]
+WATERMARKS_FILE_NAME = "watermarks.JSON"
+KEY_INDEX_FILE_NAME = "keys.npy"
+MINUTE_COUNTS_FILE_NAME = "localMinuteCounts.npy"
+
+LABELED_DIR_NAME = "labeled"
+LABELED_MANIFEST_FILE_NAME = "manifest.JSON"
+EVENTS_FILE_NAME = "events.npz"
+LABELED_PART_ROWS = 100_000  # A new labeled part is started at the first gap after this many readings
+
+
+def loadWatermarks(storeDir: Union[str, Path]) -> Dict[str, str]:
+    """
+    Returns the last `creationDate` stored for each record type, as ISO-formatted UTC timestamps.
+    """
+    watermarksPath = Path(storeDir).joinpath(WATERMARKS_FILE_NAME)
+    if watermarksPath.exists():
+        with open(watermarksPath, "r") as file:
+            watermarks = json.loads(file.read())
+    else:
+        watermarks = {}
+    return watermarks
+
+
+def saveWatermarks(storeDir: Union[str, Path], watermarks: Dict[str, str]) -> None:
+    """
+    Saves the watermarks returned by `appendToStore`.
+    """
+    watermarksPath = Path(storeDir).joinpath(WATERMARKS_FILE_NAME)
+    with open(watermarksPath, "w") as file:
+        file.write(json.dumps(watermarks, indent=4))
+
+
+def selectNewRecords(table: pd.DataFrame, watermarks: Dict[str, str]) -> pd.DataFrame:
+    """
+    Returns the records of `table` created after the watermark of their record type.
+    """
+    if len(table) == 0:
+        return table
+    creationNanoseconds = datetimesToNanoseconds(table["creationDate"])
+    recordTypes, typeCodes = np.unique(table["type"].astype(str).to_numpy(), return_inverse=True)
+    typeThresholds = np.full(len(recordTypes), np.iinfo(np.int64).min, dtype=np.int64)
+    for it, recordType in enumerate(recordTypes):
+        if recordType in watermarks:
+            typeThresholds[it] = datetimesToNanoseconds([watermarks[recordType]])[0]
+    mask = creationNanoseconds > typeThresholds[typeCodes]
+    result = table[mask].reset_index(drop=True)
+    return result
+
+
+def listStoreParts(storeDir: Union[str, Path], tableName: str) -> list:
+    """
+    Returns the paths of a table's parts, in the order they were appended.
+    """
+    tableDir = Path(storeDir).joinpath(tableName)
+    if tableDir.exists():
+        result = sorted(tableDir.glob("part *.parquet"))
+    else:
+        result = []
+    return result
+
+
+def storeKeys(table: pd.DataFrame) -> pd.MultiIndex:
+    """
+    Returns the (type, startDate, sourceName) key of each record, with `startDate` in UTC nanoseconds.
+    """
+    result = pd.MultiIndex.from_arrays([table["type"].astype(str).to_numpy(),
+                                        datetimesToNanoseconds(table["startDate"]),
+                                        table["sourceName"].astype(str).to_numpy()],
+                                       names=STORE_KEY_COLUMNS)
+    return result
+
+
+def hashKeys(table: pd.DataFrame) -> np.ndarray:
+    """
+    Returns a 64-bit hash of the (type, startDate, sourceName) key of each record.
+    """
+    keys = storeKeys(table)
+    result = pd.util.hash_pandas_object(keys.to_frame(index=False), index=False).to_numpy(dtype=np.uint64)
+    return result
+
+
+def loadKeyIndex(storeDir: Union[str, Path], tableName: str) -> np.ndarray:
+    """
+    Returns the hashed keys of the records of a table in the store. Stores written before the index existed are indexed from the key columns of their parts, once.
+    """
+    indexPath = Path(storeDir).joinpath(tableName, KEY_INDEX_FILE_NAME)
+    if indexPath.exists():
+        result = np.load(indexPath)
+    else:
+        parts = listStoreParts(storeDir=storeDir, tableName=tableName)
+        result = np.concatenate([hashKeys(loadTable(part, columns=STORE_KEY_COLUMNS)) for part in parts] or [np.zeros(0, dtype=np.uint64)])
+    return result
+
+
+def loadMinuteCounts(storeDir: Union[str, Path], tableName: str) -> np.ndarray:
+    """
+    Returns the number of records of a table in the store at each local minute of the day. Stores written before the counts existed are counted from their parts, once.
+    """
+    countsPath = Path(storeDir).joinpath(tableName, MINUTE_COUNTS_FILE_NAME)
+    if countsPath.exists():
+        result = np.load(countsPath)
+    else:
+        result = np.zeros(MINUTES_PER_DAY, dtype=np.int64)
+        for part in listStoreParts(storeDir=storeDir, tableName=tableName):
+            result += minuteCounts(loadTable(part, columns=["startDateLocalMinute"]))
+    return result
+
+
+def minuteCounts(table: pd.DataFrame) -> np.ndarray:
+    """
+    Counts the records of a table at each local minute of the day, from the "startDateLocalMinute" column added by `parseTimes`.
+    """
+    localMinutes = table["startDateLocalMinute"].to_numpy(dtype=np.int64)
+    result = np.bincount(localMinutes[localMinutes >= 0], minlength=MINUTES_PER_DAY).astype(np.int64)
+    return result
+
+
+def loadLocalMinutes(storeDir: Union[str, Path], tableName: str) -> np.ndarray:
+    """
+    Returns the local minute of the day of every record of a table in the store, in no particular order, e.g., for `discoverTimeWindows`.
+    """
+    result = np.repeat(np.arange(MINUTES_PER_DAY), loadMinuteCounts(storeDir=storeDir, tableName=tableName))
+    return result
+
+
+def appendToStore(storeDir: Union[str, Path],
+                  tableName: str,
+                  table: pd.DataFrame,
+                  watermarks: Dict[str, str],
+                  logger: logging.Logger) -> Dict[str, str]:
+    """
+    Appends the records of `table` that aren't already in the store as a new part, deduplicating by (type, startDate, sourceName) against the store's key index.
+    Returns the watermarks updated with the appended records.
+    """
+    watermarks = dict(watermarks)
+    parts = listStoreParts(storeDir=storeDir, tableName=tableName)
+    newKeys = hashKeys(table)
+    existingKeys = loadKeyIndex(storeDir=storeDir, tableName=tableName)
+    isNew = ~pd.Series(newKeys).duplicated().to_numpy() & ~np.isin(newKeys, existingKeys)
+    table = table[isNew].reset_index(drop=True)
+    logger.info(f"""Appending {len(table):,} new records to table "{tableName}" in the store.""")
+    # The first part is written even if it's empty, so that the store keeps the table's columns
+    if len(table) > 0 or not parts:
+        tableDir = Path(storeDir).joinpath(tableName)
+        tableDir.mkdir(parents=True, exist_ok=True)
+        counts = loadMinuteCounts(storeDir=storeDir, tableName=tableName) + minuteCounts(table)
+        savepath = tableDir.joinpath(f"part {len(parts):06d}.parquet")
+        saveTable(table=table, savepath=savepath)
+        np.save(tableDir.joinpath(KEY_INDEX_FILE_NAME), np.concatenate([existingKeys, newKeys[isNew]]))
+        np.save(tableDir.joinpath(MINUTE_COUNTS_FILE_NAME), counts)
+        creationDates = pd.to_datetime(table["creationDate"], utc=True)
+        for recordType, lastCreationDate in creationDates.groupby(table["type"].astype(str)).max().items():
+            if recordType in watermarks:
+                lastCreationDate = max(lastCreationDate, pd.to_datetime(watermarks[recordType], utc=True))
+            watermarks[recordType] = lastCreationDate.isoformat()
+    return watermarks
+
+
+def loadStore(storeDir: Union[str, Path],
+              tableName: str,
+              columns: Union[Iterable[str], None] = None,
+              schema: Union[pd.DataFrame, None] = None) -> pd.DataFrame:
+    """
+    Loads all the records of a table in the store. Stages that only need new records use `loadUnlabeledRecords` instead.
+    A table that was never appended to is returned as `schema` without its rows, e.g., a table of new records, or as a table without columns if `schema` is `None`.
+    """
+    parts = listStoreParts(storeDir=storeDir, tableName=tableName)
+    result = concatenateParts(parts=parts, columns=columns, schema=schema)
+    return result
+
+
+def concatenateParts(parts: List[Path],
+                     columns: Union[Iterable[str], None] = None,
+                     schema: Union[pd.DataFrame, None] = None) -> pd.DataFrame:
+    """
+    Loads and concatenates the non-empty parts of a table. If there are none, returns the first part, or `schema` without its rows.
+    """
+    tables = [loadTable(part, columns=columns) for part in parts]
+    nonEmptyTables = [table for table in tables if len(table) > 0]
+    if nonEmptyTables:
+        result = pd.concat(nonEmptyTables, ignore_index=True)
+    elif tables:
+        result = tables[0]
+    elif schema is not None:
+        result = schema.iloc[:0].reset_index(drop=True)
+    else:
+        result = pd.DataFrame()
+    return result
+
+
+def loadUnlabeledRecords(storeDir: Union[str, Path],
+                         tableName: str,
+                         manifest: Union[dict, None],
+                         schema: pd.DataFrame) -> pd.DataFrame:
+    """
+    Loads the records of a table that were appended to the store after the labeled store was last updated, i.e., the store parts that `manifest` doesn't count.
+    """
+    numLabeledParts = manifest["storeParts"].get(tableName, 0) if manifest else 0
+    parts = listStoreParts(storeDir=storeDir, tableName=tableName)[numLabeledParts:]
+    result = concatenateParts(parts=parts, schema=schema)
+    # Stores written by earlier versions also hold labels, which are dropped so that they are computed again
+    result = result[[column for column in result.columns if column in schema.columns]]
+    return result
+
+
+def labelSettingsHash(settings: dict) -> str:
+    """
+    Returns a hash of the settings that labels and pairs depend on. The labeled store is rebuilt from the whole history when it changes.
+    """
+    result = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+    return result
+
+
+def loadLabeledManifest(storeDir: Union[str, Path]) -> Union[dict, None]:
+    """
+    Returns the manifest of the labeled store, or `None` if there is no labeled store yet.
+    The manifest lists the labeled parts in time order, each with the first and last start and the last end of its readings, and counts the store parts they were labeled from.
+    """
+    manifestPath = Path(storeDir).joinpath(LABELED_DIR_NAME, LABELED_MANIFEST_FILE_NAME)
+    if manifestPath.exists():
+        with open(manifestPath, "r") as file:
+            result = json.loads(file.read())
+    else:
+        result = None
+    return result
+
+
+def eventKeys(eventTables: Dict[str, pd.DataFrame]) -> Dict[str, np.ndarray]:
+    """
+    Returns the (start, end) of the events of each label, in UTC nanoseconds, as an array with one row per event.
+    """
+    result = {}
+    for labelName, eventTable in eventTables.items():
+        if len(eventTable) > 0:
+            result[labelName] = np.column_stack([datetimesToNanoseconds(eventTable["startDate"]), datetimesToNanoseconds(eventTable["endDate"])])
+        else:
+            result[labelName] = np.zeros((0, 2), dtype=np.int64)
+    return result
+
+
+def earliestChangedEvent(storeDir: Union[str, Path], eventTables: Dict[str, pd.DataFrame]) -> Union[int, None]:
+    """
+    Returns the earliest start, in UTC nanoseconds, of the events that were added or removed since the labeled store was last updated, or `None` if none were.
+    """
+    eventsPath = Path(storeDir).joinpath(LABELED_DIR_NAME, EVENTS_FILE_NAME)
+    storedEvents = dict(np.load(eventsPath)) if eventsPath.exists() else {}
+    changedStarts = []
+    for labelName, events in eventKeys(eventTables).items():
+        storedKeys = pd.MultiIndex.from_arrays(storedEvents.get(labelName, np.zeros((0, 2), dtype=np.int64)).T)
+        keys = pd.MultiIndex.from_arrays(events.T)
+        changedStarts.extend(storedKeys.symmetric_difference(keys).get_level_values(0))
+    result = int(min(changedStarts)) if changedStarts else None
+    return result
+
+
+def findLabeledTail(manifest: dict,
+                    firstNewStart: Union[int, None],
+                    firstChangedEvent: Union[int, None],
+                    pairingTolerance: pd.Timedelta,
+                    proximityAfter: pd.Timedelta) -> int:
+    """
+    Returns the index of the first labeled part whose labels or pairs can change: the first part with a reading within `pairingTolerance` of the new readings, or that ends less than `proximityAfter` before a changed event.
+    Parts only start after a gap longer than the pairing tolerance, so the readings of earlier parts are never paired with the new readings.
+    A last part with fewer than `LABELED_PART_ROWS` readings is labeled again with the new readings, so that runs that each add a few readings don't leave many small parts.
+    """
+    parts = manifest["parts"]
+    result = len(parts)
+    if firstNewStart is not None and parts and parts[-1]["rows"] < LABELED_PART_ROWS:
+        result = len(parts) - 1
+    for it, part in enumerate(parts[:result]):
+        pairsWithNew = firstNewStart is not None and part["lastStart"] >= firstNewStart - pd.Timedelta(pairingTolerance).value
+        nearChangedEvent = firstChangedEvent is not None and part["lastEnd"] >= firstChangedEvent - pd.Timedelta(proximityAfter).value
+        if pairsWithNew or nearChangedEvent:
+            result = it
+            break
+    return result
+
+
+def labeledTablePath(storeDir: Union[str, Path], tableName: str) -> Path:
+    """
+    Returns the directory of a table's labeled parts, which `loadTable` loads as one table.
+    """
+    result = Path(storeDir).joinpath(LABELED_DIR_NAME, f"{tableName}.parquet")
+    return result
+
+
+def loadLabeledParts(storeDir: Union[str, Path],
+                     manifest: dict,
+                     firstPart: int,
+                     tableNames: Iterable[str],
+                     schemas: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """
+    Loads the labeled parts of each table from `firstPart` onward, keeping only the columns of the unlabeled table in `schemas`, so that they can be labeled again.
+    """
+    result = {}
+    for tableName in tableNames:
+        tableDir = labeledTablePath(storeDir=storeDir, tableName=tableName)
+        parts = [tableDir.joinpath(part["name"]) for part in manifest["parts"][firstPart:]]
+        table = concatenateParts(parts=parts, schema=schemas[tableName])
+        result[tableName] = table[[column for column in table.columns if column in schemas[tableName].columns]]
+    return result
+
+
+def splitAtGaps(startNanoseconds: np.ndarray, gapNanoseconds: int, partRows: int) -> np.ndarray:
+    """
+    Returns the first start of each part after the first, splitting the sorted `startNanoseconds` only at gaps longer than `gapNanoseconds`, into parts of at least `partRows` readings where possible.
+    """
+    gapIndices = np.flatnonzero(np.diff(startNanoseconds) > gapNanoseconds) + 1
+    boundaries = []
+    partStart = 0
+    while True:
+        it = np.searchsorted(gapIndices, partStart + partRows)
+        if it == len(gapIndices):
+            break
+        partStart = gapIndices[it]
+        boundaries.append(startNanoseconds[partStart])
+    result = np.array(boundaries, dtype=np.int64)
+    return result
+
+
+def updateLabeledStore(storeDir: Union[str, Path],
+                       manifest: Union[dict, None],
+                       firstPart: int,
+                       tables: Dict[str, pd.DataFrame],
+                       settingsHash: str,
+                       eventTables: Dict[str, pd.DataFrame],
+                       pairingTolerance: pd.Timedelta,
+                       metadata: dict,
+                       logger: logging.Logger) -> dict:
+    """
+    Replaces the labeled parts from `firstPart` onward with `tables`, which hold the labeled readings of those parts and of the new records, and the pairs of the systolic readings, under "Paired BP".
+    The readings are split in time order at gaps longer than `pairingTolerance`. New parts get new file names, so that the parts linked by earlier runs are left as they were. Returns the new manifest.
+    Readings are assumed to be instantaneous, as blood pressure readings are, so that parts are split by start times alone.
+    """
+    labeledDir = Path(storeDir).joinpath(LABELED_DIR_NAME)
+    if manifest is None or manifest["settingsHash"] != settingsHash:
+        # Part numbers aren't reused, so that the parts linked by earlier runs are never overwritten
+        manifest = {"settingsHash": settingsHash, "parts": [], "nextPart": manifest["nextPart"] if manifest else 0}
+        firstPart = 0
+    replacedParts = manifest["parts"][firstPart:]
+    keptParts = manifest["parts"][:firstPart]
+    readingTables = {tableName: table for tableName, table in tables.items() if tableName != "Paired BP"}
+
+    allStarts = np.sort(np.concatenate([datetimesToNanoseconds(table["startDate"]) for table in readingTables.values()]))
+    boundaries = splitAtGaps(startNanoseconds=allStarts, gapNanoseconds=pd.Timedelta(pairingTolerance).value, partRows=LABELED_PART_ROWS)
+    numParts = len(boundaries) + 1 if len(allStarts) > 0 or not keptParts else 0
+    newParts = [{"name": f"part {manifest['nextPart'] + it:06d}.parquet",
+                 "firstStart": np.iinfo(np.int64).max,
+                 "lastStart": np.iinfo(np.int64).min,
+                 "lastEnd": np.iinfo(np.int64).min,
+                 "rows": 0} for it in range(numParts)]
+    for tableName, table in tables.items():
+        tableDir = labeledTablePath(storeDir=storeDir, tableName=tableName)
+        tableDir.mkdir(parents=True, exist_ok=True)
+        startNanoseconds = datetimesToNanoseconds(table["startDate"])
+        order = np.argsort(startNanoseconds, kind="stable")
+        table = table.iloc[order].reset_index(drop=True)
+        startNanoseconds = startNanoseconds[order]
+        partNumbers = np.searchsorted(boundaries, startNanoseconds, side="right")
+        for it, part in enumerate(newParts):
+            inPart = partNumbers == it
+            savepath = tableDir.joinpath(part["name"])
+            # A file left by an interrupted run is replaced, not overwritten, in case an earlier run links to it
+            savepath.unlink(missing_ok=True)
+            saveTable(table=table[inPart], savepath=savepath, metadata=metadata)
+            if tableName in readingTables and inPart.any():
+                part["rows"] += int(inPart.sum())
+                part["firstStart"] = min(part["firstStart"], int(startNanoseconds[inPart].min()))
+                part["lastStart"] = max(part["lastStart"], int(startNanoseconds[inPart].max()))
+                part["lastEnd"] = max(part["lastEnd"], int(datetimesToNanoseconds(table.loc[inPart, "endDate"]).max()))
+    logger.info(f"""Replaced {len(replacedParts):,} labeled parts with {len(newParts):,} parts, keeping {len(keptParts):,} parts.""")
+
+    manifest = {"settingsHash": settingsHash,
+                "parts": keptParts + newParts,
+                "nextPart": manifest["nextPart"] + numParts,
+                "storeParts": {tableName: len(listStoreParts(storeDir=storeDir, tableName=tableName)) for tableName in readingTables.keys()}}
+    np.savez(labeledDir.joinpath(EVENTS_FILE_NAME), **eventKeys(eventTables))
+    manifestPath = labeledDir.joinpath(LABELED_MANIFEST_FILE_NAME)
+    temporaryPath = manifestPath.with_suffix(".partial")
+    with open(temporaryPath, "w") as file:
+        file.write(json.dumps(manifest, indent=4))
+    os.replace(temporaryPath, manifestPath)
+
+    # Parts are removed only after the manifest no longer lists them
+    keptNames = {part["name"] for part in manifest["parts"]}
+    for tableName in tables.keys():
+        for partPath in labeledTablePath(storeDir=storeDir, tableName=tableName).glob("part *.parquet"):
+            if partPath.name not in keptNames:
+                partPath.unlink()
+    return manifest
+
+
+def linkLabeledTable(storeDir: Union[str, Path],
+                     manifest: dict,
+                     tableName: str,
+                     savepath: Union[str, Path]) -> None:
+    """
+    Saves a labeled table as a directory of hard links to its parts, which `loadTable` loads as one table. Parts are copied if they can't be linked, e.g., across file systems.
+    """
+    savepath = Path(savepath)
+    savepath.mkdir(parents=True, exist_ok=True)
+    tableDir = labeledTablePath(storeDir=storeDir, tableName=tableName)
+    for part in manifest["parts"]:
+        try:
+            os.link(tableDir.joinpath(part["name"]), savepath.joinpath(part["name"]))
+        except OSError:
+            shutil.copyfile(tableDir.joinpath(part["name"]), savepath.joinpath(part["name"]))
@@ -0,0 +1,133 @@
+"""
+Batched ordinary least squares for the label models in "analyzeData.py".
+
+The regressors of every model are boolean labels, so all the models of a table can be fit from one summary of the table: the count, sum, and sum of squares of the outcome for each distinct pattern of labels.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Union
+# Third-party packages
+import numpy as np
+import pandas as pd
+import scipy.stats as sps
+
+RESULT_COLUMNS = ["testGroup",
+                  "term",
+                  "coefficient",
+                  "standardError",
+                  "tValue",
+                  "pValue",
+                  "standardizedCoefficient",
+                  "nObs",
+                  "rSquared",
+                  "AIC",
+                  "BIC"]
+
+
+def summarizeLabelPatterns(table: pd.DataFrame,
+                           labelColumns: List[str],
+                           valueColumn: str = "value") -> pd.DataFrame:
+    """
+    Groups the rows of `table` by their pattern of labels in a single pass.
+    Returns one row per distinct pattern, with the label values and the count, sum, and sum of squares of `valueColumn`.
+    """
+    labels = table[labelColumns].to_numpy(dtype=bool)
+    values = table[valueColumn].to_numpy(dtype=float)
+    patterns, inverse = np.unique(labels, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    numPatterns = len(patterns)
+    result = pd.DataFrame(patterns, columns=labelColumns)
+    result["count"] = np.bincount(inverse, minlength=numPatterns)
+    result["sum"] = np.bincount(inverse, weights=values, minlength=numPatterns)
+    result["sumOfSquares"] = np.bincount(inverse, weights=values ** 2, minlength=numPatterns)
+    return result
+
+
+def fitOLSFromPatterns(patterns: pd.DataFrame,
+                       columnsToUse: List[str],
+                       logger: logging.Logger) -> Union[pd.DataFrame, None]:
+    """
+    Fits the regression of the outcome on a constant and `columnsToUse`, using the observations with at least one of those labels.
+    The fit uses the normal equations built from the pattern summary, with a pseudo-inverse so that collinear labels are handled as in statsmodels' `OLS`.
+    Returns one row per term, with the coefficient, standard error, t-statistic, p-value, and standardized coefficient, and the model's number of observations, R², AIC, and BIC.
+    Returns `None`, and logs why, if no observation has the labels or there are no more observations than independent regressors, so that the residual variance can't be estimated.
+    """
+    patterns = patterns[patterns[columnsToUse].any(axis=1)]
+    weights = patterns["count"].to_numpy(dtype=float)
+    sums = patterns["sum"].to_numpy()
+    design = np.column_stack([np.ones(len(patterns)), patterns[columnsToUse].to_numpy(dtype=float)])
+
+    numObs = weights.sum()
+    xtx = design.T @ (design * weights[:, None])
+    xty = design.T @ sums
+    yty = patterns["sumOfSquares"].sum()
+    xtxInverse = np.linalg.pinv(xtx)
+    coefficients = xtxInverse @ xty
+    rank = np.linalg.matrix_rank(xtx)
+    dfResidual = numObs - rank
+    if numObs == 0:
+        logger.warning(f"""No observations have any of the labels {columnsToUse}. The model isn't fit.""")
+        return None
+    elif dfResidual <= 0:
+        logger.warning(f"""The {int(numObs):,} observations with any of the labels {columnsToUse} are too few for the {rank} independent regressors. The model isn't fit.""")
+        return None
+
+    residualSS = max(yty - 2 * coefficients @ xty + coefficients @ xtx @ coefficients, 0.0)
+    totalSS = yty - sums.sum() ** 2 / numObs
+    sigma2 = residualSS / dfResidual
+    standardErrors = np.sqrt(np.diag(xtxInverse) * sigma2)
+    tValues = coefficients / standardErrors
+    pValues = 2 * sps.t.sf(np.abs(tValues), dfResidual)
+    logLikelihood = -numObs / 2 * (np.log(2 * np.pi) + np.log(residualSS / numObs) + 1)
+
+    # Coefficients on the standardized scale, as reported by the previous scikit-learn models.
+    xMeans = design.T @ weights / numObs
+    xStds = np.sqrt(np.maximum(xMeans - xMeans ** 2, 0.0))
+    yStd = np.sqrt(totalSS / numObs)
+    standardizedCoefficients = coefficients * xStds / yStd
+    standardizedCoefficients[0] = 0.0
+
+    result = pd.DataFrame({"term": ["const"] + list(columnsToUse),
+                           "coefficient": coefficients,
+                           "standardError": standardErrors,
+                           "tValue": tValues,
+                           "pValue": pValues,
+                           "standardizedCoefficient": standardizedCoefficients})
+    result["nObs"] = int(numObs)
+    result["rSquared"] = 1 - residualSS / totalSS
+    result["AIC"] = -2 * logLikelihood + 2 * rank
+    result["BIC"] = -2 * logLikelihood + np.log(numObs) * rank
+    return result
+
+
+def fitOLSBatch(table: pd.DataFrame,
+                testGroups: Dict[str, List[str]],
+                logger: logging.Logger,
+                valueColumn: str = "value") -> pd.DataFrame:
+    """
+    Fits the regression of `valueColumn` on each test group's labels, summarizing the table once for all test groups.
+    Test groups that use the same labels are fit once. Returns a single results table with a row per test group and term. Test groups that can't be fit, as explained by `fitOLSFromPatterns`, have no rows.
+    """
+    allColumns = list(dict.fromkeys(column for columnsToUse in testGroups.values() for column in columnsToUse))
+    patterns = summarizeLabelPatterns(table=table,
+                                      labelColumns=allColumns,
+                                      valueColumn=valueColumn)
+    fits = {}
+    results = []
+    for testGroup, columnsToUse in testGroups.items():
+        key = tuple(columnsToUse)
+        if key not in fits:
+            fits[key] = fitOLSFromPatterns(patterns=patterns, columnsToUse=list(columnsToUse), logger=logger)
+        if fits[key] is None:
+            logger.warning(f"""Skipping test group "{testGroup}".""")
+            continue
+        result = fits[key].copy()
+        result.insert(0, "testGroup", testGroup)
+        results.append(result)
+    if results:
+        result = pd.concat(results, ignore_index=True)
+    else:
+        result = pd.DataFrame(columns=RESULT_COLUMNS)
+    return result
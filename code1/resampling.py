@@ -0,0 +1,215 @@
+"""
+Permutation tests and bootstrap confidence intervals for differences between labeled groups.
+
+Resamples are drawn in batches, and comparisons are spread across a process pool. Each comparison gets its own random stream spawned from a single seed, so results are reproducible regardless of the number of workers.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import Dict, List, Union
+# Third-party packages
+import numpy as np
+import pandas as pd
+
+MAX_BATCH_ELEMENTS = 10_000_000
+# Resamples are drawn as counts of each distinct value, instead of as indices of each observation, if there are at most this many distinct values per observation, e.g., for readings in whole mmHg
+MAX_DISTINCT_VALUES_FRACTION = 0.25
+
+
+def batchSizes(nResamples: int, numObservations: int) -> List[int]:
+    """
+    Splits `nResamples` into batches whose index matrices have at most `MAX_BATCH_ELEMENTS` elements.
+    """
+    batchSize = max(1, MAX_BATCH_ELEMENTS // max(numObservations, 1))
+    result = [batchSize] * (nResamples // batchSize)
+    if nResamples % batchSize:
+        result.append(nResamples % batchSize)
+    return result
+
+
+def distinctValues(values: np.ndarray):
+    """
+    Returns the distinct values of `values` with their counts if there are few enough of them to resample as counts, or else `None` for both.
+    """
+    uniqueValues, counts = np.unique(values, return_counts=True)
+    if len(uniqueValues) <= MAX_DISTINCT_VALUES_FRACTION * len(values):
+        return uniqueValues, counts
+    else:
+        return None, None
+
+
+def meanAndVarianceDifferences(sum0: np.ndarray,
+                               sumOfSquares0: np.ndarray,
+                               n0: int,
+                               sum1: np.ndarray,
+                               sumOfSquares1: np.ndarray,
+                               n1: int):
+    """
+    Returns the differences in mean and in sample variance between two groups, from their sums and sums of squares.
+    """
+    meanDifference = sum0 / n0 - sum1 / n1
+    variance0 = (sumOfSquares0 - sum0 ** 2 / n0) / (n0 - 1)
+    variance1 = (sumOfSquares1 - sum1 ** 2 / n1) / (n1 - 1)
+    varianceDifference = variance0 - variance1
+    return meanDifference, varianceDifference
+
+
+def permutationTest(values0: np.ndarray,
+                    values1: np.ndarray,
+                    nResamples: int,
+                    rng: np.random.Generator) -> Dict[str, float]:
+    """
+    Two-sided permutation tests for the differences in mean and in variance between two groups.
+    """
+    values0 = np.asarray(values0, dtype=float)
+    values1 = np.asarray(values1, dtype=float)
+    n0 = len(values0)
+    n1 = len(values1)
+    pooled = np.concatenate([values0, values1])
+    pooledSum = pooled.sum()
+    pooledSumOfSquares = (pooled ** 2).sum()
+    observedMean, observedVariance = meanAndVarianceDifferences(values0.sum(), (values0 ** 2).sum(), n0,
+                                                                values1.sum(), (values1 ** 2).sum(), n1)
+    extremeMean = 0
+    extremeVariance = 0
+    uniqueValues, counts = distinctValues(pooled)
+    for batchSize in batchSizes(nResamples, len(pooled) if uniqueValues is None else len(uniqueValues)):
+        if uniqueValues is None:
+            group0 = rng.permuted(np.broadcast_to(pooled, (batchSize, len(pooled))), axis=1)[:, :n0]
+            sum0 = group0.sum(axis=1)
+            sumOfSquares0 = (group0 ** 2).sum(axis=1)
+        else:
+            # The number of times each distinct value is drawn into group 0, without replacement
+            counts0 = rng.multivariate_hypergeometric(counts, n0, size=batchSize)
+            sum0 = counts0 @ uniqueValues
+            sumOfSquares0 = counts0 @ uniqueValues ** 2
+        meanDifferences, varianceDifferences = meanAndVarianceDifferences(sum0, sumOfSquares0, n0,
+                                                                          pooledSum - sum0, pooledSumOfSquares - sumOfSquares0, n1)
+        extremeMean += np.count_nonzero(np.abs(meanDifferences) >= abs(observedMean))
+        extremeVariance += np.count_nonzero(np.abs(varianceDifferences) >= abs(observedVariance))
+    result = {"meanDifference": observedMean,
+              "meanDifferencePValue": (extremeMean + 1) / (nResamples + 1),
+              "varianceDifference": observedVariance,
+              "varianceDifferencePValue": (extremeVariance + 1) / (nResamples + 1)}
+    return result
+
+
+def bootstrapSums(values: np.ndarray,
+                  batchSize: int,
+                  rng: np.random.Generator):
+    """
+    Returns the sums and sums of squares of `batchSize` bootstrap resamples of `values`.
+    """
+    n = len(values)
+    uniqueValues, counts = distinctValues(values)
+    if uniqueValues is None:
+        resamples = values[rng.integers(0, n, size=(batchSize, n))]
+        return resamples.sum(axis=1), (resamples ** 2).sum(axis=1)
+    else:
+        # The number of times each distinct value is drawn, with replacement
+        resampleCounts = rng.multinomial(n, counts / n, size=batchSize)
+        return resampleCounts @ uniqueValues, resampleCounts @ uniqueValues ** 2
+
+
+def bootstrapConfidenceIntervals(values0: np.ndarray,
+                                 values1: np.ndarray,
+                                 nResamples: int,
+                                 rng: np.random.Generator,
+                                 confidenceLevel: float = 0.95) -> Dict[str, float]:
+    """
+    Percentile bootstrap confidence intervals for the differences in mean and in variance between two groups.
+    """
+    values0 = np.asarray(values0, dtype=float)
+    values1 = np.asarray(values1, dtype=float)
+    n0 = len(values0)
+    n1 = len(values1)
+    meanDifferences = []
+    varianceDifferences = []
+    for batchSize in batchSizes(nResamples, n0 + n1):
+        sum0, sumOfSquares0 = bootstrapSums(values0, batchSize, rng)
+        sum1, sumOfSquares1 = bootstrapSums(values1, batchSize, rng)
+        meanDifferenceBatch, varianceDifferenceBatch = meanAndVarianceDifferences(sum0, sumOfSquares0, n0,
+                                                                                  sum1, sumOfSquares1, n1)
+        meanDifferences.append(meanDifferenceBatch)
+        varianceDifferences.append(varianceDifferenceBatch)
+    quantiles = [(1 - confidenceLevel) / 2, (1 + confidenceLevel) / 2]
+    meanLower, meanUpper = np.quantile(np.concatenate(meanDifferences), quantiles)
+    varianceLower, varianceUpper = np.quantile(np.concatenate(varianceDifferences), quantiles)
+    result = {"meanDifferenceLower": meanLower,
+              "meanDifferenceUpper": meanUpper,
+              "varianceDifferenceLower": varianceLower,
+              "varianceDifferenceUpper": varianceUpper}
+    return result
+
+
+def resampleComparison(task: dict) -> dict:
+    """
+    Runs the permutation tests and bootstrap confidence intervals for one comparison.
+    """
+    rng = np.random.default_rng(task["seed"])
+    result = {"table": task["table"],
+              "testGroup": task["testGroup"],
+              "group0": task["group0"],
+              "group1": task["group1"],
+              "n0": len(task["values0"]),
+              "n1": len(task["values1"])}
+    if min(result["n0"], result["n1"]) < 2:
+        return result
+    result.update(permutationTest(values0=task["values0"],
+                                  values1=task["values1"],
+                                  nResamples=task["nResamples"],
+                                  rng=rng))
+    result.update(bootstrapConfidenceIntervals(values0=task["values0"],
+                                               values1=task["values1"],
+                                               nResamples=task["nResamples"],
+                                               rng=rng,
+                                               confidenceLevel=task["confidenceLevel"]))
+    return result
+
+
+def buildResamplingTasks(tablesToProcess: Dict[str, pd.DataFrame],
+                         testGroups: Dict[str, List[str]],
+                         valueColumn: str = "value") -> List[dict]:
+    """
+    Creates one comparison for every pair of groups in every test group of every table.
+    Pairs of groups that share readings, e.g., a medication and a time group, are skipped, because the tests assume the groups are independent samples.
+    """
+    tasks = []
+    for tableName, table in tablesToProcess.items():
+        values = table[valueColumn].to_numpy(dtype=float)
+        for testGroup, columnsToUse in testGroups.items():
+            for group0Column, group1Column in combinations(columnsToUse, 2):
+                mask0 = table[group0Column].to_numpy(dtype=bool)
+                mask1 = table[group1Column].to_numpy(dtype=bool)
+                if np.any(mask0 & mask1):
+                    continue
+                tasks.append({"table": tableName,
+                              "testGroup": testGroup,
+                              "group0": group0Column,
+                              "group1": group1Column,
+                              "values0": values[mask0],
+                              "values1": values[mask1]})
+    return tasks
+
+
+def runResamplingTests(tasks: List[dict],
+                       nResamples: int,
+                       seed: Union[int, None],
+                       maxWorkers: Union[int, None] = None,
+                       confidenceLevel: float = 0.95) -> pd.DataFrame:
+    """
+    Runs the resampling comparisons in `tasks` across a process pool, or in this process if `maxWorkers` is 1.
+    Returns one row per comparison, in the order of `tasks`.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    tasks = [dict(task, nResamples=nResamples, seed=taskSeed, confidenceLevel=confidenceLevel) for task, taskSeed in zip(tasks, seeds)]
+    if maxWorkers == 1:
+        results = [resampleComparison(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+            results = list(executor.map(resampleComparison, tasks))
+    # Without any comparisons, the result still has the columns that identify them
+    result = pd.DataFrame(results, columns=None if results else ["table", "testGroup", "group0", "group1", "n0", "n1"])
+    return result
@@ -0,0 +1,234 @@
+"""
+Content-addressed cache of stage outputs.
+
+Each stage's output directory is keyed by a hash of its input files, its parameters, and the code of this package, so that rerunning a stage with unchanged inputs reuses its earlier output instead of computing it again. Old entries are evicted by age and by the total size of the cache.
+
+    cacheDir/
+        fileHashes.JSON                 Hashes of input files, by path, size, and modification time
+        <stage>/<key>/cacheEntry.JSON   Written last, so only complete entries have it
+        <stage>/<key>/...               The stage's output
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Union
+
+CACHE_MAX_BYTES = 10 * 2 ** 30
+CACHE_MAX_AGE_DAYS = 90
+
+CACHE_ENTRY_FILE_NAME = "cacheEntry.JSON"
+FILE_HASHES_FILE_NAME = "fileHashes.JSON"
+PARTIAL_SUFFIX = ".partial"
+HASH_CHUNK_SIZE = 2 ** 20
+# Partial entries older than this are left over from failed runs
+PARTIAL_MAX_AGE_SECONDS = 24 * 60 * 60
+
+
+def hashFile(fpath: Union[str, Path], cacheDir: Union[Path, None] = None) -> str:
+    """
+    Returns the SHA-256 hash of a file's contents.
+    If `cacheDir` is given, hashes are remembered by the file's path, size, and modification time, so that large exports are only read once.
+    """
+    fpath = Path(fpath).absolute()
+    stat = fpath.stat()
+    fileKey = f"{fpath}|{stat.st_size}|{stat.st_mtime_ns}"
+    hashesPath = cacheDir.joinpath(FILE_HASHES_FILE_NAME) if cacheDir is not None else None
+    fileHashes = {}
+    if hashesPath is not None and hashesPath.exists():
+        with open(hashesPath, "r") as file:
+            fileHashes = json.loads(file.read())
+        if fileKey in fileHashes:
+            return fileHashes[fileKey]
+    digest = hashlib.sha256()
+    with open(fpath, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    result = digest.hexdigest()
+    if hashesPath is not None:
+        fileHashes = {key: value for key, value in fileHashes.items() if not key.startswith(f"{fpath}|")}
+        fileHashes[fileKey] = result
+        hashesPath.parent.mkdir(parents=True, exist_ok=True)
+        with open(hashesPath, "w") as file:
+            file.write(json.dumps(fileHashes, indent=4))
+    return result
+
+
+def hashDirectory(dirPath: Union[str, Path], cacheDir: Union[Path, None] = None) -> str:
+    """
+    Returns a hash of the relative paths and contents of all the files in a directory.
+    """
+    dirPath = Path(dirPath)
+    digest = hashlib.sha256()
+    for fpath in sorted(path for path in dirPath.rglob("*") if path.is_file()):
+        digest.update(fpath.relative_to(dirPath).as_posix().encode())
+        digest.update(hashFile(fpath, cacheDir=cacheDir).encode())
+    result = digest.hexdigest()
+    return result
+
+
+def codeVersion() -> str:
+    """
+    Returns a hash of the source code of this package, so that changes to the code invalidate the cache.
+    """
+    digest = hashlib.sha256()
+    packageDir = Path(__file__).parent
+    for fpath in sorted(packageDir.glob("*.py")):
+        digest.update(fpath.name.encode())
+        digest.update(fpath.read_bytes())
+    result = digest.hexdigest()
+    return result
+
+
+def cacheKey(stageName: str, inputHashes: Iterable[str], parameters: dict) -> str:
+    """
+    Returns the cache key of a stage run, from the hashes of its inputs, its parameters, and the code version.
+    Parameters are serialized as JSON, with values that JSON doesn't support, like paths and time deltas, converted to strings.
+    """
+    description = {"stage": stageName,
+                   "inputs": list(inputHashes),
+                   "parameters": parameters,
+                   "code": codeVersion()}
+    result = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+    return result
+
+
+def readCacheEntry(entryDir: Path) -> dict:
+    """
+    Returns the description of a cache entry.
+    """
+    with open(entryDir.joinpath(CACHE_ENTRY_FILE_NAME), "r") as file:
+        result = json.loads(file.read())
+    return result
+
+
+def writeCacheEntry(entryDir: Path, entry: dict) -> None:
+    """
+    Writes the description of a cache entry.
+    """
+    temporaryPath = entryDir.joinpath(f"{CACHE_ENTRY_FILE_NAME}{PARTIAL_SUFFIX}")
+    with open(temporaryPath, "w") as file:
+        file.write(json.dumps(entry, indent=4, default=str))
+    os.replace(temporaryPath, entryDir.joinpath(CACHE_ENTRY_FILE_NAME))
+
+
+def findCacheEntry(cacheDir: Path, stageName: str, key: str) -> Union[Path, None]:
+    """
+    Returns the directory of a complete cache entry and marks it as used, or `None` if there is none.
+    """
+    entryDir = cacheDir.joinpath(stageName, key)
+    if not entryDir.joinpath(CACHE_ENTRY_FILE_NAME).exists():
+        return None
+    entry = readCacheEntry(entryDir)
+    entry["lastUsedAt"] = time.time()
+    writeCacheEntry(entryDir, entry)
+    return entryDir
+
+
+def latestCacheEntry(cacheDir: Path, stageName: str) -> Union[Path, None]:
+    """
+    Returns the directory of the most recently used complete entry of a stage, or `None` if there is none.
+    """
+    stageDir = cacheDir.joinpath(stageName)
+    if not stageDir.exists():
+        return None
+    entries = [(readCacheEntry(entryDir)["lastUsedAt"], entryDir) for entryDir in stageDir.iterdir() if entryDir.joinpath(CACHE_ENTRY_FILE_NAME).exists()]
+    if not entries:
+        return None
+    _, result = max(entries)
+    return result
+
+
+def directorySize(dirPath: Path) -> int:
+    """
+    Returns the total size of the files in a directory, in bytes.
+    """
+    result = sum(path.stat().st_size for path in dirPath.rglob("*") if path.is_file())
+    return result
+
+
+def runCached(stageName: str,
+              inputHashes: List[str],
+              parameters: dict,
+              cacheDir: Path,
+              run: Callable[[Path], None],
+              logger: logging.Logger) -> Path:
+    """
+    Returns the output directory of a stage run from the cache, or creates it by calling `run` with an empty output directory.
+    Outputs are written to a partial directory and moved into place only once `run` succeeds, so a failed run never leaves an entry behind.
+    """
+    key = cacheKey(stageName=stageName, inputHashes=inputHashes, parameters=parameters)
+    entryDir = findCacheEntry(cacheDir=cacheDir, stageName=stageName, key=key)
+    if entryDir is not None:
+        logger.info(f"""Cache hit for stage "{stageName}": reusing "{entryDir}".""")
+        return entryDir
+    logger.info(f"""Cache miss for stage "{stageName}": running it.""")
+    partialDir = cacheDir.joinpath(stageName, f"{key}{PARTIAL_SUFFIX}-{os.getpid()}")
+    partialDir.mkdir(parents=True, exist_ok=False)
+    try:
+        run(partialDir)
+        now = time.time()
+        entry = {"stage": stageName,
+                 "key": key,
+                 "createdAt": now,
+                 "lastUsedAt": now,
+                 "sizeBytes": directorySize(partialDir),
+                 "inputs": inputHashes,
+                 "parameters": parameters,
+                 "code": codeVersion()}
+        writeCacheEntry(partialDir, entry)
+        entryDir = cacheDir.joinpath(stageName, key)
+        if entryDir.exists():
+            # Another run finished the same entry first
+            shutil.rmtree(partialDir)
+        else:
+            os.replace(partialDir, entryDir)
+    except BaseException:
+        shutil.rmtree(partialDir, ignore_errors=True)
+        raise
+    return entryDir
+
+
+def evictCache(cacheDir: Path,
+               maxBytes: Union[int, None],
+               maxAgeDays: Union[float, None],
+               logger: logging.Logger,
+               keep: Iterable[Path] = ()) -> List[Path]:
+    """
+    Removes cache entries that haven't been used for `maxAgeDays`, then the least recently used entries until the cache is at most `maxBytes`. Entries in `keep` are never removed.
+    Partial entries left over from failed runs are removed too. Returns the removed directories.
+    """
+    if not cacheDir.exists():
+        return []
+    keep = {Path(path).absolute() for path in keep}
+    now = time.time()
+    removed = []
+    entries = []
+    for stageDir in (path for path in cacheDir.iterdir() if path.is_dir()):
+        for entryDir in (path for path in stageDir.iterdir() if path.is_dir()):
+            if entryDir.joinpath(CACHE_ENTRY_FILE_NAME).exists():
+                entry = readCacheEntry(entryDir)
+                entries.append((entry["lastUsedAt"], entry["sizeBytes"], entryDir))
+            elif PARTIAL_SUFFIX in entryDir.name and now - entryDir.stat().st_mtime > PARTIAL_MAX_AGE_SECONDS:
+                shutil.rmtree(entryDir, ignore_errors=True)
+                removed.append(entryDir)
+    entries.sort()
+    totalBytes = sum(sizeBytes for _, sizeBytes, _ in entries)
+    for lastUsedAt, sizeBytes, entryDir in entries:
+        if entryDir.absolute() in keep:
+            continue
+        isOld = maxAgeDays is not None and now - lastUsedAt > maxAgeDays * 24 * 60 * 60
+        isOverSize = maxBytes is not None and totalBytes > maxBytes
+        if isOld or isOverSize:
+            shutil.rmtree(entryDir, ignore_errors=True)
+            removed.append(entryDir)
+            totalBytes -= sizeBytes
+    for entryDir in removed:
+        logger.info(f"""Evicted "{entryDir}" from the cache.""")
+    return removed
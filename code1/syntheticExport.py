@@ -0,0 +1,193 @@
+"""
+Writes synthetic Apple Health exports, for testing and benchmarking the pipeline without real health data.
+
+The exports mimic the layout of Apple's "export.xml": a DTD header, one top-level element per record, several sources and devices, time zone offsets that change as if traveling, and blood pressure readings stored both as top-level records and inside correlations.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Union
+# Third-party packages
+import numpy as np
+import pandas as pd
+
+SBP_RECORD_TYPE = "HKQuantityTypeIdentifierBloodPressureSystolic"
+DBP_RECORD_TYPE = "HKQuantityTypeIdentifierBloodPressureDiastolic"
+
+# Record type: (unit, value mean, value standard deviation, share of the non-blood pressure records)
+QUANTITY_TYPES = {"HKQuantityTypeIdentifierHeartRate": ("count/min", 72, 12, 0.55),
+                  "HKQuantityTypeIdentifierStepCount": ("count", 400, 250, 0.25),
+                  "HKQuantityTypeIdentifierActiveEnergyBurned": ("Cal", 2, 1, 0.15),
+                  "HKCategoryTypeIdentifierMindfulSession": ("", 0, 0, 0.04),
+                  "Workout": ("", 0, 0, 0.01)}
+
+# Source name: (source version, device description)
+WATCH_SOURCE = ("Apple Watch", "9.5", "&lt;&lt;HKDevice: 0x283f5a8a0&gt;, name:Apple Watch, manufacturer:Apple Inc., model:Watch, hardware:Watch6,1, software:9.5&gt;")
+PHONE_SOURCE = ("iPhone", "16.5", "&lt;&lt;HKDevice: 0x283f5b2f0&gt;, name:iPhone, manufacturer:Apple Inc., model:iPhone, hardware:iPhone13,2, software:16.5&gt;")
+BP_SOURCES = [("Beurer HealthManager", "2.4", ""),
+              ("OMRON connect", "7.3.1", "&lt;&lt;HKDevice: 0x283f4c1e0&gt;, name:BP7250, manufacturer:OMRON HEALTHCARE, model:BP7250&gt;")]
+
+# Offsets, in minutes, and the share of the time spent in each
+TIMEZONE_OFFSETS = {-240: 0.55, -300: 0.35, 60: 0.07, 540: 0.03}
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation|Workout|ActivitySummary|ClinicalRecord)*)>
+<!ATTLIST HealthData
+  locale CDATA #REQUIRED
+>
+<!ELEMENT Record ((MetadataEntry|HeartRateVariabilityMetadataList)*)>
+<!ATTLIST Record
+  type          CDATA #REQUIRED
+  unit          CDATA #IMPLIED
+  value         CDATA #IMPLIED
+  sourceName    CDATA #REQUIRED
+  sourceVersion CDATA #IMPLIED
+  device        CDATA #IMPLIED
+  creationDate  CDATA #IMPLIED
+  startDate     CDATA #REQUIRED
+  endDate       CDATA #REQUIRED
+>
+]>
+<HealthData locale="en_US">
+ <ExportDate value="{exportDate}"/>
+ <Me HKCharacteristicTypeIdentifierDateOfBirth="1988-01-01" HKCharacteristicTypeIdentifierBiologicalSex="HKBiologicalSexMale" HKCharacteristicTypeIdentifierBloodType="HKBloodTypeNotSet" HKCharacteristicTypeIdentifierFitzpatrickSkinType="HKFitzpatrickSkinTypeNotSet" HKCharacteristicTypeIdentifierCardioFitnessMedicationsUse="None"/>
+"""
+FOOTER = "</HealthData>\n"
+
+
+def formatAppleTimestamps(utcSeconds: np.ndarray, offsetMinutes: np.ndarray) -> np.ndarray:
+    """
+    Formats UTC epoch seconds as Apple Health timestamps, "YYYY-MM-DD HH:MM:SS ±HHMM", in the given local offsets.
+    """
+    local = (utcSeconds + offsetMinutes * 60).astype("datetime64[s]")
+    localText = np.char.replace(np.datetime_as_string(local, unit="s"), "T", " ")
+    signs = np.where(offsetMinutes < 0, "-", "+")
+    absoluteOffsets = np.abs(offsetMinutes)
+    offsetText = np.char.add(signs, np.char.zfill((absoluteOffsets // 60 * 100 + absoluteOffsets % 60).astype(str), 4))
+    result = np.char.add(np.char.add(localText, " "), offsetText)
+    return result
+
+
+def offsetsAt(utcSeconds: np.ndarray, startSeconds: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Assigns a time zone offset to each time, changing offsets every few weeks as if traveling.
+    """
+    periods = (utcSeconds - startSeconds) // (21 * 86400)
+    offsets = np.array(list(TIMEZONE_OFFSETS.keys()))
+    weights = np.array(list(TIMEZONE_OFFSETS.values()))
+    periodOffsets = rng.choice(offsets, size=int(periods.max()) + 1 if len(periods) else 1, p=weights / weights.sum())
+    result = periodOffsets[periods]
+    return result
+
+
+def recordLines(recordTypes: np.ndarray,
+                sources: list,
+                sourceCodes: np.ndarray,
+                units: np.ndarray,
+                values: np.ndarray,
+                creationDates: np.ndarray,
+                startDates: np.ndarray,
+                endDates: np.ndarray,
+                indent: str = " ") -> list:
+    """
+    Formats `Record` elements, one line each.
+    """
+    result = [f"""{indent}<Record type="{recordType}" sourceName="{sources[sourceCode][0]}" sourceVersion="{sources[sourceCode][1]}"{f' device="{sources[sourceCode][2]}"' if sources[sourceCode][2] else ""} unit="{unit}" creationDate="{creationDate}" startDate="{startDate}" endDate="{endDate}" value="{value}"/>\n"""
+              for recordType, sourceCode, unit, value, creationDate, startDate, endDate in zip(recordTypes, sourceCodes, units, values, creationDates, startDates, endDates)]
+    return result
+
+
+def generateChunk(numRecords: int,
+                  startSeconds: int,
+                  spanSeconds: int,
+                  bpFraction: float,
+                  rng: np.random.Generator) -> list:
+    """
+    Generates the lines of `numRecords` records, in time order, for one chunk of the export.
+    Each blood pressure reading contributes a systolic and a diastolic record.
+    """
+    times = np.sort(rng.integers(startSeconds, startSeconds + spanSeconds, size=numRecords))
+    offsets = offsetsAt(times, startSeconds, rng)
+    isBP = rng.random(numRecords) < bpFraction / 2
+    typeNames = np.array(list(QUANTITY_TYPES.keys()))
+    typeShares = np.array([share for *_, share in QUANTITY_TYPES.values()])
+    typeCodes = rng.choice(len(typeNames), size=numRecords, p=typeShares / typeShares.sum())
+    durations = np.where(typeNames[typeCodes] == "Workout", rng.integers(15, 90, size=numRecords) * 60,
+                         np.where(typeNames[typeCodes] == "HKCategoryTypeIdentifierMindfulSession", 600, rng.integers(0, 120, size=numRecords)))
+    durations[isBP] = 0
+    creationDates = formatAppleTimestamps(times + durations + rng.integers(1, 300, size=numRecords), offsets)
+    startDates = formatAppleTimestamps(times, offsets)
+    endDates = formatAppleTimestamps(times + durations, offsets)
+    bpSourceCodes = rng.integers(0, len(BP_SOURCES), size=numRecords)
+    otherSourceCodes = rng.integers(0, 2, size=numRecords)
+    systolic = np.round(rng.normal(125, 12, size=numRecords)).astype(int)
+    diastolic = np.round(systolic * 0.65 + rng.normal(0, 5, size=numRecords)).astype(int)
+
+    lines = []
+    for it in range(numRecords):
+        if isBP[it]:
+            source = BP_SOURCES[bpSourceCodes[it]]
+            bpLines = recordLines(recordTypes=[SBP_RECORD_TYPE, DBP_RECORD_TYPE],
+                                  sources=BP_SOURCES,
+                                  sourceCodes=[bpSourceCodes[it]] * 2,
+                                  units=["mmHg"] * 2,
+                                  values=[systolic[it], diastolic[it]],
+                                  creationDates=[creationDates[it]] * 2,
+                                  startDates=[startDates[it]] * 2,
+                                  endDates=[endDates[it]] * 2)
+            lines.extend(bpLines)
+            lines.append(f""" <Correlation type="HKCorrelationTypeIdentifierBloodPressure" sourceName="{source[0]}" sourceVersion="{source[1]}" creationDate="{creationDates[it]}" startDate="{startDates[it]}" endDate="{endDates[it]}">\n""")
+            lines.extend(" " + line for line in bpLines)
+            lines.append(" </Correlation>\n")
+            continue
+        recordType = typeNames[typeCodes[it]]
+        source = (WATCH_SOURCE, PHONE_SOURCE)[otherSourceCodes[it]]
+        if recordType == "Workout":
+            lines.append(f""" <Workout workoutActivityType="HKWorkoutActivityTypeWalking" duration="{durations[it] / 60:.1f}" durationUnit="min" sourceName="{source[0]}" sourceVersion="{source[1]}" device="{source[2]}" creationDate="{creationDates[it]}" startDate="{startDates[it]}" endDate="{endDates[it]}"/>\n""")
+        elif recordType == "HKCategoryTypeIdentifierMindfulSession":
+            lines.append(f""" <Record type="{recordType}" sourceName="{source[0]}" sourceVersion="{source[1]}" device="{source[2]}" creationDate="{creationDates[it]}" startDate="{startDates[it]}" endDate="{endDates[it]}" value="HKCategoryValueNotApplicable"/>\n""")
+        else:
+            unit, mean, standardDeviation, _ = QUANTITY_TYPES[recordType]
+            value = max(0, round(rng.normal(mean, standardDeviation), 2))
+            lines.append(f""" <Record type="{recordType}" sourceName="{source[0]}" sourceVersion="{source[1]}" device="{source[2]}" unit="{unit}" creationDate="{creationDates[it]}" startDate="{startDates[it]}" endDate="{endDates[it]}" value="{value:g}"/>\n""")
+    return lines
+
+
+def writeSyntheticExport(filePath: Union[str, Path],
+                         numRecords: int,
+                         seed: Union[int, None] = 0,
+                         startDate: str = "2021-01-01",
+                         years: float = 2.0,
+                         bpFraction: float = 0.02,
+                         chunkSize: int = 100_000) -> Dict[str, int]:
+    """
+    Writes a synthetic "export.xml" with about `numRecords` top-level records spread over `years` years, of which about `bpFraction` are blood pressure records.
+    The file is written in chunks, so exports of tens of millions of records can be generated with bounded memory.
+    Returns the number of lines written and of blood pressure readings.
+    """
+    rng = np.random.default_rng(seed)
+    startSeconds = int(pd.Timestamp(startDate, tz="UTC").timestamp())
+    spanSeconds = int(years * 365.25 * 86400)
+    numChunks = max(1, -(-numRecords // chunkSize))
+    chunkSpan = spanSeconds // numChunks
+    numLines = 0
+    numReadings = 0
+    Path(filePath).parent.mkdir(parents=True, exist_ok=True)
+    with open(filePath, "w", encoding="utf-8") as file:
+        file.write(HEADER.format(exportDate=formatAppleTimestamps(np.array([startSeconds + spanSeconds]), np.array([-240]))[0]))
+        for chunk in range(numChunks):
+            chunkRecords = min(chunkSize, numRecords - chunk * chunkSize)
+            lines = generateChunk(numRecords=chunkRecords,
+                                  startSeconds=startSeconds + chunk * chunkSpan,
+                                  spanSeconds=chunkSpan,
+                                  bpFraction=bpFraction,
+                                  rng=rng)
+            file.writelines(lines)
+            numLines += len(lines)
+            numReadings += sum(1 for line in lines if line.startswith(" <Correlation"))
+        file.write(FOOTER)
+    result = {"lines": numLines,
+              "bloodPressureReadings": numReadings}
+    return result
@@ -0,0 +1,262 @@
+"""
+Tests that compare the vectorized functions in "functions.py" with simple, row-by-row reference implementations on small fixtures.
+"""
+
+from __future__ import annotations
+
+import logging
+import xml.etree.ElementTree as ET
+# Third-party packages
+import numpy as np
+import pandas as pd
+import pytest
+# Local packages
+from code1.functions import clusterMeasurementSessions, compactTable, labelByEventProximity, labelByTimeOfDay, labelIntervals, loadTable, loadTableMetadata, pairBloodPressure, parseAppleTimestamps, parseTimes, saveTable, streamRecordsByType
+from code1.syntheticExport import DBP_RECORD_TYPE, SBP_RECORD_TYPE, writeSyntheticExport
+
+LOGGER = logging.getLogger(__name__)
+
+
+def test_streamRecordsByType(tmp_path):
+    """
+    The tables match those built from the whole parsed tree: the direct children of the root element of each record type or tag, with all their attributes or only the requested ones.
+    """
+    filePath = tmp_path.joinpath("export.xml")
+    writeSyntheticExport(filePath, numRecords=2_000, seed=0, bpFraction=0.1)
+    recordTypes = [SBP_RECORD_TYPE, DBP_RECORD_TYPE, "Workout", "HKQuantityTypeIdentifierBodyMass"]
+    attributes = {"Workout": ["startDate", "endDate"]}
+    tables = streamRecordsByType(filePath=filePath, recordTypes=recordTypes, attributes=attributes)
+
+    root = ET.parse(filePath).getroot()
+    assert len(tables[SBP_RECORD_TYPE]) > 0
+    for recordType in recordTypes:
+        elements = [element for element in root if (element.get("type") if element.tag == "Record" else element.tag) == recordType]
+        if recordType in attributes:
+            records = [{attribute: element.get(attribute) for attribute in attributes[recordType]} for element in elements]
+        else:
+            records = [dict(element.attrib) for element in elements]
+        pd.testing.assert_frame_equal(tables[recordType], pd.DataFrame.from_records(records))
+
+
+def test_labelIntervals():
+    """
+    Each observation is in an interval if both its start and its end are in the half-open interval.
+    """
+    rng = np.random.default_rng(0)
+    intervalStarts = rng.integers(0, 100, size=6)
+    intervalStops = intervalStarts + rng.integers(1, 40, size=6)
+    startNanoseconds = rng.integers(-10, 150, size=300)
+    endNanoseconds = startNanoseconds + rng.integers(0, 10, size=300)
+    # Observations on the interval boundaries
+    startNanoseconds[:12] = np.concatenate([intervalStarts, intervalStops])
+    endNanoseconds[:12] = startNanoseconds[:12]
+
+    result = labelIntervals(startNanoseconds=startNanoseconds,
+                            endNanoseconds=endNanoseconds,
+                            intervalStarts=intervalStarts,
+                            intervalStops=intervalStops)
+
+    expected = np.zeros((len(startNanoseconds), len(intervalStarts)), dtype=bool)
+    for it, (start, end) in enumerate(zip(startNanoseconds, endNanoseconds)):
+        for jt, (intervalStart, intervalStop) in enumerate(zip(intervalStarts, intervalStops)):
+            expected[it, jt] = intervalStart <= start < intervalStop and intervalStart <= end < intervalStop
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_labelByTimeOfDay():
+    """
+    Records are labeled by the local time of day of their start and end, in their own offsets, including windows that wrap past midnight, whether or not their times were parsed by `parseTimes`.
+    """
+    rng = np.random.default_rng(4)
+    timeWindows = {"Night": {"start": "22:00:00", "stop": "06:00:00"},
+                   "Morning": {"start": "06:00:00", "stop": "12:00:00"},
+                   "Afternoon and Evening": {"start": "12:00:00", "stop": "22:00:00"}}
+    localStarts = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 3 * 24 * 60, size=200), unit="m")
+    # Readings that end a few minutes after they start, some of them across a window boundary, e.g., midnight
+    localEnds = localStarts + pd.to_timedelta(rng.choice([0, 0, 5, 30], size=200), unit="m")
+    offsets = rng.choice(["-0500", "-0400", "+0000", "+0530", "+0900"], size=200)
+    table = pd.DataFrame({"startDate": [f"{start:%Y-%m-%d %H:%M:%S} {offset}" for start, offset in zip(localStarts, offsets)],
+                          "endDate": [f"{end:%Y-%m-%d %H:%M:%S} {offset}" for end, offset in zip(localEnds, offsets)]})
+
+    def inWindow(minute, window):
+        start = pd.Timestamp(window["start"]).hour * 60 + pd.Timestamp(window["start"]).minute
+        stop = pd.Timestamp(window["stop"]).hour * 60 + pd.Timestamp(window["stop"]).minute
+        return start <= minute < stop if start < stop else (minute >= start or minute < stop)
+
+    expected = {group: [inWindow(start.hour * 60 + start.minute, window) and inWindow(end.hour * 60 + end.minute, window) for start, end in zip(localStarts, localEnds)]
+                for group, window in timeWindows.items()}
+    unparsedTable = labelByTimeOfDay(tablesToProcess={"Systolic BP": table.copy()}, timeWindows=timeWindows, logger=LOGGER)["Systolic BP"]
+    parsedTable = labelByTimeOfDay(tablesToProcess={"Systolic BP": parseTimes(table.copy())}, timeWindows=timeWindows, logger=LOGGER)["Systolic BP"]
+    for result in [unparsedTable, parsedTable]:
+        for group in timeWindows.keys():
+            np.testing.assert_array_equal(result[group], expected[group])
+        np.testing.assert_array_equal(result["QA: Unassigned (Groups)"], ~pd.DataFrame(expected).any(axis=1))
+
+
+@pytest.mark.parametrize("suffix", [".parquet", ".feather"])
+def test_saveTableRoundTrip(tmp_path, suffix):
+    """
+    A table saved by `saveTable` loads with the same values and types, with only the requested columns, and with its metadata.
+    """
+    table = pd.DataFrame({"type": pd.Categorical(["BP", "BP", "HR"]),
+                          "sourceName": pd.Categorical(["OMRON", "Beurer", "OMRON"]),
+                          "startDate": pd.to_datetime(["2023-01-01 08:00", "2023-01-01 20:30", "2023-01-02 07:15"], utc=True),
+                          "value": np.array([120, 135, 61], dtype=np.int16),
+                          "Group 1 (Morning)": [True, False, True]})
+    metadata = {"allGroups": ["Group 1 (Morning)"],
+                "groupTimes": {"Group 1 (Morning)": {"start": "03:00:00-04:00", "stop": "12:00:00-04:00"}},
+                "allMedications": [],
+                "allProximityLabels": []}
+    savepath = tmp_path.joinpath(f"Systolic BP{suffix}")
+    saveTable(table=table, savepath=savepath, metadata=metadata)
+
+    pd.testing.assert_frame_equal(loadTable(savepath), table)
+    pd.testing.assert_frame_equal(loadTable(savepath, columns=["startDate", "value"]), table[["startDate", "value"]])
+    assert loadTableMetadata(savepath) == metadata
+    table.to_csv(tmp_path.joinpath("Systolic BP.CSV"), index=False)
+    assert loadTableMetadata(tmp_path.joinpath("Systolic BP.CSV")) == {}
+
+
+def test_pairBloodPressure():
+    """
+    Each systolic reading is paired with the nearest diastolic reading of its source within the tolerance, and each diastolic reading is kept only for its closest systolic reading.
+    """
+    rng = np.random.default_rng(1)
+    tolerance = pd.Timedelta(minutes=2)
+
+    def readings(numReadings):
+        # Distinct times, so that there are no ties between gaps
+        seconds = np.sort(rng.choice(3 * 60 * 60, size=numReadings, replace=False))
+        return pd.DataFrame({"type": "BP",
+                             "sourceName": rng.choice(["Beurer", "OMRON"], size=numReadings),
+                             "startDate": pd.to_datetime(seconds, unit="s", utc=True) + pd.Timedelta(milliseconds=1) * rng.random(numReadings),
+                             "value": np.arange(numReadings)})
+
+    tableSBP = readings(120)
+    tableDBP = readings(100)
+    pairedTable = pairBloodPressure(tableSBP=tableSBP,
+                                    tableDBP=tableDBP,
+                                    tolerance=tolerance,
+                                    logger=LOGGER)
+
+    nearest = {}
+    for it, systolic in tableSBP.iterrows():
+        gaps = (tableDBP["startDate"] - systolic["startDate"]).abs()
+        gaps = gaps[(tableDBP["sourceName"] == systolic["sourceName"]) & (gaps <= tolerance)]
+        if len(gaps) > 0:
+            nearest[it] = (gaps.idxmin(), gaps.min())
+    closest = {}
+    for it, (jt, gap) in nearest.items():
+        if jt not in closest or gap < closest[jt][1]:
+            closest[jt] = (it, gap)
+    expectedPairs = sorted((it, jt) for jt, (it, _) in closest.items())
+
+    assert list(zip(pairedTable["systolic"], pairedTable["diastolic"])) == expectedPairs
+    np.testing.assert_array_equal(tableSBP["QA: Unpaired"], ~tableSBP.index.isin([it for it, _ in expectedPairs]))
+    np.testing.assert_array_equal(tableDBP["QA: Unpaired"], ~tableDBP.index.isin([jt for _, jt in expectedPairs]))
+
+
+def test_labelByEventProximity():
+    """
+    A record is labeled if any event overlaps the span from `before` its start to `after` its end.
+    """
+    rng = np.random.default_rng(2)
+    before = pd.Timedelta(minutes=30)
+    after = pd.Timedelta(minutes=10)
+
+    def spans(numSpans, maxMinutes):
+        startDates = pd.to_datetime(rng.integers(0, 24 * 60, size=numSpans), unit="m", utc=True)
+        return pd.DataFrame({"startDate": startDates,
+                             "endDate": startDates + pd.to_timedelta(rng.integers(0, maxMinutes, size=numSpans), unit="m")})
+
+    table = spans(200, 5)
+    eventTable = spans(15, 90)
+    result = labelByEventProximity(tablesToProcess={"Systolic BP": table.copy()},
+                                   eventTables={"Workout": eventTable, "Nothing": eventTable.iloc[:0]},
+                                   before=before,
+                                   after=after,
+                                   logger=LOGGER)["Systolic BP"]
+
+    expected = [((eventTable["startDate"] <= record["endDate"] + after) & (eventTable["endDate"] >= record["startDate"] - before)).any() for _, record in table.iterrows()]
+    np.testing.assert_array_equal(result["Workout"], expected)
+    assert not result["Nothing"].any()
+
+
+def test_clusterMeasurementSessions():
+    """
+    Readings are in the same session if they are from the same source and each follows the previous one by no more than the gap.
+    """
+    rng = np.random.default_rng(3)
+    gap = pd.Timedelta(minutes=5)
+    table = pd.DataFrame({"sourceName": rng.choice(["Beurer", "OMRON", "iPhone"], size=300),
+                          "startDate": pd.to_datetime(rng.integers(0, 12 * 60 * 60, size=300), unit="s", utc=True)})
+    sessions = clusterMeasurementSessions(table=table, gap=gap)
+
+    expected = np.empty(len(table), dtype=np.int64)
+    sessionNumber = -1
+    for _, group in table.groupby("sourceName"):
+        previousDate = None
+        for it, startDate in group["startDate"].sort_values(kind="stable").items():
+            if previousDate is None or startDate - previousDate > gap:
+                sessionNumber += 1
+            expected[it] = sessionNumber
+            previousDate = startDate
+    # Session numbers may differ, but the readings must be grouped the same way
+    np.testing.assert_array_equal(pd.factorize(sessions)[0], pd.factorize(expected)[0])
+
+
+def test_compactTable():
+    """
+    Tabulated records, whose attributes are all strings, keep their values with compact types, and the device description is dropped unless asked for.
+    """
+    table = pd.DataFrame({"type": ["HKQuantityTypeIdentifierBloodPressureSystolic"] * 3,
+                          "sourceName": ["OMRON connect", "Beurer HealthManager", "OMRON connect"],
+                          "device": ["<<HKDevice: 0x283f4c1e0>, name:BP7250>", "", "<<HKDevice: 0x283f4c1e0>, name:BP7250>"],
+                          "value": ["120", "135", "118"],
+                          "startDate": ["2023-01-01 08:00:00 -0400", "2023-01-01 20:30:00 -0500", "2023-01-02 07:15:00 +0100"]})
+    result = compactTable(table=table)
+
+    assert "device" not in result.columns
+    assert "device" in compactTable(table=table, keepDevice=True).columns
+    assert isinstance(result["type"].dtype, pd.CategoricalDtype) and isinstance(result["sourceName"].dtype, pd.CategoricalDtype)
+    assert list(result["sourceName"]) == list(table["sourceName"])
+    assert result["value"].dtype == np.int16
+    assert list(result["value"]) == [120, 135, 118]
+    assert list(result["startDate"]) == [pd.Timestamp(value).tz_convert("UTC") for value in table["startDate"]]
+    assert compactTable(table=table, convertTimes=False)["startDate"].equals(table["startDate"])
+    # Fractions and missing values need floats
+    assert compactTable(table=table.assign(value=["98.6", None, "99"]))["value"].dtype == np.float32
+    assert compactTable(table=table.assign(value=["70000", "1", "2"]))["value"].dtype == np.int32
+
+
+def test_parseAppleTimestamps():
+    """
+    Timestamps are parsed as by `pd.Timestamp`, whether they are in Apple's format or not.
+    """
+    values = ["2023-01-01 08:00:00 -0400",
+              "2023-12-31 23:59:59 -0500",
+              "2024-02-29 12:30:15 +0000",
+              "2000-03-01 00:00:00 +0530",
+              "1999-12-31 22:15:00 +0900",
+              "2100-02-28 06:45:30 -0930",
+              "2023-06-15T10:20:30+02:00",
+              "2023-06-15 10:20:30"]
+    result = parseAppleTimestamps(values)
+    for it, value in enumerate(values):
+        timestamp = pd.Timestamp(value)
+        utcOffset = timestamp.utcoffset()
+        assert result["utcNanoseconds"][it] == timestamp.as_unit("ns").value
+        assert result["offsetMinutes"][it] == (0 if utcOffset is None else utcOffset.total_seconds() // 60)
+        assert result["localMinute"][it] == timestamp.hour * 60 + timestamp.minute
+
+
+def test_parseAppleTimestampsMissingAndInvalid():
+    """
+    Missing values are marked as such, and impossible dates are rejected instead of rolling over.
+    """
+    result = parseAppleTimestamps([None, np.nan])
+    np.testing.assert_array_equal(result["utcNanoseconds"], np.iinfo(np.int64).min)
+    np.testing.assert_array_equal(result["localMinute"], -1)
+    for value in ["2023-02-29 00:00:00 +0000", "2023-02-30 00:00:00 +0000", "1900-02-29 00:00:00 +0000", "2023-04-31 00:00:00 +0000"]:
+        with pytest.raises(ValueError):
+            parseAppleTimestamps([value])
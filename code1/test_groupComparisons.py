@@ -0,0 +1,85 @@
+"""
+Tests that compare the t-tests computed from per-group sufficient statistics with `scipy.stats.ttest_ind` on the readings of each group.
+"""
+
+from __future__ import annotations
+
+# Third-party packages
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.stats as sps
+# Local packages
+from code1.groupComparisons import adjustPValues, compareAllPairs, countSharedReadings, summarizeGroups
+
+
+def labeledTable(numObservations: int = 300, seed: int = 0) -> pd.DataFrame:
+    """
+    A table with a medication label and time groups that partition the observations, so that the medication shares readings with every time group.
+    """
+    rng = np.random.default_rng(seed)
+    timeGroup = rng.integers(0, 3, size=numObservations)
+    table = pd.DataFrame({"A": rng.random(numObservations) < 0.4,
+                          "Morning": timeGroup == 0,
+                          "Afternoon": timeGroup == 1,
+                          "Evening": timeGroup == 2})
+    table["value"] = np.round(rng.normal(120, 10, size=numObservations) + 4 * table["Morning"] - 2 * table["Evening"])
+    return table
+
+
+@pytest.mark.parametrize("equalVariance", [True, False])
+def test_compareAllPairs(equalVariance):
+    """
+    Counts, means, t-statistics, and p-values match those of `scipy.stats.ttest_ind`.
+    """
+    table = labeledTable()
+    labelColumns = ["Morning", "Afternoon", "Evening"]
+    summary = summarizeGroups(table=table, labelColumns=labelColumns, valueColumn="value")
+    results = compareAllPairs(summary=summary, equalVariance=equalVariance, correction=None)
+
+    assert len(results) == 3
+    for _, row in results.iterrows():
+        values0 = table.loc[table[row["group0"]], "value"]
+        values1 = table.loc[table[row["group1"]], "value"]
+        expected = sps.ttest_ind(a=values0, b=values1, equal_var=equalVariance)
+        assert (row["n0"], row["n1"]) == (len(values0), len(values1))
+        assert row["meanDifference"] == pytest.approx(values0.mean() - values1.mean())
+        assert row["tValue"] == pytest.approx(expected.statistic)
+        assert row["pValue"] == pytest.approx(expected.pvalue)
+
+
+def test_compareAllPairsSharedReadings():
+    """
+    Pairs of groups that share readings get no test statistics and are left out of the correction.
+    """
+    table = labeledTable()
+    labelColumns = ["A", "Morning", "Afternoon", "Evening"]
+    summary = summarizeGroups(table=table, labelColumns=labelColumns, valueColumn="value")
+    sharedReadings = countSharedReadings(table=table, labelColumns=labelColumns)
+    results = compareAllPairs(summary=summary, equalVariance=True, correction="holm", sharedReadings=sharedReadings)
+
+    isShared = results["group0"] == "A"
+    assert (results.loc[isShared, "nShared"] == [(table["A"] & table[group]).sum() for group in results.loc[isShared, "group1"]]).all()
+    assert results.loc[isShared, ["tValue", "pValue", "pValueAdjusted"]].isna().all().all()
+    assert (results.loc[~isShared, "nShared"] == 0).all()
+    np.testing.assert_allclose(results.loc[~isShared, "pValueAdjusted"], adjustPValues(results.loc[~isShared, "pValue"], method="holm"))
+
+
+def test_adjustPValues():
+    """
+    The corrections match their definitions, computed one p-value at a time.
+    """
+    pValues = np.array([0.01, 0.04, 0.03, 0.2, np.nan, 0.005])
+    p = pValues[~np.isnan(pValues)]
+    m = len(p)
+    order = np.argsort(p)
+    holm = np.empty(m)
+    fdr = np.empty(m)
+    for rank, it in enumerate(order):
+        holm[it] = min(1.0, max((m - earlierRank) * p[order[earlierRank]] for earlierRank in range(rank + 1)))
+        fdr[it] = min(1.0, min(m / (laterRank + 1) * p[order[laterRank]] for laterRank in range(rank, m)))
+
+    np.testing.assert_allclose(adjustPValues(pValues, method="bonferroni")[~np.isnan(pValues)], np.minimum(p * m, 1.0))
+    np.testing.assert_allclose(adjustPValues(pValues, method="holm")[~np.isnan(pValues)], holm)
+    np.testing.assert_allclose(adjustPValues(pValues, method="fdr_bh")[~np.isnan(pValues)], fdr)
+    assert np.isnan(adjustPValues(pValues, method="holm")[4])
@@ -0,0 +1,37 @@
+"""
+Tests that parsing an export in parallel byte ranges gives the same tables as parsing it serially.
+"""
+
+from __future__ import annotations
+
+# Third-party packages
+import pandas as pd
+# Local packages
+from code1.parallelIngestion import parseRecordsParallel, splitExport
+from code1.syntheticExport import DBP_RECORD_TYPE, SBP_RECORD_TYPE, writeSyntheticExport
+from code1.functions import streamRecordsByType
+
+
+def test_parseRecordsParallel(tmp_path):
+    """
+    The tables of every requested type, including types found inside correlations and types whose attributes are restricted, are the same.
+    """
+    filePath = tmp_path.joinpath("export.xml")
+    writeSyntheticExport(filePath, numRecords=3_000, seed=0, bpFraction=0.1)
+    recordTypes = [SBP_RECORD_TYPE, DBP_RECORD_TYPE, "HKQuantityTypeIdentifierHeartRate", "Workout", "HKQuantityTypeIdentifierBodyMass"]
+    attributes = {"Workout": ["startDate", "endDate"]}
+    chunkSizeBytes = filePath.stat().st_size // 7
+    assert len(splitExport(filePath, 7)) == 7
+
+    serialTables = streamRecordsByType(filePath=filePath, recordTypes=recordTypes, attributes=attributes)
+    parallelTables = parseRecordsParallel(filePath=filePath,
+                                          recordTypes=recordTypes,
+                                          attributes=attributes,
+                                          maxWorkers=2,
+                                          chunkSizeBytes=chunkSizeBytes)
+
+    assert list(parallelTables.keys()) == recordTypes
+    assert len(serialTables[SBP_RECORD_TYPE]) > 0
+    assert list(parallelTables["Workout"].columns) == ["startDate", "endDate"]
+    for recordType in recordTypes:
+        pd.testing.assert_frame_equal(parallelTables[recordType], serialTables[recordType])
@@ -0,0 +1,87 @@
+"""
+Tests of the downsampling of series for plotting, against point-by-point implementations.
+"""
+
+from __future__ import annotations
+
+# Third-party packages
+import numpy as np
+import pytest
+# Local packages
+pytest.importorskip("drapi")
+from code1.plotData import decimate, lttbIndices, minMaxIndices  # noqa: E402
+
+
+def randomWalk(numPoints: int = 10_000, seed: int = 0):
+    """
+    An unevenly spaced random walk, sorted by `x`.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.exponential(1.0, size=numPoints))
+    y = np.cumsum(rng.normal(size=numPoints))
+    return x, y
+
+
+def assertValidIndices(indices: np.ndarray, numPoints: int, maxPoints: int):
+    """
+    The indices are sorted, unique, within the series, at most `maxPoints`, and include the first and last points.
+    """
+    assert (np.diff(indices) > 0).all()
+    assert indices[0] == 0 and indices[-1] == numPoints - 1
+    assert len(indices) <= maxPoints
+
+
+@pytest.mark.parametrize("maxPoints", [4, 5, 100, 1001])
+def test_minMaxIndices(maxPoints):
+    """
+    The lowest and highest point of every bin are kept, and nothing else but the first and last points.
+    """
+    x, y = randomWalk()
+    indices = minMaxIndices(x, y, maxPoints)
+    assertValidIndices(indices, numPoints=len(x), maxPoints=maxPoints)
+
+    nBins = maxPoints // 2 - 1
+    expected = {0, len(x) - 1}
+    for it in range(nBins):
+        binStart = x[0] + (x[-1] - x[0]) * it / nBins
+        binStop = x[0] + (x[-1] - x[0]) * (it + 1) / nBins
+        inBin = np.flatnonzero((x >= binStart) & ((x < binStop) if it < nBins - 1 else (x <= binStop)))
+        if len(inBin) > 0:
+            expected.update([inBin[np.argmin(y[inBin])], inBin[np.argmax(y[inBin])]])
+    assert set(indices) == expected
+    assert np.argmin(y) in indices and np.argmax(y) in indices
+
+
+@pytest.mark.parametrize("maxPoints", [3, 4, 100, 1001])
+def test_lttbIndices(maxPoints):
+    """
+    Each bucket keeps the point that makes the largest triangle with the point kept from the previous bucket and the mean of the next bucket.
+    """
+    x, y = randomWalk()
+    indices = lttbIndices(x, y, maxPoints)
+    assertValidIndices(indices, numPoints=len(x), maxPoints=maxPoints)
+    assert len(indices) == maxPoints
+
+    n = len(x)
+    edges = [int(edge) for edge in np.linspace(1, n - 1, maxPoints - 1)] + [n]
+    expected = [0]
+    for it in range(maxPoints - 2):
+        nextX = np.mean(x[edges[it + 1]:edges[it + 2]])
+        nextY = np.mean(y[edges[it + 1]:edges[it + 2]])
+        a = expected[-1]
+        areas = [abs((x[a] - nextX) * (y[b] - y[a]) - (x[a] - x[b]) * (nextY - y[a])) for b in range(edges[it], edges[it + 1])]
+        expected.append(edges[it] + int(np.argmax(areas)))
+    expected.append(n - 1)
+    np.testing.assert_array_equal(indices, expected)
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_decimateShortSeries(method):
+    """
+    Series with at most `maxPoints` points are kept whole, and unknown methods are rejected.
+    """
+    x, y = randomWalk(numPoints=50)
+    np.testing.assert_array_equal(decimate(x, y, maxPoints=50, method=method), np.arange(50))
+    np.testing.assert_array_equal(decimate(x[:1], y[:1], maxPoints=10, method=method), [0])
+    with pytest.raises(Exception):
+        decimate(x, y, maxPoints=10, method="mean")
@@ -0,0 +1,137 @@
+"""
+Tests of the record store used by incremental runs of "processData.py".
+"""
+
+from __future__ import annotations
+
+import logging
+# Third-party packages
+import numpy as np
+import pandas as pd
+# Local packages
+import code1.recordStore as recordStore
+from code1.functions import MINUTES_PER_DAY, loadTable, parseTimes
+from code1.recordStore import (KEY_INDEX_FILE_NAME,
+                               appendToStore,
+                               findLabeledTail,
+                               hashKeys,
+                               labeledTablePath,
+                               linkLabeledTable,
+                               loadKeyIndex,
+                               loadLabeledManifest,
+                               loadLocalMinutes,
+                               loadStore,
+                               loadWatermarks,
+                               saveWatermarks,
+                               selectNewRecords,
+                               updateLabeledStore)
+
+LOGGER = logging.getLogger(__name__)
+SBP_RECORD_TYPE = "HKQuantityTypeIdentifierBloodPressureSystolic"
+DBP_RECORD_TYPE = "HKQuantityTypeIdentifierBloodPressureDiastolic"
+
+
+def recordTable(numRecords: int, seed: int) -> pd.DataFrame:
+    """
+    A table of parsed blood pressure records from two sources, created a few minutes after they were measured.
+    """
+    rng = np.random.default_rng(seed)
+    startDates = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 60 * 24 * 60, size=numRecords), unit="m")
+    creationDates = startDates + pd.to_timedelta(rng.integers(1, 10, size=numRecords), unit="m")
+    table = pd.DataFrame({"type": rng.choice([SBP_RECORD_TYPE, DBP_RECORD_TYPE], size=numRecords),
+                          "sourceName": rng.choice(["Beurer", "OMRON"], size=numRecords),
+                          "value": rng.integers(70, 160, size=numRecords).astype(str),
+                          "creationDate": [f"{date:%Y-%m-%d %H:%M:%S} -0400" for date in creationDates],
+                          "startDate": [f"{date:%Y-%m-%d %H:%M:%S} -0400" for date in startDates]})
+    table["endDate"] = table["startDate"]
+    result = parseTimes(table)
+    return result
+
+
+def test_appendToStore(tmp_path):
+    """
+    Records are stored once, however many times they are appended, and the watermarks, the key index, and the counts of readings at each minute of the day follow the stored records.
+    """
+    table = recordTable(numRecords=400, seed=0)
+    firstTable = table.iloc[:250]
+    # The second export repeats some records, and one record twice
+    secondTable = pd.concat([table.iloc[200:], table.iloc[[300]]], ignore_index=True)
+
+    watermarks = appendToStore(storeDir=tmp_path, tableName="Systolic BP", table=firstTable, watermarks={}, logger=LOGGER)
+    saveWatermarks(storeDir=tmp_path, watermarks=watermarks)
+    assert loadWatermarks(storeDir=tmp_path) == watermarks
+    newRecords = selectNewRecords(table=secondTable, watermarks=watermarks)
+    assert (newRecords["creationDate"] > firstTable["creationDate"].max()).all()
+    watermarks = appendToStore(storeDir=tmp_path, tableName="Systolic BP", table=secondTable, watermarks=watermarks, logger=LOGGER)
+
+    stored = loadStore(storeDir=tmp_path, tableName="Systolic BP")
+    assert len(stored) == len(table)
+    assert set(zip(stored["type"], stored["startDate"], stored["sourceName"])) == set(zip(table["type"], table["startDate"], table["sourceName"]))
+    for recordType, creationDates in table.groupby("type")["creationDate"]:
+        assert pd.Timestamp(watermarks[recordType]) == creationDates.max()
+    np.testing.assert_array_equal(np.sort(loadKeyIndex(storeDir=tmp_path, tableName="Systolic BP")), np.sort(hashKeys(table)))
+    np.testing.assert_array_equal(np.sort(loadLocalMinutes(storeDir=tmp_path, tableName="Systolic BP")), np.sort(table["startDateLocalMinute"].to_numpy()))
+
+    # Stores written before the key index existed are indexed from their parts
+    tmp_path.joinpath("Systolic BP", KEY_INDEX_FILE_NAME).unlink()
+    np.testing.assert_array_equal(np.sort(loadKeyIndex(storeDir=tmp_path, tableName="Systolic BP")), np.sort(hashKeys(table)))
+    appendToStore(storeDir=tmp_path, tableName="Systolic BP", table=table, watermarks=watermarks, logger=LOGGER)
+    assert len(loadStore(storeDir=tmp_path, tableName="Systolic BP")) == len(table)
+    assert np.bincount(loadLocalMinutes(storeDir=tmp_path, tableName="Systolic BP"), minlength=MINUTES_PER_DAY).sum() == len(table)
+
+
+def test_updateLabeledStore(tmp_path, monkeypatch):
+    """
+    Labeled parts only start after a gap longer than the pairing tolerance, load as one table in time order, and are replaced from the first part that new readings could pair with.
+    """
+    monkeypatch.setattr(recordStore, "LABELED_PART_ROWS", 50)
+    tolerance = pd.Timedelta(seconds=60)
+    table = recordTable(numRecords=600, seed=1)
+    tables = {"Systolic BP": table[table["type"] == SBP_RECORD_TYPE].reset_index(drop=True),
+              "Diastolic BP": table[table["type"] == DBP_RECORD_TYPE].reset_index(drop=True)}
+    tables["Paired BP"] = tables["Systolic BP"].iloc[::2].reset_index(drop=True)
+    manifest = updateLabeledStore(storeDir=tmp_path,
+                                  manifest=None,
+                                  firstPart=0,
+                                  tables=tables,
+                                  settingsHash="settings",
+                                  eventTables={"Near Workout": pd.DataFrame({"startDate": [], "endDate": []})},
+                                  pairingTolerance=tolerance,
+                                  metadata={"allGroups": []},
+                                  logger=LOGGER)
+    assert loadLabeledManifest(storeDir=tmp_path) == manifest
+    parts = manifest["parts"]
+    assert len(parts) > 2
+    assert sum(part["rows"] for part in parts) == len(tables["Systolic BP"]) + len(tables["Diastolic BP"])
+    for previousPart, part in zip(parts[:-1], parts[1:]):
+        assert part["firstStart"] - previousPart["lastStart"] > tolerance.value
+
+    for tableName, expected in tables.items():
+        loaded = loadTable(labeledTablePath(storeDir=tmp_path, tableName=tableName))
+        expected = expected.sort_values("startDate", kind="stable").reset_index(drop=True)
+        pd.testing.assert_series_equal(loaded["startDate"], expected["startDate"])
+        linkLabeledTable(storeDir=tmp_path, manifest=manifest, tableName=tableName, savepath=tmp_path.joinpath("output", f"{tableName}.parquet"))
+        pd.testing.assert_frame_equal(loadTable(tmp_path.joinpath("output", f"{tableName}.parquet")), loaded)
+
+    # New readings within the tolerance of the third part's readings
+    firstPart = findLabeledTail(manifest=manifest,
+                                firstNewStart=parts[2]["lastStart"] + tolerance.value // 2,
+                                firstChangedEvent=None,
+                                pairingTolerance=tolerance,
+                                proximityAfter=pd.Timedelta(minutes=30))
+    assert firstPart == 2
+    assert findLabeledTail(manifest=manifest, firstNewStart=None, firstChangedEvent=None, pairingTolerance=tolerance, proximityAfter=pd.Timedelta(minutes=30)) == len(parts)
+    tailTables = {tableName: tables[tableName][tables[tableName]["startDate"].astype("int64") >= parts[2]["firstStart"]] for tableName in tables.keys()}
+    newManifest = updateLabeledStore(storeDir=tmp_path,
+                                     manifest=manifest,
+                                     firstPart=firstPart,
+                                     tables=tailTables,
+                                     settingsHash="settings",
+                                     eventTables={"Near Workout": pd.DataFrame({"startDate": [], "endDate": []})},
+                                     pairingTolerance=tolerance,
+                                     metadata={"allGroups": []},
+                                     logger=LOGGER)
+    assert newManifest["parts"][:2] == parts[:2]
+    assert {part["name"] for part in newManifest["parts"][2:]}.isdisjoint(part["name"] for part in parts)
+    # The replaced parts are still linked from the earlier output
+    pd.testing.assert_frame_equal(loadTable(labeledTablePath(storeDir=tmp_path, tableName="Systolic BP")), loadTable(tmp_path.joinpath("output", "Systolic BP.parquet")))
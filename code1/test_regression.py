@@ -0,0 +1,78 @@
+"""
+Tests that compare the regressions fit from label patterns with least squares on every observation.
+"""
+
+from __future__ import annotations
+
+import logging
+# Third-party packages
+import numpy as np
+import pandas as pd
+# Local packages
+from code1.regression import fitOLSBatch
+
+LOGGER = logging.getLogger(__name__)
+
+
+def labeledTable(numObservations: int = 400, seed: int = 0) -> pd.DataFrame:
+    """
+    A table with overlapping medication labels and time groups that partition the observations, so that the time groups are collinear with the constant.
+    """
+    rng = np.random.default_rng(seed)
+    timeGroup = rng.integers(0, 3, size=numObservations)
+    table = pd.DataFrame({"A": rng.random(numObservations) < 0.5,
+                          "B": rng.random(numObservations) < 0.3,
+                          "Morning": timeGroup == 0,
+                          "Afternoon": timeGroup == 1,
+                          "Evening": timeGroup == 2})
+    table["value"] = np.round(rng.normal(120, 10, size=numObservations) + 5 * table["A"] - 3 * table["Evening"])
+    return table
+
+
+def test_fitOLSBatch():
+    """
+    Coefficients match the minimum-norm least squares solution, and the standard errors and R² of full-rank models match those computed from every observation.
+    """
+    table = labeledTable()
+    testGroups = {"Medications": ["A", "B"],
+                  "Time Groups": ["Morning", "Afternoon", "Evening"],
+                  "Medications and Time Groups": ["A", "B", "Morning", "Afternoon", "Evening"]}
+    results = fitOLSBatch(table=table, testGroups=testGroups, logger=LOGGER, valueColumn="value")
+
+    for testGroup, columnsToUse in testGroups.items():
+        result = results[results["testGroup"] == testGroup]
+        observations = table[table[columnsToUse].any(axis=1)]
+        design = np.column_stack([np.ones(len(observations)), observations[columnsToUse].to_numpy(dtype=float)])
+        values = observations["value"].to_numpy(dtype=float)
+        coefficients, _, rank, _ = np.linalg.lstsq(design, values, rcond=None)
+        residuals = values - design @ coefficients
+        rSquared = 1 - (residuals ** 2).sum() / ((values - values.mean()) ** 2).sum()
+
+        assert list(result["term"]) == ["const"] + columnsToUse
+        np.testing.assert_allclose(result["coefficient"], coefficients, rtol=1e-8, atol=1e-8)
+        np.testing.assert_allclose(result["rSquared"], rSquared, rtol=1e-8)
+        assert (result["nObs"] == len(observations)).all()
+        if rank == design.shape[1]:
+            sigma2 = (residuals ** 2).sum() / (len(values) - rank)
+            standardErrors = np.sqrt(np.diag(np.linalg.inv(design.T @ design)) * sigma2)
+            np.testing.assert_allclose(result["standardError"], standardErrors, rtol=1e-6)
+
+
+def test_fitOLSBatchSkipsUnfittableModels():
+    """
+    Test groups whose labels no observation has, or with no more observations than independent regressors, are left out of the results.
+    """
+    table = pd.DataFrame({"A": [True, False, False, False],
+                          "B": [False, True, True, True],
+                          "Morning": [False, True, False, False],
+                          "Afternoon": [False, False, True, False],
+                          "Evening": [True, False, False, True],
+                          "Never": False,
+                          "value": [120.0, 131.0, 118.0, 125.0]})
+    testGroups = {"Never": ["Never"],
+                  "Too few": ["A", "B", "Morning", "Afternoon", "Evening"],
+                  "Medications": ["A", "B"]}
+    results = fitOLSBatch(table=table, testGroups=testGroups, logger=LOGGER, valueColumn="value")
+
+    assert list(results["testGroup"].unique()) == ["Medications"]
+    assert results[["coefficient", "standardError"]].notna().all().all()
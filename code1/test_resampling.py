@@ -0,0 +1,93 @@
+"""
+Tests that compare the batched permutation tests and bootstrap confidence intervals with simple, one-resample-at-a-time reference implementations.
+"""
+
+from __future__ import annotations
+
+# Third-party packages
+import numpy as np
+import pytest
+# Local packages
+from code1.resampling import bootstrapConfidenceIntervals, permutationTest
+
+N_RESAMPLES = 20_000
+
+
+def groupValues(wholeNumbers: bool, seed: int = 0):
+    """
+    Two groups of readings that differ a little in mean and in spread. Readings in whole numbers have few distinct values, and are resampled as counts of each value.
+    """
+    rng = np.random.default_rng(seed)
+    values0 = rng.normal(121, 11, size=80)
+    values1 = rng.normal(119, 9, size=60)
+    if wholeNumbers:
+        values0, values1 = np.round(values0), np.round(values1)
+    return values0, values1
+
+
+def varianceDifference(values0: np.ndarray, values1: np.ndarray) -> float:
+    """
+    The difference in sample variance between two groups.
+    """
+    return np.var(values0, ddof=1) - np.var(values1, ddof=1)
+
+
+def monteCarloTolerance(pValue: float) -> float:
+    """
+    Four standard errors of the difference between two independent estimates of `pValue` from `N_RESAMPLES` resamples each.
+    """
+    return 4 * np.sqrt(2 * pValue * (1 - pValue) / N_RESAMPLES)
+
+
+@pytest.mark.parametrize("wholeNumbers", [True, False])
+def test_permutationTest(wholeNumbers):
+    """
+    The observed differences are exact, and the p-values agree with those of shuffling the pooled readings one permutation at a time, within Monte Carlo error. The same seed gives the same result.
+    """
+    values0, values1 = groupValues(wholeNumbers)
+    result = permutationTest(values0, values1, nResamples=N_RESAMPLES, rng=np.random.default_rng(1))
+    assert result == permutationTest(values0, values1, nResamples=N_RESAMPLES, rng=np.random.default_rng(1))
+
+    rng = np.random.default_rng(2)
+    pooled = np.concatenate([values0, values1])
+    observedMean = values0.mean() - values1.mean()
+    observedVariance = varianceDifference(values0, values1)
+    extremeMean = 0
+    extremeVariance = 0
+    for _ in range(N_RESAMPLES):
+        permuted = rng.permutation(pooled)
+        group0, group1 = permuted[:len(values0)], permuted[len(values0):]
+        extremeMean += abs(group0.mean() - group1.mean()) >= abs(observedMean) - 1e-9
+        extremeVariance += abs(varianceDifference(group0, group1)) >= abs(observedVariance) - 1e-9
+    meanPValue = (extremeMean + 1) / (N_RESAMPLES + 1)
+    variancePValue = (extremeVariance + 1) / (N_RESAMPLES + 1)
+
+    assert result["meanDifference"] == pytest.approx(observedMean)
+    assert result["varianceDifference"] == pytest.approx(observedVariance)
+    assert 0.01 < meanPValue < 0.99 and 0.01 < variancePValue < 0.99
+    assert abs(result["meanDifferencePValue"] - meanPValue) < monteCarloTolerance(meanPValue)
+    assert abs(result["varianceDifferencePValue"] - variancePValue) < monteCarloTolerance(variancePValue)
+
+
+@pytest.mark.parametrize("wholeNumbers", [True, False])
+def test_bootstrapConfidenceIntervals(wholeNumbers):
+    """
+    The interval bounds agree with the percentiles of resampling each group with replacement one resample at a time, within a small fraction of the interval's width. The same seed gives the same result.
+    """
+    values0, values1 = groupValues(wholeNumbers)
+    result = bootstrapConfidenceIntervals(values0, values1, nResamples=N_RESAMPLES, rng=np.random.default_rng(1))
+    assert result == bootstrapConfidenceIntervals(values0, values1, nResamples=N_RESAMPLES, rng=np.random.default_rng(1))
+
+    rng = np.random.default_rng(2)
+    meanDifferences = np.empty(N_RESAMPLES)
+    varianceDifferences = np.empty(N_RESAMPLES)
+    for it in range(N_RESAMPLES):
+        resample0 = rng.choice(values0, size=len(values0), replace=True)
+        resample1 = rng.choice(values1, size=len(values1), replace=True)
+        meanDifferences[it] = resample0.mean() - resample1.mean()
+        varianceDifferences[it] = varianceDifference(resample0, resample1)
+
+    for statistic, differences in [("meanDifference", meanDifferences), ("varianceDifference", varianceDifferences)]:
+        lower, upper = np.quantile(differences, [0.025, 0.975])
+        assert result[f"{statistic}Lower"] == pytest.approx(lower, abs=0.05 * (upper - lower))
+        assert result[f"{statistic}Upper"] == pytest.approx(upper, abs=0.05 * (upper - lower))
@@ -0,0 +1,79 @@
+"""
+Tests of the cache hits, misses, and evictions of the stage cache.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+# Third-party packages
+import pytest
+# Local packages
+from code1.stageCache import PARTIAL_MAX_AGE_SECONDS, evictCache, latestCacheEntry, readCacheEntry, runCached, writeCacheEntry
+
+LOGGER = logging.getLogger(__name__)
+
+
+def writeOutput(numBytes: int, calls: list):
+    """
+    Returns a stage that writes a file of `numBytes` bytes to its output directory, and records each call in `calls`.
+    """
+    def run(outputDir):
+        calls.append(outputDir)
+        outputDir.joinpath("output.bin").write_bytes(b"\0" * numBytes)
+    return run
+
+
+def test_runCached(tmp_path):
+    """
+    A stage runs once per distinct input and parameters, later runs reuse its output, and a failed run leaves no entry behind.
+    """
+    calls = []
+    first = runCached(stageName="stage", inputHashes=["a"], parameters={"n": 1}, cacheDir=tmp_path, run=writeOutput(10, calls), logger=LOGGER)
+    assert len(calls) == 1 and first.joinpath("output.bin").exists()
+    assert runCached(stageName="stage", inputHashes=["a"], parameters={"n": 1}, cacheDir=tmp_path, run=writeOutput(10, calls), logger=LOGGER) == first
+    assert len(calls) == 1
+    second = runCached(stageName="stage", inputHashes=["a"], parameters={"n": 2}, cacheDir=tmp_path, run=writeOutput(10, calls), logger=LOGGER)
+    third = runCached(stageName="stage", inputHashes=["b"], parameters={"n": 1}, cacheDir=tmp_path, run=writeOutput(10, calls), logger=LOGGER)
+    assert len(calls) == 3 and len({first, second, third}) == 3
+    assert readCacheEntry(first)["sizeBytes"] == 10
+
+    # Reusing an entry makes it the latest
+    assert latestCacheEntry(cacheDir=tmp_path, stageName="stage") == third
+    runCached(stageName="stage", inputHashes=["a"], parameters={"n": 1}, cacheDir=tmp_path, run=writeOutput(10, calls), logger=LOGGER)
+    assert latestCacheEntry(cacheDir=tmp_path, stageName="stage") == first
+
+    def fail(outputDir):
+        outputDir.joinpath("output.bin").write_bytes(b"\0")
+        raise RuntimeError("The stage failed.")
+
+    with pytest.raises(RuntimeError):
+        runCached(stageName="stage", inputHashes=["c"], parameters={}, cacheDir=tmp_path, run=fail, logger=LOGGER)
+    assert sorted(tmp_path.joinpath("stage").iterdir()) == sorted([first, second, third])
+
+
+def test_evictCache(tmp_path):
+    """
+    Entries unused for too long are evicted, then the least recently used entries until the cache fits, except those that are kept. Partial entries of failed runs are evicted once they are old.
+    """
+    calls = []
+    entryDirs = [runCached(stageName="stage", inputHashes=[str(it)], parameters={}, cacheDir=tmp_path, run=writeOutput(100, calls), logger=LOGGER) for it in range(4)]
+    now = time.time()
+    # The first entry was last used long ago, and the others from least to most recently used
+    for entryDir, daysAgo in zip(entryDirs, [100, 3, 2, 1]):
+        entry = readCacheEntry(entryDir)
+        entry["lastUsedAt"] = now - daysAgo * 24 * 60 * 60
+        writeCacheEntry(entryDir, entry)
+    stalePartialDir = tmp_path.joinpath("stage", "key.partial-1")
+    stalePartialDir.mkdir()
+    os.utime(stalePartialDir, (now - 2 * PARTIAL_MAX_AGE_SECONDS, now - 2 * PARTIAL_MAX_AGE_SECONDS))
+    recentPartialDir = tmp_path.joinpath("stage", "key.partial-2")
+    recentPartialDir.mkdir()
+
+    removed = evictCache(cacheDir=tmp_path, maxBytes=None, maxAgeDays=30, logger=LOGGER)
+    assert sorted(removed) == sorted([stalePartialDir, entryDirs[0]])
+    assert recentPartialDir.exists()
+    removed = evictCache(cacheDir=tmp_path, maxBytes=250, maxAgeDays=None, logger=LOGGER, keep=[entryDirs[1]])
+    assert removed == [entryDirs[2]]
+    assert all(entryDir.exists() for entryDir in [entryDirs[1], entryDirs[3]])
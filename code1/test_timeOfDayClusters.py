@@ -0,0 +1,56 @@
+"""
+Tests of the discovery of time-of-day windows from the local minutes of readings.
+"""
+
+from __future__ import annotations
+
+# Third-party packages
+import numpy as np
+# Local packages
+from code1.functions import MINUTES_PER_DAY, timeOfDayLookupTable, timeToMinuteOfDay
+from code1.timeOfDayClusters import discoverTimeWindows
+
+
+def clusteredMinutes(seed: int = 0) -> tuple:
+    """
+    Readings around 07:00, 19:00, and 23:50, the last wrapping past midnight. Returns the minutes of the day and the cluster of each reading.
+    """
+    rng = np.random.default_rng(seed)
+    centers = np.array([7 * 60, 19 * 60, 23 * 60 + 50])
+    clusters = rng.choice(3, size=900, p=[0.4, 0.35, 0.25])
+    localMinutes = np.round(rng.normal(centers[clusters], 30)).astype(np.int64) % MINUTES_PER_DAY
+    return localMinutes, clusters
+
+
+def test_discoverTimeWindows():
+    """
+    Each cluster of readings gets its own window, the windows cover every minute of the day exactly once, and the window of the late cluster wraps past midnight.
+    """
+    localMinutes, clusters = clusteredMinutes()
+    windows = discoverTimeWindows(localMinutes=localMinutes)
+
+    assert len(windows) == 3
+    lookupTable = timeOfDayLookupTable(timeWindows=windows)
+    assert (lookupTable.sum(axis=1) == 1).all()
+    windowOfReading = lookupTable[localMinutes].argmax(axis=1)
+    for cluster in range(3):
+        assert (windowOfReading[clusters == cluster] == np.bincount(windowOfReading[clusters == cluster]).argmax()).mean() > 0.97
+    assert any(timeToMinuteOfDay(window["start"]) > timeToMinuteOfDay(window["stop"]) for window in windows.values())
+
+    # The windows only depend on the number of readings at each minute, which incremental runs keep instead of the readings
+    counts = np.bincount(localMinutes, minlength=MINUTES_PER_DAY)
+    assert discoverTimeWindows(localMinutes=np.repeat(np.arange(MINUTES_PER_DAY), counts)) == windows
+
+
+def test_discoverTimeWindowsLimits():
+    """
+    No more than `maxWindows` windows are returned, and readings without clusters, or no readings, give a single window for the whole day.
+    """
+    localMinutes, _ = clusteredMinutes()
+    allDay = {"Group 1 (All day)": {"start": "00:00:00", "stop": "00:00:00"}}
+
+    assert len(discoverTimeWindows(localMinutes=localMinutes, maxWindows=2)) == 2
+    assert discoverTimeWindows(localMinutes=np.arange(MINUTES_PER_DAY)) == allDay
+    assert discoverTimeWindows(localMinutes=np.zeros(0, dtype=np.int64)) == allDay
+    # Missing minutes are ignored
+    assert discoverTimeWindows(localMinutes=np.concatenate([localMinutes, [-1, -1]])) == discoverTimeWindows(localMinutes=localMinutes)
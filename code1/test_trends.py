@@ -0,0 +1,76 @@
+"""
+Tests that trends updated with new readings match trends computed from scratch.
+"""
+
+from __future__ import annotations
+
+import logging
+# Third-party packages
+import numpy as np
+import pandas as pd
+# Local packages
+from code1.trends import ewmaFromState, updateTrends
+
+LOGGER = logging.getLogger(__name__)
+
+
+def readingTimes(numReadings: int, seed: int) -> np.ndarray:
+    """
+    Sorted reading times, in UTC nanoseconds, a few hours apart, with a gap of years, i.e., of more half-lives than fit in one block of EWMA weights.
+    """
+    rng = np.random.default_rng(seed)
+    gaps = pd.to_timedelta(rng.integers(1, 12 * 60, size=numReadings), unit="m").to_numpy().astype(np.int64)
+    gaps[numReadings // 2] = pd.Timedelta(days=5 * 365).value
+    result = pd.Timestamp("2020-01-01", tz="UTC").value + np.cumsum(gaps)
+    return result
+
+
+def test_ewmaFromState():
+    """
+    The EWMA matches pandas', and computing it in steps, each continuing from the state of the previous one, gives the same result as computing it at once.
+    """
+    nanoseconds = readingTimes(numReadings=400, seed=0)
+    values = np.random.default_rng(1).normal(125, 12, size=len(nanoseconds))
+    halflife = pd.Timedelta(days=3)
+    ewma, state = ewmaFromState(nanoseconds=nanoseconds, values=values, halflifeNanoseconds=halflife.value)
+
+    expected = pd.Series(values).ewm(halflife=halflife, times=pd.to_datetime(nanoseconds, utc=True)).mean()
+    np.testing.assert_allclose(ewma, expected, rtol=1e-10)
+    steps = []
+    stepState = None
+    for indices in np.array_split(np.arange(len(values)), [1, 150, 201, 202]):
+        stepEwma, stepState = ewmaFromState(nanoseconds=nanoseconds[indices], values=values[indices], halflifeNanoseconds=halflife.value, state=stepState)
+        steps.append(stepEwma)
+    np.testing.assert_allclose(np.concatenate(steps), ewma, rtol=1e-10)
+    assert stepState["lastNanoseconds"] == state["lastNanoseconds"]
+    np.testing.assert_allclose([stepState["weightedSum"], stepState["weight"]], [state["weightedSum"], state["weight"]], rtol=1e-10)
+
+
+def test_updateTrends(tmp_path):
+    """
+    Trends updated with new readings, or after readings are relabeled, match the trends computed from scratch.
+    """
+    nanoseconds = readingTimes(numReadings=300, seed=2)
+    rng = np.random.default_rng(3)
+    table = pd.DataFrame({"startDate": pd.to_datetime(nanoseconds, utc=True),
+                          "value": np.round(rng.normal(125, 12, size=len(nanoseconds))),
+                          "A": rng.random(len(nanoseconds)) < 0.5})
+
+    def trendsFromScratch(table, name):
+        return updateTrends(tablesToProcess={"Systolic BP": table}, labelColumns=["A"], trendDir=tmp_path.joinpath(name), logger=LOGGER)["Systolic BP"]
+
+    def assertSameTrends(result, expected):
+        result = result.sort_values(["group", "startDate"], kind="stable").reset_index(drop=True)
+        expected = expected.sort_values(["group", "startDate"], kind="stable").reset_index(drop=True)
+        pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-10)
+
+    trendDir = tmp_path.joinpath("updated")
+    for numReadings in [100, 101, 250, 300]:
+        # Readings arrive out of order within each export
+        newTable = table.iloc[:numReadings].sample(frac=1, random_state=numReadings)
+        result = updateTrends(tablesToProcess={"Systolic BP": newTable}, labelColumns=["A"], trendDir=trendDir, logger=LOGGER)["Systolic BP"]
+    assertSameTrends(result, trendsFromScratch(table, "scratch"))
+
+    relabeledTable = table.assign(A=~table["A"])
+    result = updateTrends(tablesToProcess={"Systolic BP": relabeledTable}, labelColumns=["A"], trendDir=trendDir, logger=LOGGER)["Systolic BP"]
+    assertSameTrends(result, trendsFromScratch(relabeledTable, "relabeled"))
@@ -0,0 +1,138 @@
+"""
+Discovers the time-of-day windows in which a user takes their measurements, from the valleys of the density of their readings over the (circular) day.
+
+The windows are returned in the format of `GROUP_TIMES` in "processData.py", so they can be passed to `labelByTimeOfDay` in place of hard-coded windows.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List
+# Third-party packages
+import numpy as np
+# Local packages
+from code1.functions import MINUTES_PER_DAY
+
+# Parts of the day used to name the windows, by the hour at which they start
+PARTS_OF_THE_DAY = {0: "Night",
+                    5: "Morning",
+                    12: "Afternoon",
+                    17: "Evening",
+                    22: "Night"}
+
+
+def circularDensity(localMinutes: np.ndarray, bandwidth: float) -> np.ndarray:
+    """
+    Estimates the density of readings at each minute of the day with a Gaussian kernel of `bandwidth` minutes, wrapped around midnight.
+    """
+    localMinutes = np.asarray(localMinutes)
+    counts = np.bincount(localMinutes[localMinutes >= 0], minlength=MINUTES_PER_DAY).astype(float)
+    distances = np.minimum(np.arange(MINUTES_PER_DAY), MINUTES_PER_DAY - np.arange(MINUTES_PER_DAY))
+    kernel = np.exp(-0.5 * (distances / bandwidth) ** 2)
+    kernel /= kernel.sum()
+    # Circular convolution
+    result = np.fft.irfft(np.fft.rfft(counts) * np.fft.rfft(kernel), n=MINUTES_PER_DAY)
+    result = np.maximum(result, 0) / max(counts.sum(), 1)
+    return result
+
+
+def densityPeaksAndValleys(density: np.ndarray, minimumPeakShare: float) -> List[tuple]:
+    """
+    Finds the peaks of a circular density and, between each pair of consecutive peaks, the valley that separates them.
+    Peaks lower than `minimumPeakShare` of the highest peak are ignored.
+    Returns a list of (peak, valley after the peak) minutes, ordered around the day.
+    """
+    previous = np.roll(density, 1)
+    following = np.roll(density, -1)
+    peaks = np.flatnonzero((density > previous) & (density >= following) & (density >= minimumPeakShare * density.max()))
+    if len(peaks) < 2:
+        return [(int(peak), None) for peak in peaks]
+    result = []
+    for it, peak in enumerate(peaks):
+        nextPeak = peaks[(it + 1) % len(peaks)]
+        arc = np.arange(peak, peak + (nextPeak - peak) % MINUTES_PER_DAY) % MINUTES_PER_DAY
+        arcDensity = density[arc]
+        # The middle of the lowest stretch, so that flat, empty stretches are split evenly
+        lowest = np.flatnonzero(arcDensity <= arcDensity.min() * (1 + 1e-9))
+        valley = arc[lowest[len(lowest) // 2]]
+        result.append((int(peak), int(valley)))
+    return result
+
+
+def mergeShallowValleys(density: np.ndarray,
+                        peaksAndValleys: List[tuple],
+                        maxWindows: int,
+                        maxValleyRatio: float) -> List[tuple]:
+    """
+    Removes valleys, merging the two peaks on either side of each into the higher one, until at most `maxWindows` remain and every valley is deeper than `maxValleyRatio` times the lower of its two peaks.
+    The shallowest valley is removed first.
+    """
+    peaksAndValleys = list(peaksAndValleys)
+    while len(peaksAndValleys) > 1:
+        peaks = np.array([peak for peak, _ in peaksAndValleys])
+        valleys = np.array([valley for _, valley in peaksAndValleys])
+        ratios = density[valleys] / np.minimum(density[peaks], density[np.roll(peaks, -1)])
+        shallowest = int(np.argmax(ratios))
+        if len(peaksAndValleys) <= maxWindows and ratios[shallowest] <= maxValleyRatio:
+            break
+        following = (shallowest + 1) % len(peaksAndValleys)
+        peak, _ = peaksAndValleys[shallowest]
+        nextPeak, nextValley = peaksAndValleys[following]
+        merged = (peak if density[peak] >= density[nextPeak] else nextPeak, nextValley)
+        peaksAndValleys[shallowest] = merged
+        del peaksAndValleys[following]
+    return peaksAndValleys
+
+
+def minuteToTime(minute: int) -> str:
+    """
+    Formats a minute of the day as "HH:MM:00".
+    """
+    result = f"{minute // 60:02d}:{minute % 60:02d}:00"
+    return result
+
+
+def partOfTheDay(minute: int) -> str:
+    """
+    Names the part of the day of a minute of the day, e.g., "Morning".
+    """
+    hours = np.array(list(PARTS_OF_THE_DAY.keys()))
+    names = list(PARTS_OF_THE_DAY.values())
+    result = names[np.searchsorted(hours, minute // 60, side="right") - 1]
+    return result
+
+
+def discoverTimeWindows(localMinutes: np.ndarray,
+                        maxWindows: int = 4,
+                        bandwidth: float = 45,
+                        maxValleyRatio: float = 0.5,
+                        minimumPeakShare: float = 0.05) -> Dict[str, Dict[str, str]]:
+    """
+    Finds the time-of-day windows of a user's readings, given the local minute of the day of each reading, e.g., the "startDateLocalMinute" column added by `parseTimes`.
+    The number of windows is chosen automatically: every valley between two windows must be lower than `maxValleyRatio` times the lower of the two peaks around it, and there are at most `maxWindows` windows.
+    Returns windows in the format of `GROUP_TIMES`, e.g., {"Group 1 (Morning)": {"start": "04:30:00", "stop": "13:15:00"}, ...}, that cover the whole day, ordered by the time of their peak.
+    """
+    density = circularDensity(localMinutes=localMinutes, bandwidth=bandwidth)
+    if density.max() > 0:
+        peaksAndValleys = densityPeaksAndValleys(density=density, minimumPeakShare=minimumPeakShare)
+        peaksAndValleys = mergeShallowValleys(density=density,
+                                              peaksAndValleys=peaksAndValleys,
+                                              maxWindows=maxWindows,
+                                              maxValleyRatio=maxValleyRatio)
+    else:
+        peaksAndValleys = []
+    if len(peaksAndValleys) <= 1:
+        return {"Group 1 (All day)": {"start": "00:00:00", "stop": "00:00:00"}}
+
+    # Each window runs from the valley before its peak to the valley after it
+    windows = []
+    for it, (peak, valley) in enumerate(peaksAndValleys):
+        _, previousValley = peaksAndValleys[it - 1]
+        windows.append((peak, previousValley, valley))
+    windows.sort()
+    names = [partOfTheDay(peak) for peak, _, _ in windows]
+    result = {}
+    for it, (peak, start, stop) in enumerate(windows):
+        name = names[it] if names.count(names[it]) == 1 else f"{names[it]} {minuteToTime(peak)[:5]}"
+        result[f"Group {it + 1} ({name})"] = {"start": minuteToTime(start),
+                                              "stop": minuteToTime(stop)}
+    return result
@@ -0,0 +1,224 @@
+"""
+Blood pressure trends over time: rolling means and medians over time-based windows, and an exponentially weighted moving average (EWMA), for each table and label group.
+
+Trends are saved with the state needed to continue them, so when new readings are appended only the new readings' windows are computed, instead of the whole series.
+The state holds a hash of the readings it was computed from and of the label definitions, so trends of a rewritten or relabeled history are computed again from scratch.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Union
+# Third-party packages
+import numpy as np
+import pandas as pd
+# Local packages
+from code1.functions import datetimesToNanoseconds, loadTable, saveTable
+
+TREND_WINDOWS = ["1D", "7D"]
+EWMA_HALFLIFE = "3D"
+TREND_STATE_FILE_NAME = "trendState.JSON"
+ALL_READINGS_GROUP = "All"
+
+# The EWMA weights are computed relative to the start of blocks of at most this many half-lives, so that they don't overflow
+MAX_HALVINGS_PER_BLOCK = 500
+
+
+def ewmaFromState(nanoseconds: np.ndarray,
+                  values: np.ndarray,
+                  halflifeNanoseconds: int,
+                  state: Union[dict, None] = None):
+    """
+    Computes the time-weighted EWMA of sorted readings, where the weight of a reading halves every `halflifeNanoseconds`, continuing from `state`.
+    Without a state, the result is the same as `pd.Series.ewm(halflife=..., times=...).mean()`.
+    Returns the EWMA at each reading, and the state after the last reading.
+    """
+    state = state or {}
+    weightedSum = state.get("weightedSum", 0.0)
+    weight = state.get("weight", 0.0)
+    if len(values) == 0:
+        return np.zeros(0), dict(state)
+    reference = state.get("lastNanoseconds", int(nanoseconds[0]))
+    halvings = (nanoseconds - reference) / halflifeNanoseconds
+    blocks = np.floor(halvings / MAX_HALVINGS_PER_BLOCK)
+    result = np.empty(len(values))
+    position = 0.0  # Half-lives since `reference` at which `weightedSum` and `weight` are valued
+    for block in np.unique(blocks):
+        inBlock = blocks == block
+        blockStart = block * MAX_HALVINGS_PER_BLOCK
+        decay = 2.0 ** -(blockStart - position)
+        weights = 2.0 ** (halvings[inBlock] - blockStart)
+        cumulativeSum = weightedSum * decay + np.cumsum(weights * values[inBlock])
+        cumulativeWeight = weight * decay + np.cumsum(weights)
+        result[inBlock] = cumulativeSum / cumulativeWeight
+        lastOffset = halvings[inBlock][-1] - blockStart
+        weightedSum = cumulativeSum[-1] * 2.0 ** -lastOffset
+        weight = cumulativeWeight[-1] * 2.0 ** -lastOffset
+        position = blockStart + lastOffset
+    newState = {"weightedSum": float(weightedSum),
+                "weight": float(weight),
+                "lastNanoseconds": int(nanoseconds[-1])}
+    return result, newState
+
+
+def rollingStatistics(nanoseconds: np.ndarray,
+                      values: np.ndarray,
+                      windows: List[str]) -> pd.DataFrame:
+    """
+    Computes the mean and median of the readings in the trailing time-based window of each reading, e.g., "1D" or "7D", for each window in `windows`.
+    """
+    series = pd.Series(values, index=pd.DatetimeIndex(pd.to_datetime(nanoseconds, utc=True)))
+    result = {}
+    for window in windows:
+        rolling = series.rolling(window)
+        result[f"rolling{window}Mean"] = rolling.mean().to_numpy()
+        result[f"rolling{window}Median"] = rolling.median().to_numpy()
+    result = pd.DataFrame(result)
+    return result
+
+
+def groupTrend(nanoseconds: np.ndarray,
+               values: np.ndarray,
+               windows: List[str],
+               halflifeNanoseconds: int,
+               contextNanoseconds: np.ndarray,
+               contextValues: np.ndarray,
+               state: Union[dict, None]):
+    """
+    Computes the trend rows of new, sorted readings, given the earlier readings that fall in their windows (`contextNanoseconds` and `contextValues`) and the EWMA state after the earlier readings.
+    Returns the trend rows of the new readings and the updated EWMA state.
+    """
+    rolling = rollingStatistics(nanoseconds=np.concatenate([contextNanoseconds, nanoseconds]),
+                                values=np.concatenate([contextValues, values]),
+                                windows=windows)
+    rolling = rolling.iloc[len(contextNanoseconds):].reset_index(drop=True)
+    ewma, newState = ewmaFromState(nanoseconds=nanoseconds,
+                                   values=values,
+                                   halflifeNanoseconds=halflifeNanoseconds,
+                                   state=state)
+    result = pd.DataFrame({"startDate": pd.to_datetime(nanoseconds, utc=True),
+                           "value": values})
+    result = pd.concat([result, rolling], axis=1)
+    result["ewma"] = ewma
+    newState["count"] = (state or {}).get("count", 0) + len(values)
+    return result, newState
+
+
+def historyHash(group: str, nanoseconds: np.ndarray, values: np.ndarray) -> str:
+    """
+    Returns a hash of a group's sorted readings, i.e., of the key (startDate, label) and value of every reading up to and including the last one.
+    """
+    hasher = hashlib.sha256(group.encode())
+    hasher.update(np.ascontiguousarray(nanoseconds, dtype=np.int64).tobytes())
+    hasher.update(np.ascontiguousarray(values, dtype=float).tobytes())
+    result = hasher.hexdigest()
+    return result
+
+
+def loadTrendState(trendDir: Union[str, Path]) -> dict:
+    """
+    Loads the state of the saved trends, or an empty state if there are none.
+    """
+    statePath = Path(trendDir).joinpath(TREND_STATE_FILE_NAME)
+    if statePath.exists():
+        with open(statePath, "r") as file:
+            result = json.loads(file.read())
+    else:
+        result = {}
+    return result
+
+
+def updateTrends(tablesToProcess: Dict[str, pd.DataFrame],
+                 labelColumns: List[str],
+                 trendDir: Union[str, Path],
+                 logger: logging.Logger,
+                 windows: List[str] = TREND_WINDOWS,
+                 halflife: str = EWMA_HALFLIFE,
+                 valueColumn: str = "value",
+                 labelDefinitions: Union[dict, None] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Updates the saved trends of each table, for all its readings and for the readings of each label in `labelColumns`.
+    If a group's readings only add readings after its last saved one, only the new readings are computed; otherwise, e.g., after late, changed, or relabeled readings, or a change of `windows`, `halflife`, `labelColumns`, or `labelDefinitions`, the group is computed again from scratch.
+    `labelDefinitions` describes how the labels were assigned, e.g., the time windows of the time groups, and must be JSON-serializable.
+    Returns the trends of each table, with one row per group and reading, and the reading's value in a "value" column.
+    """
+    trendDir = Path(trendDir)
+    trendDir.mkdir(parents=True, exist_ok=True)
+    labelDefinitionsHash = hashlib.sha256(json.dumps({"labelColumns": list(labelColumns), "labelDefinitions": labelDefinitions}, sort_keys=True).encode()).hexdigest()
+    settings = {"windows": list(windows), "halflife": halflife, "labelDefinitionsHash": labelDefinitionsHash}
+    state = loadTrendState(trendDir)
+    if state.get("settings") != settings:
+        state = {"settings": settings, "tables": {}}
+    halflifeNanoseconds = pd.Timedelta(halflife).value
+    longestWindowNanoseconds = max(pd.Timedelta(window).value for window in windows)
+
+    trendTables = {}
+    for tableName, table in tablesToProcess.items():
+        trendPath = trendDir.joinpath(f"{tableName}.parquet")
+        tableState = state["tables"].get(tableName, {})
+        if tableState and trendPath.exists():
+            savedTrends = loadTable(trendPath)
+        else:
+            savedTrends = pd.DataFrame(columns=["group", "startDate"])
+        savedNanoseconds = datetimesToNanoseconds(savedTrends["startDate"])
+        nanoseconds = datetimesToNanoseconds(table["startDate"])
+        values = table[valueColumn].to_numpy(dtype=float)
+        groups = {ALL_READINGS_GROUP: np.ones(len(table), dtype=bool)}
+        groups.update({labelColumn: table[labelColumn].to_numpy(dtype=bool) for labelColumn in labelColumns})
+
+        groupTrends = []
+        newTableState = {}
+        for group, inGroup in groups.items():
+            order = np.argsort(nanoseconds[inGroup], kind="stable")
+            groupNanoseconds = nanoseconds[inGroup][order]
+            groupValues = values[inGroup][order]
+            groupState = tableState.get(group)
+            isSaved = (savedTrends["group"] == group).to_numpy()
+            savedGroup = savedTrends[isSaved]
+            isAppendOnly = (groupState is not None
+                            and "lastNanoseconds" in groupState
+                            and np.count_nonzero(groupNanoseconds <= groupState["lastNanoseconds"]) == groupState["count"] == len(savedGroup))
+            if isAppendOnly:
+                # The readings already in the trends must be the ones the state was computed from
+                numSaved = groupState["count"]
+                isAppendOnly = groupState.get("historyHash") == historyHash(group, groupNanoseconds[:numSaved], groupValues[:numSaved])
+            if isAppendOnly:
+                isNew = groupNanoseconds > groupState["lastNanoseconds"]
+                inContext = np.zeros(len(savedGroup), dtype=bool)
+                if isNew.any():
+                    inContext = savedNanoseconds[isSaved] > groupNanoseconds[isNew][0] - longestWindowNanoseconds
+                newTrend, newTableState[group] = groupTrend(nanoseconds=groupNanoseconds[isNew],
+                                                            values=groupValues[isNew],
+                                                            windows=windows,
+                                                            halflifeNanoseconds=halflifeNanoseconds,
+                                                            contextNanoseconds=savedNanoseconds[isSaved][inContext],
+                                                            contextValues=savedGroup["value"].to_numpy(dtype=float)[inContext],
+                                                            state=groupState)
+                newTrend.insert(0, "group", group)
+                groupTrends.extend([savedGroup, newTrend])
+                logger.info(f"""  Table "{tableName}", group "{group}": computed {isNew.sum():,} new readings.""")
+            else:
+                newTrend, newTableState[group] = groupTrend(nanoseconds=groupNanoseconds,
+                                                            values=groupValues,
+                                                            windows=windows,
+                                                            halflifeNanoseconds=halflifeNanoseconds,
+                                                            contextNanoseconds=np.zeros(0, dtype=np.int64),
+                                                            contextValues=np.zeros(0),
+                                                            state=None)
+                newTrend.insert(0, "group", group)
+                groupTrends.append(newTrend)
+                logger.info(f"""  Table "{tableName}", group "{group}": computed all {len(groupValues):,} readings.""")
+            if len(groupValues) > 0:
+                newTableState[group]["historyHash"] = historyHash(group, groupNanoseconds, groupValues)
+        trendTable = pd.concat([groupTrend for groupTrend in groupTrends if len(groupTrend) > 0] or groupTrends, ignore_index=True)
+        saveTable(table=trendTable, savepath=trendPath)
+        state["tables"][tableName] = newTableState
+        trendTables[tableName] = trendTable
+
+    statePath = trendDir.joinpath(TREND_STATE_FILE_NAME)
+    with open(statePath, "w") as file:
+        file.write(json.dumps(state, indent=4))
+    return trendTables